@@ -0,0 +1,62 @@
+"""facet count tables
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "002"
+down_revision = "001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "activity_organization_counts",
+        sa.Column("activity_id", sa.Integer(), nullable=False),
+        sa.Column("organization_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["activity_id"], ["activities.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("activity_id"),
+    )
+    op.create_table(
+        "building_organization_counts",
+        sa.Column("building_id", sa.Integer(), nullable=False),
+        sa.Column("organization_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["building_id"], ["buildings.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("building_id"),
+    )
+
+    # Populate from existing data
+    op.execute(
+        """
+        INSERT INTO activity_organization_counts (activity_id, organization_count)
+        WITH RECURSIVE subtree(root_id, id) AS (
+            SELECT id, id FROM activities
+            UNION ALL
+            SELECT subtree.root_id, activities.id
+            FROM activities JOIN subtree ON activities.parent_id = subtree.id
+        )
+        SELECT subtree.root_id, COUNT(DISTINCT organization_activity.organization_id)
+        FROM subtree
+        JOIN organization_activity ON organization_activity.activity_id = subtree.id
+        GROUP BY subtree.root_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO building_organization_counts (building_id, organization_count)
+        SELECT building_id, COUNT(id) FROM organizations GROUP BY building_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("building_organization_counts")
+    op.drop_table("activity_organization_counts")
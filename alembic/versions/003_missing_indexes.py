@@ -0,0 +1,82 @@
+"""indexes for join and foreign key columns
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "003"
+down_revision = "002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The primary key needs non-null, unique links
+    op.execute(
+        "DELETE FROM organization_activity "
+        "WHERE organization_id IS NULL OR activity_id IS NULL"
+    )
+    row_id = "ctid" if op.get_bind().dialect.name == "postgresql" else "rowid"
+    op.execute(
+        f"""
+        DELETE FROM organization_activity
+        WHERE {row_id} NOT IN (
+            SELECT MIN({row_id}) FROM organization_activity
+            GROUP BY organization_id, activity_id
+        )
+        """
+    )
+
+    with op.batch_alter_table("organization_activity") as batch_op:
+        batch_op.alter_column(
+            "organization_id", existing_type=sa.Integer(), nullable=False
+        )
+        batch_op.alter_column("activity_id", existing_type=sa.Integer(), nullable=False)
+        batch_op.create_primary_key(
+            "pk_organization_activity", ["organization_id", "activity_id"]
+        )
+    op.create_index(
+        op.f("ix_organization_activity_activity_id"),
+        "organization_activity",
+        ["activity_id"],
+        unique=False,
+    )
+
+    op.create_index(
+        op.f("ix_organizations_building_id"),
+        "organizations",
+        ["building_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_phone_numbers_organization_id"),
+        "phone_numbers",
+        ["organization_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_activities_parent_id"), "activities", ["parent_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_activities_parent_id"), table_name="activities")
+    op.drop_index(op.f("ix_phone_numbers_organization_id"), table_name="phone_numbers")
+    op.drop_index(op.f("ix_organizations_building_id"), table_name="organizations")
+    op.drop_index(
+        op.f("ix_organization_activity_activity_id"),
+        table_name="organization_activity",
+    )
+    with op.batch_alter_table("organization_activity") as batch_op:
+        batch_op.drop_constraint("pk_organization_activity", type_="primary")
+        batch_op.alter_column(
+            "organization_id", existing_type=sa.Integer(), nullable=True
+        )
+        batch_op.alter_column("activity_id", existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,53 @@
+"""row versions and tombstones for the change feed
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "005"
+down_revision = "004"
+branch_labels = None
+depends_on = None
+
+TABLES = ("buildings", "activities", "organizations")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column(
+                "row_version", sa.BigInteger(), nullable=False, server_default="0"
+            ),
+        )
+        # Existing rows belong to the current version, so ?since=0 returns them
+        op.execute(
+            f"UPDATE {table} SET row_version = COALESCE("
+            "(SELECT version FROM directory_version WHERE id = 1), 0)"
+        )
+        op.create_index(f"ix_{table}_row_version", table, ["row_version"])
+
+    op.create_table(
+        "tombstones",
+        sa.Column("entity", sa.String(), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("entity", "entity_id"),
+    )
+    op.create_index("ix_tombstones_version", "tombstones", ["version"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tombstones_version", table_name="tombstones")
+    op.drop_table("tombstones")
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_row_version", table_name=table)
+        # SQLite can only drop columns by rebuilding the table
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column("row_version")
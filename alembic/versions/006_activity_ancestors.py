@@ -0,0 +1,61 @@
+"""organization to activity ancestor index
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "006"
+down_revision = "005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "organization_activity_ancestor",
+        sa.Column("ancestor_activity_id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["ancestor_activity_id"], ["activities.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(
+            ["organization_id"], ["organizations.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("ancestor_activity_id", "organization_id"),
+    )
+    op.create_index(
+        "ix_organization_activity_ancestor_organization_id",
+        "organization_activity_ancestor",
+        ["organization_id"],
+    )
+
+    # Populate from existing data
+    op.execute(
+        """
+        INSERT INTO organization_activity_ancestor
+            (organization_id, ancestor_activity_id)
+        WITH RECURSIVE ancestor_chain(organization_id, activity_id) AS (
+            SELECT organization_id, activity_id FROM organization_activity
+            UNION ALL
+            SELECT ancestor_chain.organization_id, activities.parent_id
+            FROM activities JOIN ancestor_chain
+                ON activities.id = ancestor_chain.activity_id
+            WHERE activities.parent_id IS NOT NULL
+        )
+        SELECT DISTINCT organization_id, activity_id FROM ancestor_chain
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_organization_activity_ancestor_organization_id",
+        table_name="organization_activity_ancestor",
+    )
+    op.drop_table("organization_activity_ancestor")
@@ -0,0 +1,158 @@
+"""
+Denormalized organization -> activity ancestor index.
+
+``organization_activity_ancestor`` holds one row for every activity an
+organization is linked to and for every ancestor of those activities, so
+"organizations under activity X, descendants included" is a single equality
+lookup on the table's primary key instead of a subtree expansion followed by
+de-duplicating the links.
+
+An organization's rows are rewritten whenever its links change; moving or
+deleting an activity rewrites the rows of the organizations linked anywhere
+in its subtree. Session flushes do this through the hooks below, Core writers
+call ``refresh_organizations`` or ``rebuild`` themselves. Run
+``python -m app.ancestry rebuild`` to recompute the table from scratch.
+"""
+
+import sys
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import models
+from app.flush_history import history_values, resolve_ids
+
+PENDING_KEY = "ancestry_pending"
+COLUMNS = ["organization_id", "ancestor_activity_id"]
+
+
+def _ancestor_pairs_select(organization_ids: Optional[Iterable[int]] = None):
+    """Distinct (organization_id, ancestor_activity_id) pairs from the links"""
+    link = models.organization_activity
+    chain = select(link.c.organization_id, link.c.activity_id)
+    if organization_ids is not None:
+        chain = chain.where(link.c.organization_id.in_(list(organization_ids)))
+    chain = chain.cte(name="ancestor_chain", recursive=True)
+    chain = chain.union_all(
+        select(chain.c.organization_id, models.Activity.parent_id).where(
+            models.Activity.id == chain.c.activity_id,
+            models.Activity.parent_id.isnot(None),
+        )
+    )
+    return select(chain.c.organization_id, chain.c.activity_id).distinct()
+
+
+def _linked_below(connection: Connection, activity_ids: Iterable[int]) -> Set[int]:
+    """Organizations linked to any activity in the given subtrees"""
+    subtree = (
+        select(models.Activity.id)
+        .where(models.Activity.id.in_(list(activity_ids)))
+        .cte(name="subtree", recursive=True)
+    )
+    subtree = subtree.union_all(
+        select(models.Activity.id).where(models.Activity.parent_id == subtree.c.id)
+    )
+    link = models.organization_activity
+    return set(
+        connection.execute(
+            select(link.c.organization_id).where(
+                link.c.activity_id.in_(select(subtree.c.id))
+            )
+        ).scalars()
+    )
+
+
+def refresh_organizations(connection: Connection, organization_ids: Iterable[int]):
+    """Rewrite the rows of the given organizations from their current links"""
+    organization_ids = set(organization_ids)
+    if not organization_ids:
+        return
+    table = models.organization_activity_ancestor
+    connection.execute(
+        delete(table).where(table.c.organization_id.in_(organization_ids))
+    )
+    connection.execute(
+        table.insert().from_select(COLUMNS, _ancestor_pairs_select(organization_ids))
+    )
+
+
+def rebuild(connection: Connection):
+    """Recompute every row from the links and the activity tree"""
+    table = models.organization_activity_ancestor
+    connection.execute(delete(table))
+    connection.execute(table.insert().from_select(COLUMNS, _ancestor_pairs_select()))
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changes(session, flush_context, instances):
+    pending = session.info.setdefault(
+        PENDING_KEY,
+        {"organizations": [], "moved": [], "removed": set(), "dropped": set()},
+    )
+    organizations = pending["organizations"]
+
+    for obj in session.new:
+        if isinstance(obj, models.Organization):
+            if obj.activities:
+                organizations.append(obj)
+        elif isinstance(obj, models.Activity):
+            organizations.extend(obj.organizations)
+
+    for obj in session.dirty:
+        if isinstance(obj, models.Organization):
+            if history_values(obj, "activities"):
+                organizations.append(obj)
+        elif isinstance(obj, models.Activity):
+            organizations.extend(history_values(obj, "organizations"))
+            if history_values(obj, "parent_id") or history_values(obj, "parent"):
+                pending["moved"].append(obj)
+
+    for obj in session.deleted:
+        if isinstance(obj, models.Organization):
+            pending["dropped"].add(obj.id)
+        elif isinstance(obj, models.Activity):
+            pending["removed"].add(obj.id)
+            # They keep other links, but maybe not to this activity's ancestors
+            organizations.extend(obj.organizations)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_changes(session, flush_context):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    connection = session.connection()
+    table = models.organization_activity_ancestor
+    dropped = pending["dropped"]
+    removed = pending["removed"]
+    # The foreign keys cascade on PostgreSQL, but not on SQLite without PRAGMA
+    if dropped:
+        connection.execute(delete(table).where(table.c.organization_id.in_(dropped)))
+    if removed:
+        connection.execute(
+            delete(table).where(table.c.ancestor_activity_id.in_(removed))
+        )
+    organization_ids = resolve_ids(pending["organizations"])
+    moved = resolve_ids(pending["moved"]) - removed
+    if moved:
+        organization_ids |= _linked_below(connection, moved)
+    refresh_organizations(connection, organization_ids - dropped)
+
+
+def main(argv):
+    if argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.ancestry rebuild")
+        return 2
+
+    from app.database import get_engine
+
+    with get_engine().begin() as connection:
+        rebuild(connection)
+    print("Activity ancestor index rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,14 +1,33 @@
-from fastapi import Security, HTTPException, status
+from time import perf_counter
+from fastapi import Request, Security, HTTPException, status
 from fastapi.security import APIKeyHeader
-from app.config import get_settings
+from app import timing
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
 
 
-async def verify_api_key(api_key: str = Security(api_key_header)):
-    settings = get_settings()
-    if api_key != settings.api_key:
+async def verify_api_key(request: Request, api_key: str = Security(api_key_header)):
+    started = perf_counter()
+    settings = request.app.state.settings
+    # The profiling key is a regular key with extra rights
+    valid = api_key == settings.api_key or (
+        settings.profile_api_key is not None and api_key == settings.profile_api_key
+    )
+    timing.record_auth(perf_counter() - started)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key"
         )
     return api_key
+
+
+async def verify_privileged_key(
+    request: Request, api_key: str = Security(api_key_header)
+):
+    settings = request.app.state.settings
+    if settings.profile_api_key is None or api_key != settings.profile_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Diagnostics require the privileged API key",
+        )
+    return api_key
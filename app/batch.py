@@ -0,0 +1,120 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+from urllib.parse import urlencode
+
+from fastapi import Request
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException
+
+from app import schemas
+
+BATCH_PATH = "/batch"
+# Never ends, so it would hold the batch open forever
+EVENTS_PATH = "/events"
+
+
+def _build_scope(
+    request: Request, item: schemas.BatchRequestItem, db: Session, body: bytes
+) -> Dict[str, Any]:
+    headers = [
+        (b"x-api-key", request.headers.get("x-api-key", "").encode()),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": "1.1",
+        "method": item.method,
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": item.path,
+        "raw_path": item.path.encode(),
+        "query_string": urlencode(item.params, doseq=True).encode(),
+        "headers": headers,
+        "app": request.scope.get("app"),
+        "state": {"db": db},
+    }
+    if "starlette.exception_handlers" in request.scope:
+        scope["starlette.exception_handlers"] = request.scope[
+            "starlette.exception_handlers"
+        ]
+    return scope
+
+
+async def _dispatch(
+    request: Request, item: schemas.BatchRequestItem, db: Session
+) -> schemas.BatchResponseItem:
+    if item.path.rstrip("/") == BATCH_PATH:
+        return schemas.BatchResponseItem(
+            status_code=400, body={"detail": "Nested batch requests are not allowed"}
+        )
+    if item.path.rstrip("/") == EVENTS_PATH:
+        return schemas.BatchResponseItem(
+            status_code=400, body={"detail": "Event streams cannot be batched"}
+        )
+
+    body = json.dumps(item.body).encode() if item.body is not None else b""
+    scope = _build_scope(request, item, db, body)
+    received = False
+    sent = asyncio.Event()
+    status_code = 500
+    chunks: List[bytes] = []
+
+    async def receive():
+        nonlocal received
+        if received:
+            # A streamed response stops as soon as its client disconnects
+            await sent.wait()
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                sent.set()
+
+    try:
+        await request.app.router(scope, receive, send)
+    except HTTPException as exc:
+        # Raised by the router itself for unknown paths and disallowed methods
+        return schemas.BatchResponseItem(
+            status_code=exc.status_code, body={"detail": exc.detail}
+        )
+    except Exception:
+        return schemas.BatchResponseItem(
+            status_code=500, body={"detail": "Internal Server Error"}
+        )
+
+    raw = b"".join(chunks)
+    try:
+        payload = json.loads(raw) if raw else None
+    except ValueError:
+        payload = raw.decode(errors="replace")
+    return schemas.BatchResponseItem(status_code=status_code, body=payload)
+
+
+async def run_batch(
+    request: Request, batch: schemas.BatchRequest, db: Session
+) -> List[schemas.BatchResponseItem]:
+    """Run the sub-requests one after another on the batch's session
+
+    The endpoints use the session synchronously, so running them concurrently
+    would only interleave them. A failed sub-request's uncommitted changes
+    are rolled back so that a later sub-request's commit cannot include them.
+    """
+    results = []
+    for item in batch.requests:
+        result = await _dispatch(request, item, db)
+        if result.status_code >= 400:
+            db.rollback()
+        results.append(result)
+    return results
@@ -0,0 +1,228 @@
+"""
+Set-based bulk upsert of organizations.
+
+Items with an ``id`` update that organization and replace its phone numbers
+and activities; items without one are created. Every item is validated and
+its references checked up front, so a bad item is reported without failing
+the others. The valid ones are then written with a fixed number of
+statements, whatever their count, in a single transaction: an executemany
+per table and one delete per link table for the replaced rows.
+
+Core statements skip the session hooks, so facet counts are refreshed here
+for the affected buildings and activities only, and rows are stamped with
+the new directory version here. Only the directory-wide version is bumped,
+so the activity tree and geo index caches stay warm. Change events for
+subscribers are queued here too and published on commit.
+"""
+
+from typing import Dict, List, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app import ancestry, events, facets, models, schemas, versioning
+
+Item = Tuple[int, schemas.OrganizationUpsert]
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()
+    )
+
+
+def _existing(db: Session, column, ids: Set[int]) -> Set[int]:
+    if not ids:
+        return set()
+    return set(db.execute(select(column).where(column.in_(ids))).scalars())
+
+
+def _publish(db: Session, written: List[Item], version: int) -> None:
+    building_table = models.Building.__table__
+    coordinates = {
+        row.id: row
+        for row in db.execute(
+            select(
+                building_table.c.id,
+                building_table.c.latitude,
+                building_table.c.longitude,
+            ).where(building_table.c.id.in_({item.building_id for _, item in written}))
+        )
+    }
+    events.publish_after_commit(
+        db,
+        [
+            events.change_event(
+                "organization",
+                item.id,
+                version,
+                False,
+                {
+                    "name": item.name,
+                    "building_id": item.building_id,
+                    "latitude": coordinates[item.building_id].latitude,
+                    "longitude": coordinates[item.building_id].longitude,
+                    "activity_ids": sorted(set(item.activity_ids)),
+                },
+            )
+            for _, item in written
+        ],
+    )
+
+
+def upsert_organizations(db: Session, payload: List[dict]) -> dict:
+    """Create or update ``payload`` items; return per-item results"""
+    results = [
+        {"index": index, "id": None, "status": None, "error": None}
+        for index in range(len(payload))
+    ]
+
+    def fail(index: int, message: str) -> None:
+        results[index].update(status="error", error=message)
+
+    items: List[Item] = []
+    seen_ids: Set[int] = set()
+    for index, raw in enumerate(payload):
+        try:
+            item = schemas.OrganizationUpsert.model_validate(raw)
+        except ValidationError as exc:
+            fail(index, _validation_message(exc))
+            continue
+        if item.id is not None:
+            results[index]["id"] = item.id
+            if item.id in seen_ids:
+                fail(index, f"Organization {item.id} appears more than once")
+                continue
+            seen_ids.add(item.id)
+        items.append((index, item))
+
+    organization_table = models.Organization.__table__
+    link_table = models.organization_activity
+    buildings = _existing(
+        db, models.Building.id, {item.building_id for _, item in items}
+    )
+    activities = _existing(
+        db,
+        models.Activity.id,
+        {activity_id for _, item in items for activity_id in item.activity_ids},
+    )
+    # Old building and activities of updated organizations, for the facet counts
+    old_buildings: Dict[int, int] = {}
+    if seen_ids:
+        old_buildings = dict(
+            db.execute(
+                select(organization_table.c.id, organization_table.c.building_id).where(
+                    organization_table.c.id.in_(seen_ids)
+                )
+            ).all()
+        )
+
+    to_create: List[Item] = []
+    to_update: List[Item] = []
+    for index, item in items:
+        if item.building_id not in buildings:
+            fail(index, f"Building {item.building_id} not found")
+        elif set(item.activity_ids) - activities:
+            unknown = sorted(set(item.activity_ids) - activities)
+            fail(index, f"Activities {unknown} not found")
+        elif item.id is None:
+            to_create.append((index, item))
+        elif item.id not in old_buildings:
+            fail(index, f"Organization {item.id} not found")
+        else:
+            to_update.append((index, item))
+
+    written = to_create + to_update
+    if written:
+        version = versioning.bump_versions(db.connection(), [models.Organization])
+    affected_buildings = {item.building_id for _, item in written}
+    affected_activities = {
+        activity_id for _, item in written for activity_id in item.activity_ids
+    }
+    updated_ids = [item.id for _, item in to_update]
+    if updated_ids:
+        affected_buildings.update(old_buildings[id_] for id_ in updated_ids)
+        affected_activities.update(
+            db.execute(
+                select(link_table.c.activity_id).where(
+                    link_table.c.organization_id.in_(updated_ids)
+                )
+            ).scalars()
+        )
+        db.execute(
+            update(organization_table)
+            .where(organization_table.c.id == bindparam("organization_id"))
+            .values(
+                name=bindparam("name"),
+                building_id=bindparam("building_id"),
+                row_version=version,
+            ),
+            [
+                {
+                    "organization_id": item.id,
+                    "name": item.name,
+                    "building_id": item.building_id,
+                }
+                for _, item in to_update
+            ],
+        )
+        db.execute(
+            delete(models.PhoneNumber.__table__).where(
+                models.PhoneNumber.organization_id.in_(updated_ids)
+            )
+        )
+        db.execute(
+            delete(link_table).where(link_table.c.organization_id.in_(updated_ids))
+        )
+
+    if to_create:
+        created_ids = db.execute(
+            insert(organization_table).returning(
+                organization_table.c.id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "name": item.name,
+                    "building_id": item.building_id,
+                    "row_version": version,
+                }
+                for _, item in to_create
+            ],
+        ).scalars()
+        for (index, item), id_ in zip(to_create, created_ids):
+            item.id = id_
+            results[index].update(id=id_, status="created")
+    for index, _ in to_update:
+        results[index]["status"] = "updated"
+
+    phones = [
+        {"organization_id": item.id, "number": number}
+        for _, item in written
+        for number in item.phone_numbers
+    ]
+    links = [
+        {"organization_id": item.id, "activity_id": activity_id}
+        for _, item in written
+        for activity_id in sorted(set(item.activity_ids))
+    ]
+    if phones:
+        db.execute(insert(models.PhoneNumber.__table__), phones)
+    if links:
+        db.execute(insert(link_table), links)
+
+    if written:
+        connection = db.connection()
+        facets.refresh_building_counts(connection, affected_buildings)
+        facets.refresh_activity_counts(connection, affected_activities)
+        ancestry.refresh_organizations(connection, [item.id for _, item in written])
+        if events.bus.has_subscribers:
+            _publish(db, written, version)
+    db.commit()
+
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "failed": sum(1 for result in results if result["status"] == "error"),
+        "items": results,
+    }
@@ -0,0 +1,159 @@
+"""
+In-process caches of data derived from the directory.
+
+Entries are kept per engine and tagged with the directory version they were
+built from; a lookup that sees a newer version rebuilds the entry, so writes
+made by any worker invalidate the cache on its next read. Caches of a single
+table follow that table's version and are kept across other writes. A cache
+with a ``refresh`` function derives the new value from the stale one instead
+of building it from scratch.
+"""
+
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import facets, models
+from app.clusters import ClusterGrid, changed_positions
+from app.geo import GeoIndex
+from app.memory import deep_sizeof
+from app.versioning import (
+    ACTIVITIES_VERSION_ID,
+    BUILDINGS_VERSION_ID,
+    VERSION_ROW_ID,
+    current_version,
+    has_uncommitted_changes,
+)
+
+
+class DirectoryCache:
+    """A value computed from the directory, rebuilt when its version changes"""
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[Session], Any],
+        version_id: int = VERSION_ROW_ID,
+        refresh: Optional[Callable[[Session, Any], Any]] = None,
+    ):
+        self.name = name
+        self._build = build
+        self._refresh = refresh
+        self.version_id = version_id
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session) -> Any:
+        engine = db.get_bind()
+        version = current_version(db.connection(), self.version_id)
+        entry = self._entries.get(engine)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        if entry is not None and self._refresh is not None:
+            value = self._refresh(db, entry[1])
+        else:
+            value = self._build(db)
+        # Data read inside an uncommitted write would outlive a rollback
+        if not has_uncommitted_changes(db):
+            with self._lock:
+                self._entries[engine] = (version, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def memory_usage(self) -> Dict[str, int]:
+        with self._lock:
+            values = [value for _, value in self._entries.values()]
+        return {"entries": len(values), "bytes": sum(map(deep_sizeof, values))}
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _load_activity_children(db: Session) -> Dict[Optional[int], List[dict]]:
+    table = models.Activity.__table__
+    rows = db.execute(
+        select(table.c.id, table.c.name, table.c.parent_id, table.c.level).order_by(
+            table.c.id
+        )
+    )
+    children: Dict[Optional[int], List[dict]] = {}
+    for row in rows:
+        children.setdefault(row.parent_id, []).append(dict(row._mapping))
+    return children
+
+
+def _load_geo_index(db: Session) -> GeoIndex:
+    table = models.Building.__table__
+    return GeoIndex(
+        db.execute(select(table.c.id, table.c.latitude, table.c.longitude)).tuples()
+    )
+
+
+def _load_cluster_grid(db: Session) -> ClusterGrid:
+    # Tiles are computed on demand; the grid only fixes the data they come from
+    index = geo_index.get(db)
+    counts = facets.building_counts(db)
+
+    def points(min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+        for building_id, latitude, longitude in index.points_in_rectangle(
+            min_lat, max_lat, min_lon, max_lon
+        ):
+            yield building_id, latitude, longitude, counts.get(building_id, 0)
+
+    buildings = {
+        building_id: (latitude, longitude, counts.get(building_id, 0))
+        for building_id, latitude, longitude in zip(
+            index.ids, index.latitudes, index.longitudes
+        )
+    }
+    return ClusterGrid(points, buildings)
+
+
+def _refresh_cluster_grid(db: Session, previous: ClusterGrid) -> ClusterGrid:
+    # A write drops only the tiles holding the buildings it moved or recounted
+    grid = _load_cluster_grid(db)
+    grid.inherit(previous, changed_positions(previous.buildings, grid.buildings))
+    return grid
+
+
+activity_children = DirectoryCache(
+    "activity_tree", _load_activity_children, ACTIVITIES_VERSION_ID
+)
+geo_index = DirectoryCache("geo_index", _load_geo_index, BUILDINGS_VERSION_ID)
+cluster_grid = DirectoryCache(
+    "cluster_grid", _load_cluster_grid, refresh=_refresh_cluster_grid
+)
+
+CACHES = [activity_children, geo_index, cluster_grid]
+
+
+def activity_tree(db: Session, counts: Optional[Dict[int, int]] = None) -> List[dict]:
+    """Nested activity tree, optionally annotated with subtree organization counts"""
+    children = activity_children.get(db)
+
+    def build(parent_id: Optional[int]) -> List[dict]:
+        result = []
+        for activity in children.get(parent_id, []):
+            node = {**activity, "children": build(activity["id"])}
+            if counts is not None:
+                node["organization_count"] = counts.get(activity["id"], 0)
+            result.append(node)
+        return result
+
+    return build(None)
+
+
+def clear_all() -> None:
+    for cache in CACHES:
+        cache.clear()
@@ -0,0 +1,74 @@
+"""
+Canonical, quantized form of location search queries.
+
+``GET /organizations/search/by-location`` is meant to be stored by HTTP
+caches and CDNs, which key on the URL. Coordinates are rounded to
+``LOCATION_PRECISION`` decimal places and the radius to
+``LOCATION_RADIUS_PRECISION``; parameters the search mode does not use are
+dropped and the rest are written in a fixed order and format. Requests a
+few meters apart thus share one URL, and the route redirects everything
+else to it.
+
+Rounding never shrinks the searched area: rectangle bounds are rounded
+outwards. A circle's center moves by at most half a step on each axis (under
+80 m at the default three places), so the radius grows by the distance the
+center moved before it is rounded up; the canonical circle contains the
+requested one. A center already on the grid does not move, which keeps the
+canonical URL canonical.
+"""
+
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP, Decimal
+from typing import Dict, Optional
+
+from app.geo import haversine_distance
+
+
+def quantize(value: float, places: int, rounding: str = ROUND_HALF_UP) -> str:
+    step = Decimal(1).scaleb(-places)
+    quantized = Decimal(repr(value)).quantize(step, rounding=rounding)
+    # "-0.000" and "0.000" would be two cache keys for one query
+    return str(quantized.copy_abs() if quantized.is_zero() else quantized)
+
+
+def canonical_location_query(
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius: Optional[float],
+    min_latitude: Optional[float],
+    max_latitude: Optional[float],
+    min_longitude: Optional[float],
+    max_longitude: Optional[float],
+    precision: int,
+    radius_precision: int,
+) -> Dict[str, str]:
+    """Query parameters of the canonical URL, in order
+
+    A radius takes precedence over rectangle bounds, as in the POST route.
+    Raises ``ValueError`` when neither search is fully specified.
+    """
+    if radius is not None:
+        if latitude is None or longitude is None:
+            raise ValueError("A radius search needs 'latitude' and 'longitude'")
+        center_latitude = quantize(latitude, precision)
+        center_longitude = quantize(longitude, precision)
+        moved = haversine_distance(
+            latitude, longitude, float(center_latitude), float(center_longitude)
+        )
+        return {
+            "latitude": center_latitude,
+            "longitude": center_longitude,
+            "radius": quantize(radius + moved, radius_precision, ROUND_CEILING),
+        }
+
+    bounds = (min_latitude, max_latitude, min_longitude, max_longitude)
+    if None in bounds:
+        raise ValueError(
+            "Please provide either 'radius' for circular search or all rectangle "
+            "boundaries (min_latitude, max_latitude, min_longitude, max_longitude)"
+        )
+    return {
+        "min_latitude": quantize(min_latitude, precision, ROUND_FLOOR),
+        "max_latitude": quantize(max_latitude, precision, ROUND_CEILING),
+        "min_longitude": quantize(min_longitude, precision, ROUND_FLOOR),
+        "max_longitude": quantize(max_longitude, precision, ROUND_CEILING),
+    }
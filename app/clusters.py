@@ -0,0 +1,191 @@
+"""
+Grid clustering of organizations for map views.
+
+The map is cut into square cells of ``cell_size`` degrees aligned at (0, 0);
+a zoom level maps to an eighth of a map tile, ``360 / 2**zoom / 8`` degrees.
+Each cell reports how many organizations its buildings hold and their
+centroid, weighted by those counts, so drawing a bubble never touches the
+organizations themselves.
+
+Cells are computed a tile (``CELLS_PER_TILE`` x ``CELLS_PER_TILE`` cells) at a
+time from the buildings in the tile's rectangle, and tiles are cached, so
+panning only computes the tiles that scrolled into view. A grid for a newer
+version of the directory takes over the cached tiles of the previous one,
+except those holding a building whose position or organization count
+changed. A viewport gets every cell it touches, whole, so a cell's bubble does
+not move while the map does.
+"""
+
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+CELLS_PER_TILE = 8
+# Larger viewports need a larger cell size
+MAX_TILES = 256
+MAX_CACHED_TILES = 4096
+
+# (building id, latitude, longitude, organization count)
+Point = Tuple[int, float, float, int]
+PointSource = Callable[[float, float, float, float], Iterable[Point]]
+# Building id -> (latitude, longitude, organization count)
+Buildings = Dict[int, Tuple[float, float, int]]
+
+
+def zoom_cell_size(zoom: int) -> float:
+    return 360 / 2**zoom / CELLS_PER_TILE
+
+
+def changed_positions(old: Buildings, new: Buildings) -> Iterator[Tuple[float, float]]:
+    """Old and new positions of the buildings that differ between versions"""
+    for building_id in old.keys() | new.keys():
+        before, after = old.get(building_id), new.get(building_id)
+        if before == after:
+            continue
+        if before is not None:
+            yield before[0], before[1]
+        if after is not None:
+            yield after[0], after[1]
+
+
+class ClusterGrid:
+    """Cells of one version of the directory, cached per tile
+
+    ``buildings``, when given, is the data the points come from; a later
+    grid compares it with its own to tell which tiles it can take over.
+    """
+
+    def __init__(self, points: PointSource, buildings: Optional[Buildings] = None):
+        self._points = points
+        self.buildings = buildings
+        self._tiles: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def inherit(
+        self, previous: "ClusterGrid", changed: Iterable[Tuple[float, float]]
+    ) -> None:
+        """Take over ``previous``'s tiles, but for those holding a changed point"""
+        with previous._lock:
+            tiles = OrderedDict(previous._tiles)
+        cell_sizes = {cell_size for cell_size, _, _ in tiles}
+        for latitude, longitude in changed:
+            for cell_size in cell_sizes:
+                # The tile _compute counts the point in
+                row = math.floor(latitude / cell_size)
+                col = math.floor(longitude / cell_size)
+                tiles.pop(
+                    (cell_size, row // CELLS_PER_TILE, col // CELLS_PER_TILE), None
+                )
+        with self._lock:
+            tiles.update(self._tiles)
+            self._tiles = tiles
+
+    def _compute(self, cell_size: float, tile_row: int, tile_col: int) -> List[dict]:
+        tile_size = cell_size * CELLS_PER_TILE
+        sums = {}
+        for building_id, latitude, longitude, count in self._points(
+            tile_row * tile_size,
+            (tile_row + 1) * tile_size,
+            tile_col * tile_size,
+            (tile_col + 1) * tile_size,
+        ):
+            if not count:
+                continue
+            row = math.floor(latitude / cell_size)
+            col = math.floor(longitude / cell_size)
+            if (row // CELLS_PER_TILE, col // CELLS_PER_TILE) != (tile_row, tile_col):
+                # On the tile's upper edge; it belongs to the next tile
+                continue
+            cell = sums.get((row, col))
+            if cell is None:
+                cell = sums[row, col] = [0, 0, 0.0, 0.0, building_id]
+            cell[0] += count
+            cell[1] += 1
+            cell[2] += latitude * count
+            cell[3] += longitude * count
+
+        return [
+            {
+                "row": row,
+                "col": col,
+                "count": count,
+                "building_count": buildings,
+                "latitude": latitude_sum / count,
+                "longitude": longitude_sum / count,
+                "building_id": building_id if buildings == 1 else None,
+                "min_latitude": row * cell_size,
+                "max_latitude": (row + 1) * cell_size,
+                "min_longitude": col * cell_size,
+                "max_longitude": (col + 1) * cell_size,
+            }
+            for (row, col), (
+                count,
+                buildings,
+                latitude_sum,
+                longitude_sum,
+                building_id,
+            ) in sorted(sums.items())
+        ]
+
+    def tile(self, cell_size: float, tile_row: int, tile_col: int) -> List[dict]:
+        key = (cell_size, tile_row, tile_col)
+        with self._lock:
+            cells = self._tiles.get(key)
+            if cells is not None:
+                self._tiles.move_to_end(key)
+                return cells
+        cells = self._compute(cell_size, tile_row, tile_col)
+        with self._lock:
+            self._tiles[key] = cells
+            if len(self._tiles) > MAX_CACHED_TILES:
+                self._tiles.popitem(last=False)
+        return cells
+
+    def cells(
+        self,
+        cell_size: float,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+    ) -> List[dict]:
+        """Non-empty cells touching the rectangle, ordered by row and column"""
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValueError("Minimum bounds must not exceed maximum bounds")
+        first_row, last_row = (
+            math.floor(lat / cell_size) for lat in (min_lat, max_lat)
+        )
+        first_col, last_col = (
+            math.floor(lon / cell_size) for lon in (min_lon, max_lon)
+        )
+        tile_rows = range(first_row // CELLS_PER_TILE, last_row // CELLS_PER_TILE + 1)
+        tile_cols = range(first_col // CELLS_PER_TILE, last_col // CELLS_PER_TILE + 1)
+        if len(tile_rows) * len(tile_cols) > MAX_TILES:
+            raise ValueError("The viewport is too large for this cell size")
+
+        return [
+            cell
+            for tile_row in tile_rows
+            for tile_col in tile_cols
+            for cell in self.tile(cell_size, tile_row, tile_col)
+            if first_row <= cell["row"] <= last_row
+            and first_col <= cell["col"] <= last_col
+        ]
+
+
+_snapshot_grids = weakref.WeakKeyDictionary()
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_grid(snapshot) -> ClusterGrid:
+    """The grid of a snapshot, kept as long as the snapshot is"""
+    with _snapshot_lock:
+        grid = _snapshot_grids.get(snapshot)
+        if grid is None:
+            grid = _snapshot_grids[snapshot] = ClusterGrid(snapshot.building_points)
+        return grid
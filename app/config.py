@@ -1,10 +1,56 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict, Literal, Optional
+
+# Unpaginated organization lists run their query, then load phones and
+# activities in chunks of 500 rows: two statements per chunk. This allows for
+# lists of 10,000 organizations plus a few lookups around them.
+LIST_QUERY_BUDGET = 50
+LIST_ROUTES = (
+    "/organizations/",
+    "/organizations/building/{building_id}",
+    "/organizations/activity/{activity_id}",
+    "/organizations/search/by-name",
+    "/organizations/search/by-location",
+    "/organizations/search/by-location/batch",
+)
 
 
 class Settings(BaseSettings):
     database_url: str
     api_key: str
+    batch_max_requests: int = 20
+    bulk_max_items: int = 5000
+    location_batch_max_queries: int = 100
+    location_precision: int = 3
+    location_radius_precision: int = 1
+    location_cache_max_age: int = 60
+    snapshot_mode: bool = False
+    snapshot_refresh_interval: float = 30.0
+    snapshot_path: Optional[str] = None
+    warmup_enabled: bool = True
+    warmup_connections: int = 5
+    warmup_retry_interval: float = 5.0
+    server_timing: bool = True
+    slow_query_ms: Optional[float] = 200.0
+    query_budget: int = 10
+    query_budgets: Dict[str, int] = {
+        "/batch": 200,
+        "/organizations/bulk": 50,
+        **{route: LIST_QUERY_BUDGET for route in LIST_ROUTES},
+    }
+    query_budget_strict: bool = False
+    metrics_enabled: bool = True
+    profile_api_key: Optional[str] = None
+    profile_dir: str = "profiles"
+    profile_interval_ms: float = 1.0
+    max_response_bytes: Optional[int] = None
+    oversized_responses: Literal["stream", "reject"] = "stream"
+    tracemalloc_frames: int = 0
+    trace_sample_rate: float = 0.0
+    trace_path: str = "traces/trace.jsonl"
+    trace_max_body_bytes: int = 4096
+    events_keepalive_interval: float = 15.0
 
     class Config:
         env_file = ".env"
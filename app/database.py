@@ -1,19 +1,101 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import get_settings
 
-settings = get_settings()
-
-engine = create_engine(settings.database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sessions are bound per call so that importing this module neither reads the
+# configuration nor creates an engine
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
+# psycopg 3 switches a statement to a server-side prepared one after it ran
+# this many times on a connection; psycopg2 has no equivalent
+PREPARE_THRESHOLD = 2
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def _create_engine(database_url: str) -> Engine:
+    connect_args = {}
+    if make_url(database_url).get_driver_name() == "psycopg":
+        connect_args["prepare_threshold"] = PREPARE_THRESHOLD
+    return create_engine(database_url, connect_args=connect_args)
+
+
+def get_engine(database_url: Optional[str] = None) -> Engine:
+    """Return the engine for ``database_url``, creating it on first use"""
+    if database_url is None:
+        database_url = get_settings().database_url
+    engine = _engines.get(database_url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(database_url)
+            if engine is None:
+                engine = _engines[database_url] = _create_engine(database_url)
+    return engine
+
+
+def engines() -> List[Engine]:
+    """Engines created so far in this process"""
+    return list(_engines.values())
 
-def get_db():
-    db = SessionLocal()
+
+@contextmanager
+def consistent_read(engine: Engine) -> Iterator[Connection]:
+    """A connection whose statements all read one snapshot of the database"""
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with connection.begin():
+            dbapi_connection = connection.connection.dbapi_connection
+            if connection.dialect.name == "sqlite" and not getattr(
+                dbapi_connection, "in_transaction", True
+            ):
+                # pysqlite only opens a transaction before the first write
+                connection.exec_driver_sql("BEGIN")
+            yield connection
+
+
+def __getattr__(name: str):
+    # Backwards compatible ``from app.database import engine``
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_db(request: Request):
+    # Sub-requests of a /batch call share the session opened for the batch
+    shared = getattr(request.state, "db", None)
+    if shared is not None:
+        yield shared
+        return
+
+    db = SessionLocal(bind=get_engine(request.app.state.settings.database_url))
+    request.state.own_db = db
     try:
         yield db
     finally:
-        db.close()
+        # A streamed response takes over closing it once the body is sent
+        if not getattr(request.state, "db_close_deferred", False):
+            db.close()
+
+
+def defer_close(request: Request, db: Session) -> Optional[Callable[[], None]]:
+    """Keep the request's own session open past ``get_db``; return its closer
+
+    FastAPI exits ``get_db`` before a streamed body is sent. Sessions shared
+    from a /batch call, or supplied some other way, are left to their owner
+    and get ``None``.
+    """
+    if getattr(request.state, "own_db", None) is not db:
+        return None
+    request.state.db_close_deferred = True
+    return db.close
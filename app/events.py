@@ -0,0 +1,323 @@
+"""
+In-process change notifications.
+
+Write paths hand change events to the process-wide ``bus`` once their
+transaction commits: ORM writes through the session hooks below, Core writes
+(the bulk endpoint) through ``publish_after_commit``. Nothing is collected
+while nobody is subscribed.
+
+Subscribers register a filter: a viewport, a set of activities, or both.
+Viewport subscriptions are indexed by one-degree grid cells, so an event is
+only tested against the subscriptions whose viewport can contain it. Each
+subscriber has a bounded queue; one that falls behind is dropped and told
+to catch up through ``/changes``.
+
+The bus sees writes made by this process only. Clients of a multi-worker
+deployment resume from the change feed with the last event id (a directory
+version) they received.
+"""
+
+import asyncio
+import json
+import math
+import threading
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.versioning import ENTITY_NAMES, VERSIONED_MODELS, current_version
+
+PENDING_KEY = "events_pending"
+DELETED_KEY = "events_deleted"
+QUEUE_SIZE = 1000
+# Viewports spanning more cells than this are checked against every event
+MAX_INDEXED_CELLS = 400
+
+Cell = Tuple[int, int]
+
+
+def _cell(latitude: float, longitude: float) -> Cell:
+    return math.floor(latitude), math.floor(longitude)
+
+
+class EventFilter:
+    """Which change events a subscriber wants; no criteria means all of them"""
+
+    def __init__(
+        self,
+        min_latitude: Optional[float] = None,
+        max_latitude: Optional[float] = None,
+        min_longitude: Optional[float] = None,
+        max_longitude: Optional[float] = None,
+        activity_ids: Optional[Iterable[int]] = None,
+    ):
+        bounds = (min_latitude, max_latitude, min_longitude, max_longitude)
+        if any(bound is not None for bound in bounds) and None in bounds:
+            raise ValueError("A viewport needs all four bounds")
+        self.viewport = bounds if min_latitude is not None else None
+        self.activity_ids = set(activity_ids) if activity_ids is not None else None
+
+    def cells(self) -> Optional[List[Cell]]:
+        if self.viewport is None:
+            return None
+        min_latitude, max_latitude, min_longitude, max_longitude = self.viewport
+        south, west = _cell(min_latitude, min_longitude)
+        north, east = _cell(max_latitude, max_longitude)
+        if (north - south + 1) * (east - west + 1) > MAX_INDEXED_CELLS:
+            return None
+        return [
+            (latitude, longitude)
+            for latitude in range(south, north + 1)
+            for longitude in range(west, east + 1)
+        ]
+
+    def matches(self, change: dict) -> bool:
+        data = change["data"]
+        if self.activity_ids is not None:
+            if change["entity"] == "building":
+                return False
+            if change["entity"] == "activity":
+                ids = {change["id"]}
+            else:
+                ids = set(data.get("activity_ids", ()))
+            if not ids & self.activity_ids:
+                return False
+        if self.viewport is not None:
+            if change["entity"] == "activity" or data.get("latitude") is None:
+                return False
+            min_latitude, max_latitude, min_longitude, max_longitude = self.viewport
+            return (
+                min_latitude <= data["latitude"] <= max_latitude
+                and min_longitude <= data["longitude"] <= max_longitude
+            )
+        return True
+
+
+class Subscription:
+    def __init__(self, event_filter: EventFilter, loop: asyncio.AbstractEventLoop):
+        self.filter = event_filter
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        self.loop = loop
+        self.overflowed = False
+
+    def _put(self, change: Optional[dict]) -> None:
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Wake the reader so it can tell the client to resync
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def deliver(self, change: Optional[dict]) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, change)
+        except RuntimeError:
+            # The subscriber's loop is closed; it is about to unsubscribe
+            pass
+
+    async def get(self) -> Optional[dict]:
+        """Next matching change, or None once the subscription overflowed"""
+        change = await self.queue.get()
+        return None if self.overflowed else change
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_cell: Dict[Cell, Set[Subscription]] = {}
+        self._unindexed: Set[Subscription] = set()
+        self._count = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return self._count > 0
+
+    def subscribe(self, event_filter: EventFilter) -> Subscription:
+        subscription = Subscription(event_filter, asyncio.get_running_loop())
+        with self._lock:
+            cells = event_filter.cells()
+            if cells is None:
+                self._unindexed.add(subscription)
+            for cell in cells or ():
+                self._by_cell.setdefault(cell, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            cells = subscription.filter.cells()
+            if cells is None:
+                self._unindexed.discard(subscription)
+            for cell in cells or ():
+                subscribers = self._by_cell.get(cell)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_cell[cell]
+            self._count -= 1
+
+    def _candidates(self, change: dict) -> Set[Subscription]:
+        candidates = set(self._unindexed)
+        data = change["data"]
+        if data.get("latitude") is not None:
+            cell = _cell(data["latitude"], data["longitude"])
+            candidates.update(self._by_cell.get(cell, ()))
+        return candidates
+
+    def publish(self, changes: Iterable[dict]) -> None:
+        with self._lock:
+            deliveries = [
+                (subscription, change)
+                for change in changes
+                for subscription in self._candidates(change)
+                if subscription.filter.matches(change)
+            ]
+        for subscription, change in deliveries:
+            subscription.deliver(change)
+
+
+bus = EventBus()
+
+
+def format_event(name: str, data, event_id: Optional[int] = None) -> str:
+    """One server-sent event frame"""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {name}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(
+    event_filter: EventFilter, version: int, keepalive: float, is_disconnected
+) -> AsyncIterator[str]:
+    """Server-sent events matching ``event_filter``, starting after ``version``
+
+    The first event, ``ready``, carries the version the stream starts from;
+    ``/changes?since=<version>`` covers anything committed before it. A
+    subscriber that falls behind gets a ``resync`` event with the last
+    version it saw and the stream ends.
+    """
+    subscription = bus.subscribe(event_filter)
+    try:
+        yield format_event("ready", {"version": version}, version)
+        while True:
+            try:
+                change = await asyncio.wait_for(subscription.get(), keepalive)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            if change is None:
+                yield format_event("resync", {"since": version})
+                return
+            version = change["version"]
+            yield format_event(change["entity"], change, version)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+def change_event(entity: str, entity_id: int, version: int, deleted: bool, data):
+    return {
+        "entity": entity,
+        "id": entity_id,
+        "version": version,
+        "deleted": deleted,
+        "data": data,
+    }
+
+
+def _payload(obj) -> dict:
+    """Fields subscribers filter on, plus the name for display"""
+    if isinstance(obj, models.Building):
+        return {
+            "address": obj.address,
+            "latitude": obj.latitude,
+            "longitude": obj.longitude,
+        }
+    if isinstance(obj, models.Activity):
+        return {"name": obj.name, "parent_id": obj.parent_id, "level": obj.level}
+    building = obj.building
+    return {
+        "name": obj.name,
+        "building_id": obj.building_id,
+        "latitude": building.latitude if building is not None else None,
+        "longitude": building.longitude if building is not None else None,
+        "activity_ids": sorted(activity.id for activity in obj.activities),
+    }
+
+
+def publish_after_commit(session: Session, changes: List[dict]) -> None:
+    """Publish ``changes`` once the session's transaction commits"""
+    session.info.setdefault(PENDING_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "before_flush")
+def _capture_deleted(session, flush_context, instances):
+    # Deleted rows cannot be loaded after the flush
+    if not bus.has_subscribers:
+        return
+    deleted = [
+        (ENTITY_NAMES[type(obj)], obj.id, _payload(obj))
+        for obj in session.deleted
+        if isinstance(obj, VERSIONED_MODELS)
+    ]
+    if deleted:
+        session.info.setdefault(DELETED_KEY, []).extend(deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    deleted = session.info.pop(DELETED_KEY, [])
+    if not bus.has_subscribers:
+        return
+    written = [
+        obj
+        for obj in (*session.new, *session.dirty)
+        if isinstance(obj, VERSIONED_MODELS)
+    ]
+    # Organizations touched through their phones only
+    phone_owners = {
+        obj.organization_id
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, models.PhoneNumber) and obj.organization_id is not None
+    } - {obj.id for obj in written if isinstance(obj, models.Organization)}
+    if not (written or deleted or phone_owners):
+        return
+
+    version = current_version(session.connection())
+    if phone_owners:
+        written.extend(
+            session.execute(
+                select(models.Organization).where(
+                    models.Organization.id.in_(phone_owners)
+                )
+            ).scalars()
+        )
+    publish_after_commit(
+        session,
+        [
+            change_event(ENTITY_NAMES[type(obj)], obj.id, version, False, _payload(obj))
+            for obj in written
+        ]
+        + [
+            change_event(entity, entity_id, version, True, data)
+            for entity, entity_id, data in deleted
+        ],
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish(session):
+    changes = session.info.pop(PENDING_KEY, None)
+    if changes:
+        bus.publish(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(DELETED_KEY, None)
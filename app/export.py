@@ -0,0 +1,230 @@
+"""
+Columnar export of the directory as Parquet files or Arrow IPC streams.
+
+    python -m app.export exports/ --format parquet
+
+writes one file per table: buildings, activities, organizations and the
+phone_numbers and organization_activity link tables. ``GET /export/{table}``
+streams the same bytes for a single table.
+
+Each table is read with one streamed query in batches of ``batch_size``
+rows. A batch is converted to an Arrow record batch (a Parquet row group)
+and handed on before the next is fetched, so memory is bounded by the batch
+size, not by the table. The CLI reads all tables in one transaction, so the
+files are consistent with each other.
+
+Consumers load a table in one call:
+
+    pyarrow.parquet.read_table("exports/organizations.parquet")
+    pandas.read_parquet("exports/organizations.parquet")
+    pyarrow.ipc.open_stream(response.content).read_all()
+
+or every exported table with ``app.export.load("exports/")``.
+
+pyarrow is an optional dependency, imported on first use.
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import BigInteger, Float, Integer, String, Table, select
+from sqlalchemy.engine import Connection, Engine
+
+from app import models
+
+TABLES: Dict[str, Table] = {
+    "buildings": models.Building.__table__,
+    "activities": models.Activity.__table__,
+    "organizations": models.Organization.__table__,
+    "phone_numbers": models.PhoneNumber.__table__,
+    "organization_activity": models.organization_activity,
+}
+# Format -> (file extension, media type)
+FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrows", "application/vnd.apache.arrow.stream"),
+}
+BATCH_SIZE = 10000
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "Columnar export needs pyarrow: pip install pyarrow"
+        ) from None
+    return pyarrow
+
+
+def arrow_schema(table: Table):
+    pa = require_pyarrow()
+    types = [
+        (BigInteger, pa.int64()),
+        (Integer, pa.int32()),
+        (Float, pa.float64()),
+        (String, pa.string()),
+    ]
+    fields = []
+    for column in table.columns:
+        arrow_type = next(
+            arrow_type
+            for sql_type, arrow_type in types
+            if isinstance(column.type, sql_type)
+        )
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+class _Sink:
+    """Write-only file object that hands out what was written since last time"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _open_writer(format: str, sink: _Sink, schema):
+    pa = require_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(sink, schema)
+    return pa.ipc.new_stream(sink, schema)
+
+
+def iter_table(
+    connection: Connection,
+    name: str,
+    format: str = "parquet",
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Encoded chunks of table ``name``, one per batch of rows"""
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    pa = require_pyarrow()
+    table = TABLES[name]
+    schema = arrow_schema(table)
+    sink = _Sink()
+    writer = _open_writer(format, sink, schema)
+    result = connection.execution_options(yield_per=batch_size).execute(
+        select(table).order_by(*table.primary_key.columns)
+    )
+    for rows in result.partitions():
+        columns = zip(*rows)
+        writer.write_batch(
+            pa.record_batch(
+                [
+                    pa.array(values, type=field.type)
+                    for values, field in zip(columns, schema)
+                ],
+                schema=schema,
+            )
+        )
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def stream_table(
+    engine: Engine, name: str, format: str = "parquet", batch_size: int = BATCH_SIZE
+) -> Iterator[bytes]:
+    """``iter_table`` on a connection of its own, for streaming responses"""
+    with engine.connect() as connection:
+        yield from iter_table(connection, name, format, batch_size)
+
+
+def export_directory(
+    engine: Engine,
+    path: str,
+    format: str = "parquet",
+    batch_size: int = BATCH_SIZE,
+    tables: Optional[Iterable[str]] = None,
+) -> Dict[str, int]:
+    """Write ``tables`` (all by default) to ``path``; return bytes per file"""
+    extension, _ = FORMATS[format]
+    os.makedirs(path, exist_ok=True)
+    sizes = {}
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with connection.begin():
+            for name in tables or TABLES:
+                target = os.path.join(path, f"{name}.{extension}")
+                with open(target + ".tmp", "wb") as file:
+                    for chunk in iter_table(connection, name, format, batch_size):
+                        file.write(chunk)
+                os.replace(target + ".tmp", target)
+                sizes[name] = os.path.getsize(target)
+    return sizes
+
+
+def load(path: str) -> dict:
+    """Every exported table found in ``path``, as pyarrow tables by name"""
+    pa = require_pyarrow()
+    import pyarrow.parquet
+
+    tables = {}
+    for name in TABLES:
+        parquet_path = os.path.join(path, f"{name}.parquet")
+        arrow_path = os.path.join(path, f"{name}.arrows")
+        if os.path.exists(parquet_path):
+            tables[name] = pyarrow.parquet.read_table(parquet_path)
+        elif os.path.exists(arrow_path):
+            with pa.OSFile(arrow_path) as file:
+                tables[name] = pa.ipc.open_stream(file).read_all()
+    return tables
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="Directory to write the files to")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--table", action="append", choices=list(TABLES), help="Repeatable"
+    )
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    from app.database import get_engine
+
+    started = time.perf_counter()
+    sizes = export_directory(
+        get_engine(args.database_url),
+        args.path,
+        format=args.format,
+        batch_size=args.batch_size,
+        tables=args.table,
+    )
+    elapsed = time.perf_counter() - started
+    for name, size in sizes.items():
+        print(f"{name:>22}: {size / 1024:.1f} KiB")
+    print(f"Exported in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
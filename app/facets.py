@@ -0,0 +1,214 @@
+"""
+Precomputed organization counts per activity subtree and per building.
+
+The counts live in aggregate tables that are refreshed for the affected
+activities and buildings whenever organizations or their activity links are
+flushed. Run ``python -m app.facets rebuild`` to recompute them from scratch.
+"""
+
+import sys
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import models
+from app.flush_history import history_values, resolve_ids
+
+PENDING_KEY = "facets_pending"
+
+
+def _subtree_counts_select(root_ids: Optional[Iterable[int]] = None):
+    """(activity_id, organization_count) over each activity's whole subtree"""
+    roots = select(models.Activity.id.label("root_id"), models.Activity.id.label("id"))
+    if root_ids is not None:
+        roots = roots.where(models.Activity.id.in_(list(root_ids)))
+    subtree = roots.cte(name="subtree", recursive=True)
+    subtree = subtree.union_all(
+        select(subtree.c.root_id, models.Activity.id).where(
+            models.Activity.parent_id == subtree.c.id
+        )
+    )
+    link = models.organization_activity
+    return (
+        select(
+            subtree.c.root_id,
+            func.count(func.distinct(link.c.organization_id)),
+        )
+        .join(link, link.c.activity_id == subtree.c.id)
+        .group_by(subtree.c.root_id)
+    )
+
+
+def _building_counts_select(building_ids: Optional[Iterable[int]] = None):
+    stmt = select(
+        models.Organization.building_id, func.count(models.Organization.id)
+    ).group_by(models.Organization.building_id)
+    if building_ids is not None:
+        stmt = stmt.where(models.Organization.building_id.in_(list(building_ids)))
+    return stmt
+
+
+def _ancestor_ids(connection: Connection, activity_ids: Iterable[int]) -> Set[int]:
+    chain = (
+        select(models.Activity.id, models.Activity.parent_id)
+        .where(models.Activity.id.in_(list(activity_ids)))
+        .cte(name="ancestors", recursive=True)
+    )
+    chain = chain.union_all(
+        select(models.Activity.id, models.Activity.parent_id).where(
+            models.Activity.id == chain.c.parent_id
+        )
+    )
+    return set(connection.execute(select(chain.c.id)).scalars())
+
+
+def refresh_activity_counts(connection: Connection, activity_ids: Iterable[int]):
+    """Recount the given activities and all of their ancestors"""
+    activity_ids = set(activity_ids)
+    if not activity_ids:
+        return
+    table = models.ActivityOrganizationCount.__table__
+    affected = _ancestor_ids(connection, activity_ids) | activity_ids
+    connection.execute(delete(table).where(table.c.activity_id.in_(affected)))
+    rows = connection.execute(_subtree_counts_select(affected)).all()
+    if rows:
+        connection.execute(
+            table.insert(),
+            [{"activity_id": a, "organization_count": c} for a, c in rows],
+        )
+
+
+def refresh_building_counts(connection: Connection, building_ids: Iterable[int]):
+    building_ids = set(building_ids)
+    if not building_ids:
+        return
+    table = models.BuildingOrganizationCount.__table__
+    connection.execute(delete(table).where(table.c.building_id.in_(building_ids)))
+    rows = connection.execute(_building_counts_select(building_ids)).all()
+    if rows:
+        connection.execute(
+            table.insert(),
+            [{"building_id": b, "organization_count": c} for b, c in rows],
+        )
+
+
+def rebuild_counts(connection: Connection):
+    """Recompute every count from the source tables"""
+    activity_table = models.ActivityOrganizationCount.__table__
+    building_table = models.BuildingOrganizationCount.__table__
+    connection.execute(delete(activity_table))
+    connection.execute(delete(building_table))
+    connection.execute(
+        activity_table.insert().from_select(
+            ["activity_id", "organization_count"], _subtree_counts_select()
+        )
+    )
+    connection.execute(
+        building_table.insert().from_select(
+            ["building_id", "organization_count"], _building_counts_select()
+        )
+    )
+
+
+def activity_counts(db: Session) -> Dict[int, int]:
+    table = models.ActivityOrganizationCount
+    return dict(db.execute(select(table.activity_id, table.organization_count)).all())
+
+
+def building_counts(db: Session) -> Dict[int, int]:
+    table = models.BuildingOrganizationCount
+    return dict(db.execute(select(table.building_id, table.organization_count)).all())
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changes(session, flush_context, instances):
+    pending = session.info.setdefault(
+        PENDING_KEY, {"activities": [], "buildings": [], "removed": set()}
+    )
+    activities = pending["activities"]
+    buildings = pending["buildings"]
+
+    for obj in session.new:
+        if isinstance(obj, models.Organization):
+            activities.extend(obj.activities)
+            buildings.append(obj.building_id or obj.building)
+        elif isinstance(obj, models.Activity) and obj.organizations:
+            activities.append(obj)
+
+    moved = []
+    reparented = []
+    for obj in session.dirty:
+        if isinstance(obj, models.Organization):
+            activities.extend(history_values(obj, "activities"))
+            moves = history_values(obj, "building_id") + history_values(obj, "building")
+            if moves:
+                buildings.extend(moves)
+                moved.append(obj.id)
+        elif isinstance(obj, models.Activity):
+            if history_values(obj, "organizations"):
+                activities.append(obj)
+            parents = history_values(obj, "parent_id") + history_values(obj, "parent")
+            if parents:
+                activities.append(obj)
+                activities.extend(parents)
+                reparented.append(obj.id)
+
+    # Expired attributes carry no old value in their history
+    connection = session.connection()
+    if moved:
+        buildings.extend(
+            connection.execute(
+                select(models.Organization.building_id).where(
+                    models.Organization.id.in_(moved)
+                )
+            ).scalars()
+        )
+    if reparented:
+        activities.extend(
+            connection.execute(
+                select(models.Activity.parent_id).where(
+                    models.Activity.id.in_(reparented)
+                )
+            ).scalars()
+        )
+
+    for obj in session.deleted:
+        if isinstance(obj, models.Organization):
+            activities.extend(obj.activities)
+            buildings.append(obj.building_id)
+        elif isinstance(obj, models.Activity):
+            pending["removed"].add(obj.id)
+            activities.append(obj.parent_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_changes(session, flush_context):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    connection = session.connection()
+    removed = pending["removed"]
+    if removed:
+        table = models.ActivityOrganizationCount.__table__
+        connection.execute(delete(table).where(table.c.activity_id.in_(removed)))
+    refresh_activity_counts(connection, resolve_ids(pending["activities"]) - removed)
+    refresh_building_counts(connection, resolve_ids(pending["buildings"]))
+
+
+def main(argv):
+    if argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.facets rebuild")
+        return 2
+
+    from app.database import get_engine
+
+    with get_engine().begin() as connection:
+        rebuild_counts(connection)
+    print("Facet counts rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
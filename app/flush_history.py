@@ -0,0 +1,29 @@
+"""
+Helpers for the flush hooks that keep derived tables current.
+
+``facets`` and ``ancestry`` collect the objects a flush touches in
+``before_flush`` and refresh their tables in ``after_flush``, once new rows
+have their ids.
+"""
+
+from typing import Iterable, List, Set
+
+from sqlalchemy import inspect
+
+
+def history_values(obj, attribute: str) -> List:
+    """Values added to and removed from ``attribute`` since the last flush"""
+    history = inspect(obj).attrs[attribute].history
+    return list(history.added or ()) + list(history.deleted or ())
+
+
+def resolve_ids(refs: Iterable) -> Set[int]:
+    """Ids of ``refs``, a mix of ids, objects and ``None``"""
+    ids = set()
+    for ref in refs:
+        if ref is None:
+            continue
+        ref_id = ref if isinstance(ref, int) else ref.id
+        if ref_id is not None:
+            ids.add(ref_id)
+    return ids
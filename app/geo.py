@@ -0,0 +1,215 @@
+import heapq
+import math
+import sqlite3
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+
+    R = EARTH_RADIUS_KM
+
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (
+        math.sin(delta_lat / 2) ** 2
+        + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
+    )
+    c = 2 * math.asin(math.sqrt(a))
+
+    return R * c
+
+
+def haversine_sql(lat1: float, lon1: float, lat2_col, lon2_col):
+    """SQL expression for the distance in km from a point to coordinate columns"""
+    a = func.power(func.sin(func.radians(lat2_col - lat1) * 0.5), 2) + func.cos(
+        math.radians(lat1)
+    ) * func.cos(func.radians(lat2_col)) * func.power(
+        func.sin(func.radians(lon2_col - lon1) * 0.5), 2
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(a))
+
+
+def radius_bounding_box(
+    latitude: float, longitude: float, radius: float
+) -> Tuple[float, float, float, float]:
+    """Rectangle (min_lat, max_lat, min_lon, max_lon) enclosing a search circle"""
+    delta_lat = radius / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(latitude))
+    min_lat = max(latitude - delta_lat, -90.0)
+    max_lat = min(latitude + delta_lat, 90.0)
+    if cos_lat < 1e-6 or min_lat == -90.0 or max_lat == 90.0:
+        # The circle covers a pole
+        return min_lat, max_lat, -180.0, 180.0
+
+    delta_lon = radius / (KM_PER_DEGREE * cos_lat)
+    if longitude - delta_lon < -180 or longitude + delta_lon > 180:
+        # The circle wraps around the antimeridian
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def polygon_bounding_box(
+    polygon: Sequence[Tuple[float, float]]
+) -> Tuple[float, float, float, float]:
+    """Rectangle (min_lat, max_lat, min_lon, max_lon) enclosing a polygon"""
+    latitudes = [vertex[0] for vertex in polygon]
+    longitudes = [vertex[1] for vertex in polygon]
+    return min(latitudes), max(latitudes), min(longitudes), max(longitudes)
+
+
+def point_in_polygon(
+    latitude: float, longitude: float, polygon: Sequence[Tuple[float, float]]
+) -> bool:
+    """Ray casting on plain coordinates; fine for city-sized polygons"""
+    inside = False
+    previous_lat, previous_lon = polygon[-1]
+    for vertex_lat, vertex_lon in polygon:
+        if (vertex_lat > latitude) != (previous_lat > latitude):
+            crossing = vertex_lon + (latitude - vertex_lat) * (
+                previous_lon - vertex_lon
+            ) / (previous_lat - vertex_lat)
+            if longitude < crossing:
+                inside = not inside
+        previous_lat, previous_lon = vertex_lat, vertex_lon
+    return inside
+
+
+def match_radii(
+    points: Callable[[float, float], Iterable[Sequence]],
+    circles: Sequence[Tuple[float, float, float]],
+) -> List[List[int]]:
+    """Ids of the points within each (latitude, longitude, radius) circle
+
+    ``points(min_lat, max_lat)`` yields ``(id, latitude, longitude, ...)`` in
+    latitude order. The latitude bands of the circles are merged and swept
+    once: each point is read a single time and tested only against the
+    circles whose band contains it, however many circles overlap.
+    """
+    boxes = [radius_bounding_box(*circle) for circle in circles]
+    order = sorted(range(len(circles)), key=lambda i: boxes[i][0])
+    bands: List[List[float]] = []
+    for i in order:
+        min_lat, max_lat = boxes[i][0], boxes[i][1]
+        if bands and min_lat <= bands[-1][1]:
+            bands[-1][1] = max(bands[-1][1], max_lat)
+        else:
+            bands.append([min_lat, max_lat])
+
+    results: List[List[int]] = [[] for _ in circles]
+    active: List[Tuple[float, int]] = []  # (max_lat, circle) heap
+    waiting = 0
+    for min_lat, max_lat in bands:
+        for point in points(min_lat, max_lat):
+            point_id, latitude, longitude = point[0], point[1], point[2]
+            while waiting < len(order) and boxes[order[waiting]][0] <= latitude:
+                i = order[waiting]
+                heapq.heappush(active, (boxes[i][1], i))
+                waiting += 1
+            while active and active[0][0] < latitude:
+                heapq.heappop(active)
+            for _, i in active:
+                center_lat, center_lon, radius = circles[i]
+                if (
+                    boxes[i][2] <= longitude <= boxes[i][3]
+                    and haversine_distance(center_lat, center_lon, latitude, longitude)
+                    <= radius
+                ):
+                    results[i].append(point_id)
+    return results
+
+
+class GeoIndex:
+    """Building coordinates sorted by latitude for box and radius lookups"""
+
+    def __init__(self, buildings: Iterable[Tuple[int, float, float]]):
+        rows = sorted(buildings, key=lambda row: row[1])
+        self.ids = [row[0] for row in rows]
+        self.latitudes = [row[1] for row in rows]
+        self.longitudes = [row[2] for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _latitude_range(self, min_lat: float, max_lat: float) -> range:
+        return range(
+            bisect_left(self.latitudes, min_lat),
+            bisect_right(self.latitudes, max_lat),
+        )
+
+    def in_rectangle(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[int]:
+        return [
+            self.ids[i]
+            for i in self._latitude_range(min_lat, max_lat)
+            if min_lon <= self.longitudes[i] <= max_lon
+        ]
+
+    def points_in_rectangle(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[Tuple[int, float, float]]:
+        """(id, latitude, longitude) of the buildings in the rectangle"""
+        return [
+            (self.ids[i], self.latitudes[i], self.longitudes[i])
+            for i in self._latitude_range(min_lat, max_lat)
+            if min_lon <= self.longitudes[i] <= max_lon
+        ]
+
+    def in_polygon(self, polygon: Sequence[Tuple[float, float]]) -> List[int]:
+        min_lat, max_lat, min_lon, max_lon = polygon_bounding_box(polygon)
+        return [
+            self.ids[i]
+            for i in self._latitude_range(min_lat, max_lat)
+            if min_lon <= self.longitudes[i] <= max_lon
+            and point_in_polygon(self.latitudes[i], self.longitudes[i], polygon)
+        ]
+
+    def in_radii(
+        self, circles: Sequence[Tuple[float, float, float]]
+    ) -> List[List[int]]:
+        return match_radii(
+            lambda min_lat, max_lat: self.points_in_rectangle(
+                min_lat, max_lat, -180.0, 180.0
+            ),
+            circles,
+        )
+
+    def in_radius(self, latitude: float, longitude: float, radius: float) -> List[int]:
+        min_lat, max_lat, min_lon, max_lon = radius_bounding_box(
+            latitude, longitude, radius
+        )
+        return [
+            self.ids[i]
+            for i in self._latitude_range(min_lat, max_lat)
+            if min_lon <= self.longitudes[i] <= max_lon
+            and haversine_distance(
+                latitude, longitude, self.latitudes[i], self.longitudes[i]
+            )
+            <= radius
+        ]
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_math(dbapi_connection, connection_record):
+    # SQLite builds without SQLITE_ENABLE_MATH_FUNCTIONS lack trigonometry
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    for name, arity, fn in (
+        ("sin", 1, math.sin),
+        ("cos", 1, math.cos),
+        ("asin", 1, math.asin),
+        ("sqrt", 1, math.sqrt),
+        ("radians", 1, math.radians),
+        ("power", 2, math.pow),
+    ):
+        dbapi_connection.create_function(name, arity, fn, deterministic=True)
@@ -0,0 +1,501 @@
+"""
+Bulk import of partner directory dumps.
+
+    python -m app.importer buildings buildings.csv
+    python -m app.importer activities activities.ndjson
+    python -m app.importer organizations organizations.csv --batch-size 5000
+
+Input is streamed as CSV (header row) or NDJSON and validated in batches with
+the ``schemas.*Create`` models; an NDJSON line that is not valid JSON is
+rejected like a record that fails validation. In CSV, ``phone_numbers`` and
+``activity_ids`` hold ``;``-separated lists. Records may carry an ``id``;
+records without one get the next free ids. References (``building_id``,
+``parent_id``, ``activity_ids``) must point at rows already in the database
+or earlier in the same file, and an activity's level is derived from its
+parent. Invalid records are counted and, with ``--rejects``, written there.
+
+Every batch is written in its own transaction, with ``COPY`` on PostgreSQL
+and a multi-row ``executemany`` elsewhere, and then recorded in a checkpoint
+file next to the input. An interrupted import resumes after the last
+recorded batch; rows whose ids already exist are skipped, so re-running a
+batch is harmless. Facet counts, sequences and the directory version are
+refreshed once at the end.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app import ancestry, facets, models, schemas, versioning
+
+LIST_SEPARATOR = ";"
+MAX_ACTIVITY_LEVEL = 3
+
+
+class ImportStats:
+    def __init__(self, records: int = 0, imported: int = 0, rejected: int = 0):
+        self.records = records
+        self.imported = imported
+        self.skipped = 0
+        self.rejected = rejected
+        self.elapsed = 0.0
+        # Rows from before a resume do not count towards this run's rate
+        self._resumed = imported
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return (self.imported - self._resumed) / self.elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            "records": self.records,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "elapsed_s": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+class Rejected(ValueError):
+    pass
+
+
+class MalformedLine(Rejected):
+    """Stands in for an input line that does not parse as a record"""
+
+    def __init__(self, line_number: int, error: str, text: str):
+        super().__init__(f"Line {line_number}: {error}")
+        self.line_number = line_number
+        self.text = text
+
+
+def read_csv(stream: TextIO) -> Iterator[dict]:
+    for row in csv.DictReader(stream):
+        record = {key: (value if value != "" else None) for key, value in row.items()}
+        for field in ("phone_numbers", "activity_ids"):
+            if field in record:
+                value = record[field]
+                record[field] = value.split(LIST_SEPARATOR) if value else []
+        yield record
+
+
+def read_ndjson(stream: TextIO) -> Iterator[dict]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            # Keeps its position so checkpoints still count every line
+            yield MalformedLine(line_number, str(exc), line.rstrip("\n"))
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return "ndjson" if extension in (".ndjson", ".jsonl", ".json") else "csv"
+
+
+def _batched(records: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _existing_ids(connection: Connection, model, ids: Iterable[int]) -> Set[int]:
+    ids = list(ids)
+    if not ids:
+        return set()
+    return set(connection.execute(select(model.id).where(model.id.in_(ids))).scalars())
+
+
+def _next_id(connection: Connection, model) -> int:
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _copy_value(value) -> str:
+    # Unquoted empty is NULL in COPY's CSV format, quoted empty is ''
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+def write_rows(connection: Connection, table: Table, rows: List[dict]) -> None:
+    """Insert ``rows`` with COPY on PostgreSQL, executemany elsewhere"""
+    if not rows:
+        return
+    if connection.dialect.name != "postgresql":
+        connection.execute(table.insert(), rows)
+        return
+
+    columns = list(rows[0])
+    data = "".join(
+        ",".join(_copy_value(row[column]) for column in columns) + "\n" for row in rows
+    )
+    statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(statement, io.StringIO(data))
+        else:  # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(data)
+    finally:
+        cursor.close()
+
+
+def sync_sequences(connection: Connection) -> None:
+    """Move PostgreSQL id sequences past rows inserted with explicit ids"""
+    if connection.dialect.name != "postgresql":
+        return
+    for model in (models.Building, models.Activity, models.Organization):
+        table = model.__tablename__
+        connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+        )
+
+
+class Loader:
+    """Validates, resolves and writes batches of one kind of record"""
+
+    schema = None
+    model = None
+
+    def __init__(self, first_id: int):
+        self.first_id = first_id
+
+    def validate(self, record: dict, position: int) -> Tuple[int, BaseModel]:
+        record_id = record.get("id")
+        try:
+            item = self.schema.model_validate(record)
+            record_id = int(record_id) if record_id is not None else None
+        except (ValidationError, TypeError, ValueError) as exc:
+            raise Rejected(str(exc)) from None
+        # Ids follow the record position so a retried batch gets the same ones
+        return (record_id if record_id is not None else self.first_id + position), item
+
+    def write(
+        self, connection: Connection, items: List[Tuple[int, BaseModel]], version: int
+    ) -> Dict[int, str]:
+        """Write valid items stamped with ``version``; return rejections by id"""
+        raise NotImplementedError
+
+
+class BuildingLoader(Loader):
+    schema = schemas.BuildingCreate
+    model = models.Building
+
+    def write(self, connection, items, version):
+        write_rows(
+            connection,
+            models.Building.__table__,
+            [
+                {"id": id_, **item.model_dump(), "row_version": version}
+                for id_, item in items
+            ],
+        )
+        return {}
+
+
+class ActivityLoader(Loader):
+    schema = schemas.ActivityCreate
+    model = models.Activity
+
+    def write(self, connection, items, version):
+        parents = {item.parent_id for _, item in items if item.parent_id is not None}
+        table = models.Activity
+        levels = dict(
+            connection.execute(
+                select(table.id, table.level).where(table.id.in_(parents))
+            ).all()
+        )
+        rows, rejected = [], {}
+        # Parents must come before their children in the input
+        for id_, item in items:
+            if item.parent_id is None:
+                level = 1
+            elif item.parent_id in levels:
+                level = levels[item.parent_id] + 1
+            else:
+                rejected[id_] = f"Unknown parent_id {item.parent_id}"
+                continue
+            if level > MAX_ACTIVITY_LEVEL:
+                rejected[id_] = (
+                    f"Activity tree is limited to {MAX_ACTIVITY_LEVEL} levels"
+                )
+                continue
+            levels[id_] = level
+            rows.append(
+                {
+                    "id": id_,
+                    "name": item.name,
+                    "parent_id": item.parent_id,
+                    "level": level,
+                    "row_version": version,
+                }
+            )
+        write_rows(connection, models.Activity.__table__, rows)
+        return rejected
+
+
+class OrganizationLoader(Loader):
+    schema = schemas.OrganizationCreate
+    model = models.Organization
+
+    def write(self, connection, items, version):
+        buildings = _existing_ids(
+            connection, models.Building, {item.building_id for _, item in items}
+        )
+        activities = _existing_ids(
+            connection,
+            models.Activity,
+            {activity_id for _, item in items for activity_id in item.activity_ids},
+        )
+        organizations, phones, links, rejected = [], [], [], {}
+        for id_, item in items:
+            if item.building_id not in buildings:
+                rejected[id_] = f"Unknown building_id {item.building_id}"
+                continue
+            unknown = set(item.activity_ids) - activities
+            if unknown:
+                rejected[id_] = f"Unknown activity_ids {sorted(unknown)}"
+                continue
+            organizations.append(
+                {
+                    "id": id_,
+                    "name": item.name,
+                    "building_id": item.building_id,
+                    "row_version": version,
+                }
+            )
+            phones.extend(
+                {"organization_id": id_, "number": number}
+                for number in item.phone_numbers
+            )
+            links.extend(
+                {"organization_id": id_, "activity_id": activity_id}
+                for activity_id in sorted(set(item.activity_ids))
+            )
+        write_rows(connection, models.Organization.__table__, organizations)
+        write_rows(connection, models.PhoneNumber.__table__, phones)
+        write_rows(connection, models.organization_activity, links)
+        return rejected
+
+
+LOADERS = {
+    "buildings": BuildingLoader,
+    "activities": ActivityLoader,
+    "organizations": OrganizationLoader,
+}
+
+
+def _load_checkpoint(path: Optional[str], source: str, kind: str) -> Optional[dict]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint.get("source") != source or checkpoint.get("kind") != kind:
+        raise ValueError(f"Checkpoint {path} belongs to another import")
+    return checkpoint
+
+
+def _save_checkpoint(path: Optional[str], checkpoint: dict) -> None:
+    if not path:
+        return
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary, path)
+
+
+def import_records(
+    engine: Engine,
+    kind: str,
+    records: Iterable[dict],
+    batch_size: int = 5000,
+    checkpoint_path: Optional[str] = None,
+    source: str = "",
+    rejects: Optional[TextIO] = None,
+    progress=None,
+) -> ImportStats:
+    """Import ``records`` of ``kind``, resuming from ``checkpoint_path``"""
+    loader_class = LOADERS[kind]
+    checkpoint = _load_checkpoint(checkpoint_path, source, kind)
+    if checkpoint is None:
+        with engine.connect() as connection:
+            first_id = _next_id(connection, loader_class.model)
+        checkpoint = {"source": source, "kind": kind, "first_id": first_id}
+        checkpoint.update(records=0, imported=0, rejected=0)
+        _save_checkpoint(checkpoint_path, checkpoint)
+    loader = loader_class(checkpoint["first_id"])
+    stats = ImportStats(
+        checkpoint["records"], checkpoint["imported"], checkpoint["rejected"]
+    )
+
+    started = time.perf_counter()
+    remaining = iter(records)
+    # Skip what the checkpoint says is already in
+    for _ in range(checkpoint["records"]):
+        next(remaining, None)
+
+    for batch in _batched(remaining, batch_size):
+        items, errors, positions = [], [], {}
+        for offset, record in enumerate(batch):
+            position = stats.records + offset
+            if isinstance(record, MalformedLine):
+                errors.append((position, record.text, str(record)))
+                continue
+            try:
+                id_, item = loader.validate(record, position)
+            except Rejected as exc:
+                errors.append((position, record, str(exc)))
+                continue
+            # Explicit ids may repeat or take a later record's positional id;
+            # one such row would fail the whole batch's insert
+            if id_ in positions:
+                errors.append(
+                    (position, record, f"Id {id_} appears more than once in batch")
+                )
+                continue
+            positions[id_] = position
+            items.append((id_, item))
+
+        with engine.begin() as connection:
+            existing = _existing_ids(
+                connection, loader.model, [id_ for id_, _ in items]
+            )
+            new_items = [(id_, item) for id_, item in items if id_ not in existing]
+            reasons = {}
+            if new_items:
+                version = versioning.bump_versions(connection, [loader.model])
+                reasons = loader.write(connection, new_items, version)
+
+        for id_, reason in reasons.items():
+            errors.append((positions.get(id_), None, reason))
+        stats.records += len(batch)
+        stats.skipped += len(items) - len(new_items)
+        stats.imported += len(new_items) - len(reasons)
+        stats.rejected += len(errors)
+        stats.elapsed = time.perf_counter() - started
+
+        if rejects is not None:
+            for position, record, reason in errors:
+                rejects.write(
+                    json.dumps(
+                        {"record": position, "error": reason, "data": record},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+        checkpoint.update(
+            records=stats.records, imported=stats.imported, rejected=stats.rejected
+        )
+        _save_checkpoint(checkpoint_path, checkpoint)
+        if progress is not None:
+            progress(stats)
+
+    with engine.begin() as connection:
+        sync_sequences(connection)
+        if kind == "organizations":
+            # COPY and executemany bypass the session hooks that keep these current
+            facets.rebuild_counts(connection)
+            ancestry.rebuild(connection)
+        versioning.bump_versions(connection, [loader_class.model])
+    stats.elapsed = time.perf_counter() - started
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return stats
+
+
+def import_file(
+    engine: Engine,
+    kind: str,
+    path: str,
+    format: Optional[str] = None,
+    batch_size: int = 5000,
+    checkpoint_path: Optional[str] = None,
+    rejects: Optional[TextIO] = None,
+    progress=None,
+) -> ImportStats:
+    reader = READERS[format or detect_format(path)]
+    with open(path, newline="", encoding="utf-8") as stream:
+        return import_records(
+            engine,
+            kind,
+            reader(stream),
+            batch_size=batch_size,
+            checkpoint_path=checkpoint_path,
+            source=os.path.abspath(path),
+            rejects=rejects,
+            progress=progress,
+        )
+
+
+def _print_progress(stats: ImportStats) -> None:
+    print(
+        f"{stats.records} records, {stats.imported} imported, "
+        f"{stats.rejected} rejected, {stats.rows_per_second:.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("kind", choices=sorted(LOADERS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(READERS))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--checkpoint", help="Checkpoint file (default: <path>.checkpoint)"
+    )
+    parser.add_argument("--rejects", help="Write rejected records here as NDJSON")
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    from app.database import get_engine
+
+    rejects = open(args.rejects, "a", encoding="utf-8") if args.rejects else None
+    try:
+        stats = import_file(
+            get_engine(args.database_url),
+            args.kind,
+            args.path,
+            format=args.format,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint or f"{args.path}.checkpoint",
+            rejects=rejects,
+            progress=_print_progress,
+        )
+    finally:
+        if rejects is not None:
+            rejects.close()
+    print(json.dumps(stats.as_dict()))
+    return 0 if stats.rejected == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,161 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-import math
-from app.database import get_db
-from app import models, schemas
-from app.auth import verify_api_key
-
-app = FastAPI(
-    title="Organizations Directory API",
-    description="REST API для справочника Организаций, Зданий и Деятельности",
-    version="1.0.0",
+from typing import Dict, List, Literal, Optional, Tuple
+from urllib.parse import urlencode
+from app.database import get_db, get_engine
+from app import (
+    cache,
+    changes,
+    clusters,
+    events,
+    export,
+    facets,
+    memory,
+    models,
+    queries,
+    schemas,
 )
-
-
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-
-    R = 6371  # Radius of the Earth in kilometers
-
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-
-    a = (
-        math.sin(delta_lat / 2) ** 2
-        + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
+from app.auth import verify_api_key, verify_privileged_key
+from app.batch import run_batch
+from app.bulk import upsert_organizations
+from app.config import Settings, get_settings
+from app.search import OrganizationFilter, activity_subtree_ids, search_organizations
+from app.snapshot import (
+    BaseSnapshot,
+    DatabaseSource,
+    SnapshotRefresher,
+    get_snapshot,
+    reload_snapshot,
+)
+from app.canonical import canonical_location_query
+from app.responses import list_response, with_headers
+from app.timing import ServerTimingMiddleware, TimedRoute
+from app.versioning import current_version
+from app.warmup import warm_up
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+
+async def _warm_up_until_ready(app: FastAPI, settings: Settings) -> None:
+    engine = get_engine(settings.database_url)
+    while True:
+        try:
+            await asyncio.to_thread(warm_up, engine, settings.warmup_connections)
+        except Exception:
+            logger.exception("Warmup failed, retrying")
+            await asyncio.sleep(settings.warmup_retry_interval)
+        else:
+            app.state.ready = True
+            return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    app.state.ready = False
+    memory.start_tracemalloc(settings.tracemalloc_frames)
+    refresher = None
+    warmup = None
+    if settings.snapshot_mode:
+        if settings.snapshot_path:
+            from app.snapshot_file import FileSource
+
+            source = FileSource(settings.snapshot_path)
+        else:
+            source = DatabaseSource(get_engine(settings.database_url))
+        reload_snapshot(source)
+        refresher = SnapshotRefresher(source, settings.snapshot_refresh_interval)
+        refresher.start()
+        app.state.ready = True
+    elif settings.warmup_enabled:
+        warmup = asyncio.create_task(_warm_up_until_ready(app, settings))
+    else:
+        app.state.ready = True
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    if refresher is not None:
+        refresher.stop()
+    if app.state.trace_writer is not None:
+        app.state.trace_writer.close()
+    if settings.metrics_enabled:
+        from app import metrics
+
+        metrics.mark_process_dead()
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the application; the database engine is created on first request"""
+    application = FastAPI(
+        title="Organizations Directory API",
+        description="REST API для справочника Организаций, Зданий и Деятельности",
+        version="1.0.0",
+        lifespan=lifespan,
     )
-    c = 2 * math.asin(math.sqrt(a))
-
-    return R * c
+    application.state.settings = settings or get_settings()
+    application.include_router(router)
+    application.add_middleware(memory.InFlightMiddleware)
+    application.add_middleware(
+        ServerTimingMiddleware,
+        header=application.state.settings.server_timing,
+        slow_query_ms=application.state.settings.slow_query_ms,
+    )
+    application.state.trace_writer = None
+    if application.state.settings.trace_sample_rate > 0:
+        from app.trace import TraceCaptureMiddleware, TraceWriter
 
+        application.state.trace_writer = TraceWriter(
+            application.state.settings.trace_path
+        )
+        application.add_middleware(
+            TraceCaptureMiddleware,
+            writer=application.state.trace_writer,
+            sample_rate=application.state.settings.trace_sample_rate,
+            max_body_bytes=application.state.settings.trace_max_body_bytes,
+        )
+    if application.state.settings.profile_api_key:
+        from app.profiling import ProfilingMiddleware
+
+        application.add_middleware(
+            ProfilingMiddleware,
+            api_key=application.state.settings.profile_api_key,
+            directory=application.state.settings.profile_dir,
+            interval_ms=application.state.settings.profile_interval_ms,
+        )
+    if application.state.settings.metrics_enabled:
+        from app import metrics
+
+        application.add_middleware(metrics.MetricsMiddleware)
+        application.router.add_api_route(
+            "/metrics",
+            metrics.render,
+            include_in_schema=False,
+            route_class_override=TimedRoute,
+        )
+    return application
 
-def get_all_child_activity_ids(db: Session, activity_id: int) -> List[int]:
 
-    activity_ids = [activity_id]
+_app: Optional[FastAPI] = None
 
-    def get_children(parent_id: int):
-        children = (
-            db.query(models.Activity)
-            .filter(models.Activity.parent_id == parent_id)
-            .all()
-        )
-        for child in children:
-            activity_ids.append(child.id)
-            get_children(child.id)
 
-    get_children(activity_id)
-    return activity_ids
+def __getattr__(name: str):
+    # ``app.main:app`` is built on first access so that importing the module
+    # does not read the configuration
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-@app.get("/", tags=["Root"])
+@router.get("/", tags=["Root"])
 async def root():
 
     return {
@@ -59,262 +165,695 @@ async def root():
     }
 
 
-@app.get(
+@router.get("/ready", tags=["Root"])
+async def ready(request: Request):
+
+    if not request.app.state.ready:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready"}
+
+
+@router.get(
     "/organizations/",
     response_model=List[schemas.OrganizationDetail],
     tags=["Organizations"],
 )
 async def list_organizations(
-    db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)
+    request: Request,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    if snapshot is not None:
+        return list_response(
+            request, snapshot.list_organizations(), schemas.OrganizationDetail
+        )
+
+    organizations = db.query(models.Organization).options(*queries.ORGANIZATION_DETAIL)
+    return list_response(request, organizations, schemas.OrganizationDetail)
+
+
+@router.get(
+    "/organizations/search",
+    response_model=schemas.OrganizationSearchPage,
+    tags=["Organizations"],
+)
+async def search_organizations_combined(
+    activity_id: Optional[int] = Query(None, description="Activity filter"),
+    include_children: bool = Query(
+        True, description="Include organizations from child activities"
+    ),
+    name: Optional[str] = Query(None, description="Substring of organization name"),
+    building_id: Optional[int] = Query(None),
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    radius: Optional[float] = Query(
+        None, gt=0, description="Search radius in kilometers"
+    ),
+    min_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    max_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    min_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    max_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    sort: Literal["name", "id", "distance"] = Query("name"),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    search = OrganizationFilter(
+        activity_id=activity_id,
+        include_children=include_children,
+        name=name,
+        building_id=building_id,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        min_latitude=min_latitude,
+        max_latitude=max_latitude,
+        min_longitude=min_longitude,
+        max_longitude=max_longitude,
+    )
+    try:
+        search.validate(sort)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if snapshot is not None:
+        organizations, total = snapshot.search(search, sort, limit, offset)
+    else:
+        organizations, total = search_organizations(db, search, sort, limit, offset)
+    return {"total": total, "limit": limit, "offset": offset, "items": organizations}
+
+
+@router.post(
+    "/organizations/bulk",
+    response_model=schemas.OrganizationBulkResponse,
+    tags=["Organizations"],
+)
+async def bulk_upsert_organizations(
+    payload: schemas.OrganizationBulkRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
 ):
 
-    organizations = db.query(models.Organization).all()
-    return organizations
+    max_items = request.app.state.settings.bulk_max_items
+    if len(payload.items) > max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A bulk request may contain at most {max_items} items",
+        )
+    return upsert_organizations(db, payload.items)
 
 
-@app.get(
+@router.get(
+    "/organizations/clusters",
+    response_model=schemas.ClusterResponse,
+    tags=["Organizations"],
+)
+async def get_organization_clusters(
+    min_latitude: float = Query(..., ge=-90, le=90),
+    max_latitude: float = Query(..., ge=-90, le=90),
+    min_longitude: float = Query(..., ge=-180, le=180),
+    max_longitude: float = Query(..., ge=-180, le=180),
+    zoom: Optional[int] = Query(None, ge=0, le=24, description="Map zoom level"),
+    cell_size: Optional[float] = Query(
+        None, gt=0, le=90, description="Cell edge in degrees; instead of zoom"
+    ),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    if (zoom is None) == (cell_size is None):
+        raise HTTPException(
+            status_code=400, detail="Please provide either 'zoom' or 'cell_size'"
+        )
+    if cell_size is None:
+        cell_size = clusters.zoom_cell_size(zoom)
+
+    if snapshot is not None:
+        grid = clusters.snapshot_grid(snapshot)
+    else:
+        grid = cache.cluster_grid.get(db)
+    try:
+        cells = grid.cells(
+            cell_size, min_latitude, max_latitude, min_longitude, max_longitude
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"cell_size": cell_size, "cells": cells}
+
+
+@router.get(
     "/organizations/{organization_id}",
     response_model=schemas.OrganizationDetail,
     tags=["Organizations"],
 )
 async def get_organization(
     organization_id: int,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    organization = (
-        db.query(models.Organization)
-        .filter(models.Organization.id == organization_id)
-        .first()
-    )
+    if snapshot is not None:
+        organization = snapshot.get_organization(organization_id)
+        if organization is None:
+            raise HTTPException(status_code=404, detail="Organization not found")
+        return organization
+
+    organization = queries.get_organization(db, organization_id)
     if not organization:
         raise HTTPException(status_code=404, detail="Organization not found")
     return organization
 
 
-@app.get(
+@router.get(
     "/organizations/building/{building_id}",
     response_model=List[schemas.OrganizationDetail],
     tags=["Organizations"],
 )
 async def get_organizations_by_building(
+    request: Request,
     building_id: int,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    building = (
-        db.query(models.Building).filter(models.Building.id == building_id).first()
-    )
+    if snapshot is not None:
+        if snapshot.get_building(building_id) is None:
+            raise HTTPException(status_code=404, detail="Building not found")
+        return list_response(
+            request,
+            snapshot.organizations_by_building(building_id),
+            schemas.OrganizationDetail,
+        )
+
+    building = queries.get_building(db, building_id)
     if not building:
         raise HTTPException(status_code=404, detail="Building not found")
 
-    organizations = (
-        db.query(models.Organization)
-        .filter(models.Organization.building_id == building_id)
-        .all()
-    )
-    return organizations
+    organizations = queries.organizations_in_building(db, building_id)
+    return list_response(request, organizations, schemas.OrganizationDetail)
 
 
-@app.get(
+@router.get(
     "/organizations/activity/{activity_id}",
     response_model=List[schemas.OrganizationDetail],
     tags=["Organizations"],
 )
 async def get_organizations_by_activity(
+    request: Request,
     activity_id: int,
     include_children: bool = Query(
         True, description="Include organizations from child activities"
     ),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    activity = (
-        db.query(models.Activity).filter(models.Activity.id == activity_id).first()
-    )
+    if snapshot is not None:
+        if snapshot.get_activity(activity_id) is None:
+            raise HTTPException(status_code=404, detail="Activity not found")
+        return list_response(
+            request,
+            snapshot.organizations_by_activity(activity_id, include_children),
+            schemas.OrganizationDetail,
+        )
+
+    activity = queries.get_activity(db, activity_id)
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
 
     if include_children:
 
-        activity_ids = get_all_child_activity_ids(db, activity_id)
-
-        organizations = (
-            db.query(models.Organization)
-            .join(models.organization_activity)
-            .filter(models.organization_activity.c.activity_id.in_(activity_ids))
-            .distinct()
-            .all()
-        )
+        organizations = queries.organizations_under_activity(db, activity_id)
     else:
 
         organizations = (
             db.query(models.Organization)
+            .options(*queries.ORGANIZATION_DETAIL)
             .join(models.organization_activity)
             .filter(models.organization_activity.c.activity_id == activity_id)
-            .all()
         )
 
-    return organizations
+    return list_response(request, organizations, schemas.OrganizationDetail)
 
 
-@app.get(
+@router.get(
     "/organizations/search/by-name",
     response_model=List[schemas.OrganizationDetail],
     tags=["Organizations"],
 )
 async def search_organizations_by_name(
+    request: Request,
     name: str = Query(..., description="Search query for organization name"),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
+    if snapshot is not None:
+        return list_response(
+            request, snapshot.search_by_name(name), schemas.OrganizationDetail
+        )
+
     organizations = (
         db.query(models.Organization)
+        .options(*queries.ORGANIZATION_DETAIL)
         .filter(models.Organization.name.ilike(f"%{name}%"))
-        .all()
     )
-    return organizations
+    return list_response(request, organizations, schemas.OrganizationDetail)
 
 
-@app.post(
+def find_organizations_by_location(
+    request: Request,
+    snapshot: Optional[BaseSnapshot],
+    db: Session,
+    circle: Optional[Tuple[float, float, float]] = None,
+    polygon: Optional[List[Tuple[float, float]]] = None,
+    rectangle: Optional[List[float]] = None,
+):
+    """Organizations in a circle, else in a polygon, else in a rectangle"""
+    if snapshot is not None:
+        if circle is not None:
+            organizations = snapshot.organizations_in_radius(*circle)
+        elif polygon is not None:
+            organizations = snapshot.organizations_in_polygon(polygon)
+        else:
+            organizations = snapshot.organizations_in_rectangle(*rectangle)
+        return list_response(request, organizations, schemas.OrganizationDetail)
+
+    index = cache.geo_index.get(db)
+    if circle is not None:
+        matching_building_ids = index.in_radius(*circle)
+    elif polygon is not None:
+        matching_building_ids = index.in_polygon(polygon)
+    else:
+        matching_building_ids = index.in_rectangle(*rectangle)
+
+    organizations = (
+        db.query(models.Organization)
+        .options(*queries.ORGANIZATION_DETAIL)
+        .filter(models.Organization.building_id.in_(matching_building_ids))
+    )
+
+    return list_response(request, organizations, schemas.OrganizationDetail)
+
+
+@router.get(
+    "/organizations/search/by-location",
+    response_model=List[schemas.OrganizationDetail],
+    tags=["Organizations"],
+)
+async def search_organizations_by_location_cacheable(
+    request: Request,
+    response: Response,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    radius: Optional[float] = Query(
+        None, gt=0, description="Search radius in kilometers"
+    ),
+    min_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    max_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    min_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    max_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    settings = request.app.state.settings
+    try:
+        canonical = canonical_location_query(
+            latitude,
+            longitude,
+            radius,
+            min_latitude,
+            max_latitude,
+            min_longitude,
+            max_longitude,
+            settings.location_precision,
+            settings.location_radius_precision,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    query = urlencode(canonical)
+    if request.url.query != query:
+        # The mapping never changes, so caches may keep the redirect for long
+        return RedirectResponse(
+            f"{request.url.path}?{query}",
+            status_code=308,
+            headers={"Cache-Control": "public, max-age=86400"},
+        )
+
+    version = (
+        snapshot.version if snapshot is not None else current_version(db.connection())
+    )
+    headers = {
+        "Cache-Control": f"public, max-age={settings.location_cache_max_age}",
+        "ETag": f'W/"{version}"',
+        # Cached answers must not reach clients with another or no key
+        "Vary": "X-API-Key",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+
+    values = {name: float(value) for name, value in canonical.items()}
+    if radius is not None:
+        result = find_organizations_by_location(
+            request,
+            snapshot,
+            db,
+            circle=(values["latitude"], values["longitude"], values["radius"]),
+        )
+    else:
+        result = find_organizations_by_location(
+            request,
+            snapshot,
+            db,
+            rectangle=[
+                values["min_latitude"],
+                values["max_latitude"],
+                values["min_longitude"],
+                values["max_longitude"],
+            ],
+        )
+    return with_headers(result, response, headers)
+
+
+@router.post(
     "/organizations/search/by-location",
     response_model=List[schemas.OrganizationDetail],
     tags=["Organizations"],
 )
 async def search_organizations_by_location(
+    request: Request,
     search: schemas.LocationSearch,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    buildings = db.query(models.Building).all()
-
-    matching_building_ids = []
+    rectangle = [
+        search.min_latitude,
+        search.max_latitude,
+        search.min_longitude,
+        search.max_longitude,
+    ]
+    if search.radius is None and search.polygon is None and None in rectangle:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                "Please provide either 'radius' for circular search, 'polygon', "
+                "or all rectangle boundaries (min_latitude, max_latitude, "
+                "min_longitude, max_longitude)"
+            ),
+        )
 
+    circle = None
     if search.radius is not None:
+        circle = (search.latitude, search.longitude, search.radius)
+    return find_organizations_by_location(
+        request, snapshot, db, circle, search.polygon, rectangle
+    )
 
-        for building in buildings:
-            distance = haversine_distance(
-                search.latitude, search.longitude, building.latitude, building.longitude
-            )
-            if distance <= search.radius:
-                matching_building_ids.append(building.id)
-
-    elif all(
-        [
-            search.min_latitude,
-            search.max_latitude,
-            search.min_longitude,
-            search.max_longitude,
-        ]
-    ):
-
-        for building in buildings:
-            if (
-                search.min_latitude <= building.latitude <= search.max_latitude
-                and search.min_longitude <= building.longitude <= search.max_longitude
-            ):
-                matching_building_ids.append(building.id)
-    else:
+
+@router.post(
+    "/organizations/search/by-location/batch",
+    response_model=schemas.RadiusBatchResponse,
+    tags=["Organizations"],
+)
+async def search_organizations_by_radii(
+    request: Request,
+    search: schemas.RadiusBatchSearch,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    max_queries = request.app.state.settings.location_batch_max_queries
+    if len(search.queries) > max_queries:
         raise HTTPException(
             status_code=400,
-            detail="Please provide either 'radius' for circular search or all rectangle boundaries (min_latitude, max_latitude, min_longitude, max_longitude)",
+            detail=f"A batch may contain at most {max_queries} queries",
         )
+    circles = [
+        (query.latitude, query.longitude, query.radius) for query in search.queries
+    ]
+
+    if snapshot is not None:
+        results, organizations = snapshot.organizations_in_radii(circles)
+        return {"results": results, "organizations": organizations}
 
+    building_ids = cache.geo_index.get(db).in_radii(circles)
+    matched = {id_ for ids in building_ids for id_ in ids}
     organizations = (
         db.query(models.Organization)
-        .filter(models.Organization.building_id.in_(matching_building_ids))
+        .options(*queries.ORGANIZATION_DETAIL)
+        .filter(models.Organization.building_id.in_(matched))
+        .order_by(models.Organization.id)
         .all()
     )
-
-    return organizations
-
-
-@app.get("/buildings/", response_model=List[schemas.Building], tags=["Buildings"])
+    by_building: Dict[int, List[int]] = {}
+    for organization in organizations:
+        by_building.setdefault(organization.building_id, []).append(organization.id)
+    results = [
+        sorted(id_ for building_id in ids for id_ in by_building.get(building_id, ()))
+        for ids in building_ids
+    ]
+    return {"results": results, "organizations": organizations}
+
+
+@router.get(
+    "/buildings/",
+    response_model=List[schemas.BuildingWithCount],
+    response_model_exclude_unset=True,
+    tags=["Buildings"],
+)
 async def list_buildings(
-    db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)
+    with_counts: bool = Query(False, description="Include organization counts"),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
 ):
 
+    if snapshot is not None:
+        return snapshot.list_buildings(with_counts)
+
     buildings = db.query(models.Building).all()
+    if with_counts:
+        counts = facets.building_counts(db)
+        return [
+            {
+                "id": building.id,
+                "address": building.address,
+                "latitude": building.latitude,
+                "longitude": building.longitude,
+                "organization_count": counts.get(building.id, 0),
+            }
+            for building in buildings
+        ]
     return buildings
 
 
-@app.get(
+@router.get(
     "/buildings/{building_id}", response_model=schemas.Building, tags=["Buildings"]
 )
 async def get_building(
     building_id: int,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    building = (
-        db.query(models.Building).filter(models.Building.id == building_id).first()
-    )
+    if snapshot is not None:
+        building = snapshot.get_building(building_id)
+    else:
+        building = queries.get_building(db, building_id)
     if not building:
         raise HTTPException(status_code=404, detail="Building not found")
     return building
 
 
-@app.get("/activities/", response_model=List[schemas.Activity], tags=["Activities"])
+@router.get("/activities/", response_model=List[schemas.Activity], tags=["Activities"])
 async def list_activities(
-    db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
 ):
 
+    if snapshot is not None:
+        return snapshot.list_activities()
+
     activities = db.query(models.Activity).all()
     return activities
 
 
-@app.get(
-    "/activities/tree", response_model=List[schemas.ActivityTree], tags=["Activities"]
+@router.get(
+    "/activities/tree",
+    response_model=List[schemas.ActivityTree],
+    response_model_exclude_unset=True,
+    tags=["Activities"],
 )
 async def get_activities_tree(
-    db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)
+    with_counts: bool = Query(
+        False, description="Include organization counts for each subtree"
+    ),
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
 ):
 
-    def build_tree(parent_id: Optional[int] = None):
-        activities = (
-            db.query(models.Activity)
-            .filter(models.Activity.parent_id == parent_id)
-            .all()
-        )
-        result = []
-        for activity in activities:
-            activity_dict = {
-                "id": activity.id,
-                "name": activity.name,
-                "parent_id": activity.parent_id,
-                "level": activity.level,
-                "children": build_tree(activity.id),
-            }
-            result.append(activity_dict)
-        return result
+    if snapshot is not None:
+        return snapshot.activity_tree(with_counts)
 
-    return build_tree(None)
+    counts = facets.activity_counts(db) if with_counts else None
+    return cache.activity_tree(db, counts)
 
 
-@app.get(
+@router.get(
     "/activities/{activity_id}", response_model=schemas.Activity, tags=["Activities"]
 )
 async def get_activity(
     activity_id: int,
+    snapshot: Optional[BaseSnapshot] = Depends(get_snapshot),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key),
 ):
 
-    activity = (
-        db.query(models.Activity).filter(models.Activity.id == activity_id).first()
-    )
+    if snapshot is not None:
+        activity = snapshot.get_activity(activity_id)
+    else:
+        activity = queries.get_activity(db, activity_id)
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
     return activity
 
 
+@router.get("/changes", response_model=schemas.ChangesPage, tags=["Sync"])
+async def get_changes(
+    since: int = Query(0, ge=0, description="Last directory version already synced"),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor of the previous page; overrides since"
+    ),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    try:
+        return changes.list_changes(db, since, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/events", tags=["Sync"])
+async def subscribe_events(
+    request: Request,
+    min_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    max_latitude: Optional[float] = Query(None, ge=-90, le=90),
+    min_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    max_longitude: Optional[float] = Query(None, ge=-180, le=180),
+    activity_id: Optional[int] = Query(None, description="Activity filter"),
+    include_children: bool = Query(
+        True, description="Include changes in child activities"
+    ),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    activity_ids = None
+    if activity_id is not None:
+        if not queries.get_activity(db, activity_id):
+            raise HTTPException(status_code=404, detail="Activity not found")
+        activity_ids = (
+            activity_subtree_ids(db, activity_id) if include_children else [activity_id]
+        )
+    try:
+        event_filter = events.EventFilter(
+            min_latitude, max_latitude, min_longitude, max_longitude, activity_ids
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return StreamingResponse(
+        events.stream(
+            event_filter,
+            current_version(db.connection()),
+            request.app.state.settings.events_keepalive_interval,
+            request.is_disconnected,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/export/{table}", tags=["Export"])
+async def export_table(
+    table: str,
+    format: Literal["parquet", "arrow"] = Query(
+        "parquet", description="Parquet file or Arrow IPC stream"
+    ),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    if table not in export.TABLES:
+        raise HTTPException(status_code=404, detail="Table not found")
+    try:
+        export.require_pyarrow()
+    except ImportError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+
+    extension, media_type = export.FORMATS[format]
+    return StreamingResponse(
+        export.stream_table(db.get_bind(), table, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{table}.{extension}"',
+            # Version at the start of the export; rows written later may be in it
+            "X-Directory-Version": str(current_version(db.connection())),
+        },
+    )
+
+
+@router.get("/debug/memory", tags=["Diagnostics"])
+async def debug_memory(
+    top: int = Query(
+        10, ge=0, le=100, description="Top allocation sites when tracemalloc runs"
+    ),
+    api_key: str = Depends(verify_privileged_key),
+):
+
+    return memory.report(top)
+
+
+@router.post("/batch", response_model=List[schemas.BatchResponseItem], tags=["Batch"])
+async def batch(
+    payload: schemas.BatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key),
+):
+
+    max_requests = request.app.state.settings.batch_max_requests
+    if len(payload.requests) > max_requests:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {max_requests} requests",
+        )
+    return await run_batch(request, payload, db)
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
@@ -0,0 +1,155 @@
+"""
+Memory accounting for diagnostics.
+
+Sizes are approximate: ``deep_sizeof`` follows containers and slotted
+objects, counts shared objects once and skips memory-mapped buffers, which
+live in the page cache rather than the process heap.
+"""
+
+import itertools
+import mmap
+import resource
+import sys
+import tracemalloc
+from array import array
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+_SHARED_TYPES = (memoryview, mmap.mmap, type, type(sys))
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Approximate number of bytes reachable from ``obj``"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SHARED_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, array)):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            for name in getattr(type(current), "__slots__", ()):
+                if hasattr(current, name):
+                    stack.append(getattr(current, name))
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+    return total
+
+
+class InFlightResponse:
+    __slots__ = ("method", "path", "started", "body_bytes", "bytes_sent", "scope")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.started = perf_counter()
+        self.body_bytes: Optional[int] = None
+        self.bytes_sent = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.scope.get("route_path"),
+            "age_ms": round((perf_counter() - self.started) * 1000, 1),
+            "body_bytes": self.body_bytes,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+_in_flight: Dict[int, InFlightResponse] = {}
+_request_ids = itertools.count()
+
+
+def in_flight() -> List[dict]:
+    return [response.as_dict() for response in list(_in_flight.values())]
+
+
+def in_flight_count() -> int:
+    return len(_in_flight)
+
+
+class InFlightMiddleware:
+    """ASGI middleware keeping a registry of requests being served
+
+    ``body_bytes`` is the declared Content-Length, i.e. the size of a fully
+    buffered body; streamed responses only report ``bytes_sent``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = next(_request_ids)
+        response = _in_flight[request_id] = InFlightResponse(scope)
+
+        async def send_tracked(message):
+            if message["type"] == "http.response.start":
+                for key, value in message.get("headers", ()):
+                    if key == b"content-length":
+                        response.body_bytes = int(value)
+            elif message["type"] == "http.response.body":
+                response.bytes_sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_tracked)
+        finally:
+            del _in_flight[request_id]
+
+
+def start_tracemalloc(frames: int) -> None:
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def tracemalloc_top(limit: int) -> dict:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False, "top": []}
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "top": [
+            {
+                "location": str(stat.traceback[0]),
+                "bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ],
+    }
+
+
+def report(top: int = 0) -> dict:
+    from app import cache
+    from app.snapshot import get_snapshot
+
+    snapshot = get_snapshot()
+    return {
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "caches": {
+            directory_cache.name: directory_cache.memory_usage()
+            for directory_cache in cache.CACHES
+        },
+        "snapshot": snapshot.memory_usage() if snapshot is not None else None,
+        "in_flight": in_flight(),
+        "tracemalloc": tracemalloc_top(top),
+    }
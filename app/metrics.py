@@ -0,0 +1,173 @@
+"""
+Prometheus metrics.
+
+Request, latency and query metrics are updated inline. Pool state and cache
+statistics are process-local, so each worker samples them into gauges at most
+once per ``SAMPLE_INTERVAL`` and on scrape.
+
+With several workers, point ``PROMETHEUS_MULTIPROC_DIR`` at an empty
+directory shared by them; every worker then writes its values to memory-mapped
+files there and ``/metrics`` aggregates the files of all workers.
+"""
+
+import os
+from time import monotonic, perf_counter
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+
+from app import cache, database
+
+SAMPLE_INTERVAL = 1.0
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"],
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being served",
+    multiprocess_mode="livesum",
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed")
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", multiprocess_mode="livesum")
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently in use",
+    multiprocess_mode="livesum",
+)
+POOL_CHECKED_IN = Gauge(
+    "db_pool_checked_in",
+    "Idle connections in the pool",
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections opened beyond the pool size",
+    multiprocess_mode="livesum",
+)
+CACHE_HITS = Gauge(
+    "directory_cache_hits", "Cache hits", ["cache"], multiprocess_mode="livesum"
+)
+CACHE_MISSES = Gauge(
+    "directory_cache_misses", "Cache misses", ["cache"], multiprocess_mode="livesum"
+)
+CACHE_HIT_RATIO = Gauge(
+    "directory_cache_hit_ratio",
+    "Share of cache lookups served from the cache",
+    ["cache"],
+    multiprocess_mode="liveall",
+)
+
+_last_sample = 0.0
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_query_started"] = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("metrics_query_started", None)
+    DB_QUERIES.inc()
+    if started is not None:
+        DB_QUERY_DURATION.observe(perf_counter() - started)
+
+
+def _pool_value(pool, name: str) -> int:
+    # Only QueuePool keeps all counters; StaticPool and NullPool keep none
+    method = getattr(pool, name, None)
+    return method() if callable(method) else 0
+
+
+def sample_process_state() -> None:
+    global _last_sample
+    _last_sample = monotonic()
+
+    pools = [engine.pool for engine in database.engines()]
+    POOL_SIZE.set(sum(_pool_value(pool, "size") for pool in pools))
+    POOL_CHECKED_OUT.set(sum(_pool_value(pool, "checkedout") for pool in pools))
+    POOL_CHECKED_IN.set(sum(_pool_value(pool, "checkedin") for pool in pools))
+    POOL_OVERFLOW.set(sum(max(_pool_value(pool, "overflow"), 0) for pool in pools))
+
+    for directory_cache in cache.CACHES:
+        stats = directory_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        CACHE_HITS.labels(directory_cache.name).set(stats["hits"])
+        CACHE_MISSES.labels(directory_cache.name).set(stats["misses"])
+        CACHE_HIT_RATIO.labels(directory_cache.name).set(
+            stats["hits"] / lookups if lookups else 0.0
+        )
+
+
+def render() -> Response:
+    sample_process_state()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead() -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and concurrency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_PROGRESS.dec()
+            # Label by route template to keep the label set bounded
+            route = scope.get("route_path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUEST_DURATION.labels(method, route).observe(perf_counter() - started)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            if monotonic() - _last_sample >= SAMPLE_INTERVAL:
+                sample_process_state()
@@ -1,4 +1,5 @@
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -15,9 +16,39 @@ organization_activity = Table(
     "organization_activity",
     Base.metadata,
     Column(
-        "organization_id", Integer, ForeignKey("organizations.id", ondelete="CASCADE")
+        "organization_id",
+        Integer,
+        ForeignKey("organizations.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "activity_id",
+        Integer,
+        ForeignKey("activities.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
+)
+
+
+# An organization's row for every activity it is linked to and every ancestor
+# of those, once; maintained by app.ancestry for subtree filtering
+organization_activity_ancestor = Table(
+    "organization_activity_ancestor",
+    Base.metadata,
+    Column(
+        "ancestor_activity_id",
+        Integer,
+        ForeignKey("activities.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "organization_id",
+        Integer,
+        ForeignKey("organizations.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     ),
-    Column("activity_id", Integer, ForeignKey("activities.id", ondelete="CASCADE")),
 )
 
 
@@ -28,6 +59,7 @@ class Building(Base):
     address = Column(String, nullable=False, index=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
 
     organizations = relationship("Organization", back_populates="building")
 
@@ -38,9 +70,13 @@ class Activity(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
     parent_id = Column(
-        Integer, ForeignKey("activities.id", ondelete="CASCADE"), nullable=True
+        Integer,
+        ForeignKey("activities.id", ondelete="CASCADE"),
+        nullable=True,
+        index=True,
     )
     level = Column(Integer, nullable=False, default=1)
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
 
     parent = relationship("Activity", remote_side=[id], back_populates="children")
     children = relationship(
@@ -62,7 +98,10 @@ class PhoneNumber(Base):
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String, nullable=False)
     organization_id = Column(
-        Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("organizations.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
 
     organization = relationship("Organization", back_populates="phone_numbers")
@@ -74,8 +113,13 @@ class Organization(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
     building_id = Column(
-        Integer, ForeignKey("buildings.id", ondelete="CASCADE"), nullable=False
+        Integer,
+        ForeignKey("buildings.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
+    # Also bumped when the organization's phones or activity links change
+    row_version = Column(BigInteger, nullable=False, default=0, index=True)
 
     building = relationship("Building", back_populates="organizations")
     phone_numbers = relationship(
@@ -84,3 +128,36 @@ class Organization(Base):
     activities = relationship(
         "Activity", secondary=organization_activity, back_populates="organizations"
     )
+
+
+class ActivityOrganizationCount(Base):
+    __tablename__ = "activity_organization_counts"
+
+    activity_id = Column(
+        Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True
+    )
+    organization_count = Column(Integer, nullable=False, default=0)
+
+
+class BuildingOrganizationCount(Base):
+    __tablename__ = "building_organization_counts"
+
+    building_id = Column(
+        Integer, ForeignKey("buildings.id", ondelete="CASCADE"), primary_key=True
+    )
+    organization_count = Column(Integer, nullable=False, default=0)
+
+
+class DirectoryVersion(Base):
+    __tablename__ = "directory_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    entity = Column(String, primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, index=True)
@@ -0,0 +1,209 @@
+"""
+On-demand sampling profiler for single requests.
+
+A request sent with the privileged API key and an ``X-Profile`` header runs
+while a background thread samples the stack of the thread serving it. The
+samples are written in the folded format (``outer;inner;leaf count`` per
+line) read by flamegraph.pl, speedscope and inferno.
+
+``X-Profile: inline`` returns the profile instead of the response body; any
+other value stores it under ``PROFILE_DIR`` and names the file in the
+``X-Profile-Id`` response header. Requests without the header only pay for
+one header lookup.
+
+The sampled thread is the event loop's, and it also serves every other
+request that runs while the profiled one waits. Their frames end up in the
+profile, attributed to the profiled request. The profiler therefore records
+the most other requests it saw in flight. Inline profiles report that number
+in ``X-Profile-Concurrent-Requests``; stored profiles log a warning when it
+is not zero. Profile on an otherwise idle worker for a clean picture.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Optional
+
+from app.memory import in_flight_count
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+API_KEY_HEADER = b"x-api-key"
+UNSAFE_FILENAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread every ``interval`` seconds"""
+
+    def __init__(
+        self,
+        thread_id: int,
+        interval: float,
+        concurrent: Optional[Callable[[], int]] = None,
+    ):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.concurrent = concurrent
+        # Most other requests seen in flight at a sample
+        self.max_concurrent = 0
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if self.concurrent is not None:
+                self.max_concurrent = max(self.max_concurrent, self.concurrent())
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that ask for it with X-Profile"""
+
+    def __init__(self, app, api_key: str, directory: str, interval_ms: float):
+        self.app = app
+        self.api_key = api_key.encode()
+        self.directory = directory
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _header(scope, PROFILE_HEADER)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if _header(scope, API_KEY_HEADER) != self.api_key:
+            await _send_json(
+                send, 403, {"detail": "Profiling requires the privileged API key"}
+            )
+            return
+
+        inline = mode == b"inline"
+        profile_id = None if inline else self.profile_id(scope)
+        messages = []
+
+        async def send_profiled(message):
+            if inline:
+                messages.append(message)
+                return
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile_id.encode()),
+                ]
+            await send(message)
+
+        # The in-flight registry includes the profiled request itself
+        profiler = SamplingProfiler(
+            threading.get_ident(),
+            self.interval,
+            concurrent=lambda: in_flight_count() - 1,
+        )
+        profiler.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - started
+
+        if not inline:
+            self._store(profile_id, profiler)
+            if profiler.max_concurrent:
+                logger.warning(
+                    "Profile %s includes up to %d concurrent requests",
+                    profile_id,
+                    profiler.max_concurrent,
+                )
+            return
+
+        status_code = next(
+            m["status"] for m in messages if m["type"] == "http.response.start"
+        )
+        body = profiler.folded().encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profile-status", str(status_code).encode()),
+                    (b"x-profile-duration-ms", f"{duration * 1000:.1f}".encode()),
+                    (
+                        b"x-profile-concurrent-requests",
+                        str(profiler.max_concurrent).encode(),
+                    ),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def profile_id(self, scope) -> str:
+        path = UNSAFE_FILENAME.sub("_", scope["path"].strip("/")) or "root"
+        timestamp = time.strftime("%Y%m%dT%H%M%S")
+        return f"{timestamp}-{uuid.uuid4().hex[:8]}-{scope['method']}-{path}"
+
+    def _store(self, profile_id: str, profiler: SamplingProfiler) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        with open(path, "w") as profile:
+            profile.write(profiler.folded())
+
+
+async def _send_json(send, status_code: int, payload: dict) -> None:
+    body = json.dumps(payload).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
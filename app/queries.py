@@ -0,0 +1,68 @@
+"""
+Prebuilt statements for the hot by-id lookups.
+
+Each statement is constructed once at import with a bound parameter for the
+key. SQLAlchemy memoizes the cache key of a statement object, so repeated
+executions skip both query construction and cache-key generation and go
+straight to the compiled form in the engine's statement cache.
+
+The organization lists are built here too, so the startup warmup compiles
+exactly what the endpoints run.
+"""
+
+from typing import Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Query, Session, joinedload, selectinload
+
+from app import models
+
+# Everything OrganizationDetail serializes, loaded up front instead of lazily
+# per organization: the building joined in, the collections one query each
+ORGANIZATION_DETAIL = (
+    joinedload(models.Organization.building),
+    selectinload(models.Organization.phone_numbers),
+    selectinload(models.Organization.activities),
+)
+
+ORGANIZATION_BY_ID = (
+    select(models.Organization)
+    .where(models.Organization.id == bindparam("id"))
+    .options(*ORGANIZATION_DETAIL)
+)
+BUILDING_BY_ID = select(models.Building).where(models.Building.id == bindparam("id"))
+ACTIVITY_BY_ID = select(models.Activity).where(models.Activity.id == bindparam("id"))
+
+
+def get_organization(
+    db: Session, organization_id: int
+) -> Optional[models.Organization]:
+    return db.execute(ORGANIZATION_BY_ID, {"id": organization_id}).scalar()
+
+
+def get_building(db: Session, building_id: int) -> Optional[models.Building]:
+    return db.execute(BUILDING_BY_ID, {"id": building_id}).scalar()
+
+
+def get_activity(db: Session, activity_id: int) -> Optional[models.Activity]:
+    return db.execute(ACTIVITY_BY_ID, {"id": activity_id}).scalar()
+
+
+def organizations_in_building(db: Session, building_id: int) -> Query:
+    return (
+        db.query(models.Organization)
+        .options(*ORGANIZATION_DETAIL)
+        .filter(models.Organization.building_id == building_id)
+    )
+
+
+def organizations_under_activity(db: Session, activity_id: int) -> Query:
+    """Organizations linked to the activity or to any activity below it"""
+    # One row per organization under the subtree, no expansion or DISTINCT
+    ancestor = models.organization_activity_ancestor
+    return (
+        db.query(models.Organization)
+        .options(*ORGANIZATION_DETAIL)
+        .join(ancestor, ancestor.c.organization_id == models.Organization.id)
+        .filter(ancestor.c.ancestor_activity_id == activity_id)
+    )
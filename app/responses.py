@@ -0,0 +1,118 @@
+"""
+Size-capped JSON list responses.
+
+The unpaginated list endpoints can return the whole directory. Without a cap
+FastAPI validates every item, builds the full list of dicts and encodes it in
+one piece, so a large result is held in memory several times over. With
+``MAX_RESPONSE_BYTES`` set, items are encoded one at a time: results under
+the cap are sent as one body, larger ones are either streamed item by item
+or rejected with 413, depending on ``OVERSIZED_RESPONSES``.
+
+Database endpoints pass their ORM query rather than its rows. Under a cap
+the rows are then fetched ``FETCH_SIZE`` at a time and no further than the
+response needs, so a rejected or streamed result is never loaded whole. The
+rows come through the request's own session, which a streamed response keeps
+open, and so keeps its connection checked out, until the body is sent.
+"""
+
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Query
+
+from app.database import defer_close
+
+FETCH_SIZE = 100
+
+
+@lru_cache()
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def _encode(adapter: TypeAdapter, item) -> bytes:
+    return adapter.dump_json(adapter.validate_python(item, from_attributes=True))
+
+
+def _nothing() -> None:
+    pass
+
+
+def _query_rows(query: Query) -> Tuple[Iterable, Callable[[], None]]:
+    """Rows of ``query`` fetched in batches, and the function releasing them"""
+    result = query.session.scalars(
+        query.statement, execution_options={"yield_per": FETCH_SIZE}
+    )
+    return result, result.close
+
+
+def _stream(
+    head: List[bytes],
+    rest: Iterator,
+    adapter: TypeAdapter,
+    close: Callable[[], None],
+    close_session: Optional[Callable[[], None]] = None,
+):
+    try:
+        yield b"[" + b",".join(head)
+        for item in rest:
+            yield b"," + _encode(adapter, item)
+        yield b"]"
+    finally:
+        close()
+        if close_session is not None:
+            close_session()
+
+
+def list_response(request: Request, items: Iterable, schema):
+    """Return ``items`` (a list or an ORM ``Query``) as a JSON list of ``schema``"""
+    settings = request.app.state.settings
+    cap = settings.max_response_bytes
+    if cap is None:
+        return items.all() if isinstance(items, Query) else items
+
+    close, session = _nothing, None
+    if isinstance(items, Query):
+        session = items.session
+        items, close = _query_rows(items)
+    try:
+        adapter = _adapter(schema)
+        remaining = iter(items)
+        head: List[bytes] = []
+        size = 2
+        for item in remaining:
+            chunk = _encode(adapter, item)
+            head.append(chunk)
+            size += len(chunk) + 1
+            if size > cap:
+                break
+        else:
+            return Response(
+                b"[" + b",".join(head) + b"]", media_type="application/json"
+            )
+
+        if settings.oversized_responses == "reject":
+            raise HTTPException(
+                status_code=413,
+                detail=(
+                    f"Response exceeds {cap} bytes; narrow the query or page "
+                    "through /organizations/search"
+                ),
+            )
+        close_session = defer_close(request, session) if session is not None else None
+        stream = _stream(head, remaining, adapter, close, close_session)
+        # The stream releases the rows, and the session, once the body is sent
+        close = _nothing
+        return StreamingResponse(stream, media_type="application/json")
+    finally:
+        close()
+
+
+def with_headers(result, response: Response, headers: Dict[str, str]):
+    """Add ``headers`` to an endpoint result, whether data or a response"""
+    target = result if isinstance(result, Response) else response
+    target.headers.update(headers)
+    return result
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple
 
 
 class PhoneNumberBase(BaseModel):
@@ -39,6 +39,10 @@ class Building(BuildingBase):
         from_attributes = True
 
 
+class BuildingWithCount(Building):
+    organization_count: Optional[int] = None
+
+
 class ActivityBase(BaseModel):
     name: str
     parent_id: Optional[int] = None
@@ -58,6 +62,7 @@ class Activity(ActivityBase):
 
 class ActivityTree(Activity):
     children: List["ActivityTree"] = []
+    organization_count: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -74,6 +79,36 @@ class OrganizationCreate(OrganizationBase):
     activity_ids: List[int] = []
 
 
+class OrganizationUpsert(OrganizationCreate):
+    id: Optional[int] = Field(
+        None, description="Update this organization; omit to create a new one"
+    )
+
+
+class OrganizationBulkRequest(BaseModel):
+    # Items are validated one by one so that a bad item fails alone
+    items: List[Dict[str, Any]] = Field(
+        ...,
+        min_length=1,
+        description="OrganizationUpsert objects: name, building_id, "
+        "phone_numbers, activity_ids and an optional id",
+    )
+
+
+class OrganizationBulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: Literal["created", "updated", "error"]
+    error: Optional[str] = None
+
+
+class OrganizationBulkResponse(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    items: List[OrganizationBulkItemResult]
+
+
 class Organization(OrganizationBase):
     id: int
     phone_numbers: List[PhoneNumber] = []
@@ -90,9 +125,31 @@ class OrganizationDetail(Organization):
         from_attributes = True
 
 
+class Change(BaseModel):
+    entity: Literal["building", "activity", "organization"]
+    id: int
+    version: int
+    deleted: bool
+    data: Optional[Dict[str, Any]] = None
+
+
+class ChangesPage(BaseModel):
+    since: int
+    until: int
+    items: List[Change]
+    next_cursor: Optional[str] = None
+
+
+Vertex = Tuple[
+    Annotated[float, Field(ge=-90, le=90)], Annotated[float, Field(ge=-180, le=180)]
+]
+
+
 class LocationSearch(BaseModel):
-    latitude: float = Field(..., ge=-90, le=90)
-    longitude: float = Field(..., ge=-180, le=180)
+    latitude: Optional[float] = Field(
+        None, ge=-90, le=90, description="Center of a radius search"
+    )
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     radius: Optional[float] = Field(
         None, gt=0, description="Search radius in kilometers"
     )
@@ -100,6 +157,94 @@ class LocationSearch(BaseModel):
     max_latitude: Optional[float] = Field(None, ge=-90, le=90)
     min_longitude: Optional[float] = Field(None, ge=-180, le=180)
     max_longitude: Optional[float] = Field(None, ge=-180, le=180)
+    polygon: Optional[List[Vertex]] = Field(
+        None,
+        min_length=3,
+        max_length=1000,
+        description="[latitude, longitude] vertices of a search area",
+    )
+
+    @model_validator(mode="after")
+    def one_area(self) -> "LocationSearch":
+        rectangle = (
+            self.min_latitude,
+            self.max_latitude,
+            self.min_longitude,
+            self.max_longitude,
+        )
+        areas = [
+            self.radius is not None,
+            self.polygon is not None,
+            any(bound is not None for bound in rectangle),
+        ]
+        if sum(areas) > 1:
+            raise ValueError(
+                "Use only one of 'radius', 'polygon' or the rectangle boundaries"
+            )
+        if self.radius is not None and None in (self.latitude, self.longitude):
+            raise ValueError("A radius search needs 'latitude' and 'longitude'")
+        return self
+
+
+class RadiusQuery(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    radius: float = Field(..., gt=0, description="Search radius in kilometers")
+
+
+class RadiusBatchSearch(BaseModel):
+    queries: List[RadiusQuery] = Field(..., min_length=1)
+
+
+class RadiusBatchResponse(BaseModel):
+    results: List[List[int]] = Field(
+        ..., description="Organization ids within each query, in query order"
+    )
+    organizations: List[OrganizationDetail]
+
+
+class ClusterCell(BaseModel):
+    row: int
+    col: int
+    count: int = Field(..., description="Organizations in the cell")
+    building_count: int
+    latitude: float = Field(..., description="Centroid weighted by organizations")
+    longitude: float
+    building_id: Optional[int] = Field(
+        None, description="The building, when the cell holds only one"
+    )
+    min_latitude: float
+    max_latitude: float
+    min_longitude: float
+    max_longitude: float
+
+
+class ClusterResponse(BaseModel):
+    cell_size: float = Field(..., description="Cell edge in degrees")
+    cells: List[ClusterCell]
+
+
+class OrganizationSearchPage(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[OrganizationDetail]
+
+
+class BatchRequestItem(BaseModel):
+    method: Literal["GET", "POST"] = "GET"
+    path: str = Field(..., description="Route path, e.g. /organizations/1")
+    params: Dict[str, Any] = {}
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem] = Field(..., min_length=1)
+
+
+class BatchResponseItem(BaseModel):
+    status_code: int
+    body: Any = None
 
 
 ActivityTree.model_rebuild()
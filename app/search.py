@@ -0,0 +1,214 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.geo import haversine_sql, radius_bounding_box
+from app.queries import ORGANIZATION_DETAIL
+
+EARTH_SURFACE_DEG2 = 180.0 * 360.0
+
+# Rough share of organizations matched by each predicate kind, used to pick
+# the predicate that drives the query. Geo predicates are estimated from the
+# rectangle area instead.
+BUILDING_SELECTIVITY = 0.001
+ACTIVITY_SELECTIVITY = 0.05
+ACTIVITY_SUBTREE_SELECTIVITY = 0.2
+NAME_SELECTIVITY = 0.3
+
+
+def activity_subtree_ids(db: Session, activity_id: int) -> List[int]:
+    return list(db.execute(activity_subtree_select(activity_id)).scalars())
+
+
+def activity_subtree_select(activity_id: int):
+    """SELECT of the ids of an activity and all of its descendants"""
+    tree = (
+        select(models.Activity.id)
+        .where(models.Activity.id == activity_id)
+        .cte(name="activity_subtree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(models.Activity.id).where(models.Activity.parent_id == tree.c.id)
+    )
+    return select(tree.c.id)
+
+
+@dataclass
+class OrganizationFilter:
+    activity_id: Optional[int] = None
+    include_children: bool = True
+    name: Optional[str] = None
+    building_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius: Optional[float] = None
+    min_latitude: Optional[float] = None
+    max_latitude: Optional[float] = None
+    min_longitude: Optional[float] = None
+    max_longitude: Optional[float] = None
+
+    def validate(self, sort: str) -> None:
+        rectangle = [
+            self.min_latitude,
+            self.max_latitude,
+            self.min_longitude,
+            self.max_longitude,
+        ]
+        if any(v is not None for v in rectangle) and not all(
+            v is not None for v in rectangle
+        ):
+            raise ValueError(
+                "Rectangle search requires all of min_latitude, max_latitude, "
+                "min_longitude and max_longitude"
+            )
+        has_point = self.latitude is not None and self.longitude is not None
+        if self.radius is not None and not has_point:
+            raise ValueError("Radius search requires latitude and longitude")
+        if sort == "distance" and not has_point:
+            raise ValueError("Sorting by distance requires latitude and longitude")
+
+    @property
+    def has_point(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+    @property
+    def has_rectangle(self) -> bool:
+        return self.min_latitude is not None
+
+    def bounding_box(self) -> Optional[Tuple[float, float, float, float]]:
+        """Intersection of the radius and rectangle constraints, if any"""
+        boxes = []
+        if self.radius is not None:
+            boxes.append(
+                radius_bounding_box(self.latitude, self.longitude, self.radius)
+            )
+        if self.has_rectangle:
+            boxes.append(
+                (
+                    self.min_latitude,
+                    self.max_latitude,
+                    self.min_longitude,
+                    self.max_longitude,
+                )
+            )
+        if not boxes:
+            return None
+        return (
+            max(b[0] for b in boxes),
+            min(b[1] for b in boxes),
+            max(b[2] for b in boxes),
+            min(b[3] for b in boxes),
+        )
+
+
+def plan_driver(search: OrganizationFilter) -> Optional[str]:
+    """Pick the most selective predicate to drive the search query"""
+    estimates = {}
+    if search.building_id is not None:
+        estimates["building"] = BUILDING_SELECTIVITY
+    box = search.bounding_box()
+    if box is not None:
+        area = max(box[1] - box[0], 0) * max(box[3] - box[2], 0)
+        estimates["geo"] = area / EARTH_SURFACE_DEG2
+    if search.activity_id is not None:
+        estimates["activity"] = (
+            ACTIVITY_SUBTREE_SELECTIVITY
+            if search.include_children
+            else ACTIVITY_SELECTIVITY
+        )
+    if search.name:
+        estimates["name"] = NAME_SELECTIVITY
+    if not estimates:
+        return None
+    return min(estimates, key=estimates.get)
+
+
+def _activity_organizations_select(search: OrganizationFilter):
+    """Ids of the organizations under the activity, each exactly once"""
+    if search.include_children:
+        ancestor = models.organization_activity_ancestor
+        return select(ancestor.c.organization_id).where(
+            ancestor.c.ancestor_activity_id == search.activity_id
+        )
+    link = models.organization_activity
+    return select(link.c.organization_id).where(
+        link.c.activity_id == search.activity_id
+    )
+
+
+def _filtered_select(search: OrganizationFilter, columns, sort: str):
+    org = models.Organization
+    building = models.Building
+    box = search.bounding_box()
+    distance = None
+
+    driver = plan_driver(search)
+    joined_building = driver == "geo" or box is not None or sort == "distance"
+    stmt = select(*columns)
+
+    if driver == "activity":
+        matched = _activity_organizations_select(search).subquery("matched")
+        stmt = stmt.select_from(matched).join(org, org.id == matched.c.organization_id)
+    elif driver == "geo":
+        stmt = stmt.select_from(building).join(org, org.building_id == building.id)
+    else:
+        stmt = stmt.select_from(org)
+
+    if driver != "activity" and search.activity_id is not None:
+        stmt = stmt.where(org.id.in_(_activity_organizations_select(search)))
+
+    if joined_building:
+        if driver != "geo":
+            stmt = stmt.join(building, building.id == org.building_id)
+        if search.has_point:
+            distance = haversine_sql(
+                search.latitude, search.longitude, building.latitude, building.longitude
+            )
+    if box is not None:
+        stmt = stmt.where(
+            building.latitude.between(box[0], box[1]),
+            building.longitude.between(box[2], box[3]),
+        )
+        if search.radius is not None:
+            stmt = stmt.where(distance <= search.radius)
+
+    if search.building_id is not None:
+        stmt = stmt.where(org.building_id == search.building_id)
+    if search.name:
+        stmt = stmt.where(org.name.ilike(f"%{search.name}%"))
+
+    return stmt, distance
+
+
+def build_search_query(search: OrganizationFilter, sort: str, limit: int, offset: int):
+    """Compile the filter into one SELECT of (Organization, total) rows"""
+    org = models.Organization
+    stmt, distance = _filtered_select(
+        search, [org, func.count().over().label("total")], sort
+    )
+
+    if sort == "distance":
+        stmt = stmt.order_by(distance, org.id)
+    elif sort == "id":
+        stmt = stmt.order_by(org.id)
+    else:
+        stmt = stmt.order_by(org.name, org.id)
+
+    return stmt.options(*ORGANIZATION_DETAIL).limit(limit).offset(offset)
+
+
+def search_organizations(
+    db: Session, search: OrganizationFilter, sort: str, limit: int, offset: int
+) -> Tuple[List[models.Organization], int]:
+    rows = db.execute(build_search_query(search, sort, limit, offset)).all()
+    if rows:
+        return [row[0] for row in rows], rows[0].total
+    if not offset:
+        return [], 0
+
+    # Paged past the end: the window total is only carried on returned rows
+    stmt, _ = _filtered_select(search, [func.count(models.Organization.id)], sort)
+    return [], db.execute(stmt).scalar()
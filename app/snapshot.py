@@ -0,0 +1,627 @@
+"""
+Immutable in-memory copy of the directory for serving reads without the DB.
+
+A ``Snapshot`` is built once from the database and never mutated; refreshes
+build a new one and swap the module-level reference, so readers always see a
+consistent version.
+"""
+
+import logging
+import signal
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+from app import models
+from app.database import consistent_read
+from app.geo import (
+    haversine_distance,
+    match_radii,
+    point_in_polygon,
+    polygon_bounding_box,
+    radius_bounding_box,
+)
+from app.memory import deep_sizeof
+from app.search import OrganizationFilter, plan_driver
+from app.versioning import current_version
+
+logger = logging.getLogger(__name__)
+
+
+class BuildingRecord:
+    __slots__ = ("id", "address", "latitude", "longitude")
+
+    def __init__(self, id, address, latitude, longitude):
+        self.id = id
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class ActivityRecord:
+    __slots__ = ("id", "name", "parent_id", "level")
+
+    def __init__(self, id, name, parent_id, level):
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.level = level
+
+
+class OrganizationRecord:
+    __slots__ = ("id", "name", "building_id", "phones", "activity_ids")
+
+    def __init__(self, id, name, building_id):
+        self.id = id
+        self.name = name
+        self.building_id = building_id
+        self.phones: List[Tuple[int, str]] = []
+        self.activity_ids = array("i")
+
+
+def _id_array(ids: Iterable[int]) -> array:
+    return array("i", sorted(ids))
+
+
+class BaseSnapshot:
+    """Read-side API of a snapshot, built on a few storage primitives.
+
+    Subclasses provide the primitives (record lookups and prebuilt indexes);
+    the endpoint-shaped methods below are shared.
+    """
+
+    version: int
+
+    def building_ids(self) -> Iterable[int]:
+        raise NotImplementedError
+
+    def building(self, building_id: int) -> Optional[BuildingRecord]:
+        raise NotImplementedError
+
+    def activity_ids(self) -> Iterable[int]:
+        raise NotImplementedError
+
+    def activity(self, activity_id: int) -> Optional[ActivityRecord]:
+        raise NotImplementedError
+
+    def organization_ids(self) -> Iterable[int]:
+        raise NotImplementedError
+
+    def organization(self, organization_id: int) -> Optional[OrganizationRecord]:
+        raise NotImplementedError
+
+    def organization_ids_by_building(self, building_id: int) -> Sequence[int]:
+        raise NotImplementedError
+
+    def organization_ids_by_activity(self, activity_id: int) -> Sequence[int]:
+        raise NotImplementedError
+
+    def child_activity_ids(self, parent_id: Optional[int]) -> Sequence[int]:
+        raise NotImplementedError
+
+    def subtree_ids(self, activity_id: int) -> Sequence[int]:
+        raise NotImplementedError
+
+    def building_ids_by_latitude(self, min_lat: float, max_lat: float) -> Iterable[int]:
+        raise NotImplementedError
+
+    def organization_ids_by_name(self, needle: str) -> List[int]:
+        raise NotImplementedError
+
+    def lower_name(self, organization_id: int) -> str:
+        raise NotImplementedError
+
+    def activity_count(self, activity_id: int) -> int:
+        raise NotImplementedError
+
+    def building_count(self, building_id: int) -> int:
+        raise NotImplementedError
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by each part of the snapshot"""
+        raise NotImplementedError
+
+    # Serialization
+
+    def building_dict(self, building: BuildingRecord) -> dict:
+        return {
+            "id": building.id,
+            "address": building.address,
+            "latitude": building.latitude,
+            "longitude": building.longitude,
+        }
+
+    def activity_dict(self, activity: ActivityRecord) -> dict:
+        return {
+            "id": activity.id,
+            "name": activity.name,
+            "parent_id": activity.parent_id,
+            "level": activity.level,
+        }
+
+    def organization_dict(self, org: OrganizationRecord) -> dict:
+        return {
+            "id": org.id,
+            "name": org.name,
+            "building_id": org.building_id,
+            "phone_numbers": [
+                {"id": phone_id, "number": number, "organization_id": org.id}
+                for phone_id, number in org.phones
+            ],
+            "activities": [
+                self.activity_dict(self.activity(a)) for a in org.activity_ids
+            ],
+            "building": self.building_dict(self.building(org.building_id)),
+        }
+
+    def _organization_dicts(self, ids: Iterable[int]) -> List[dict]:
+        return [self.organization_dict(self.organization(i)) for i in ids]
+
+    # Organizations
+
+    def list_organizations(self) -> List[dict]:
+        return self._organization_dicts(self.organization_ids())
+
+    def get_organization(self, organization_id: int) -> Optional[dict]:
+        org = self.organization(organization_id)
+        return self.organization_dict(org) if org else None
+
+    def organizations_by_building(self, building_id: int) -> List[dict]:
+        return self._organization_dicts(self.organization_ids_by_building(building_id))
+
+    def _activity_org_ids(self, activity_id: int, include_children: bool) -> List[int]:
+        if not include_children:
+            return list(self.organization_ids_by_activity(activity_id))
+        ids = set()
+        for member in self.subtree_ids(activity_id):
+            ids.update(self.organization_ids_by_activity(member))
+        return sorted(ids)
+
+    def organizations_by_activity(
+        self, activity_id: int, include_children: bool
+    ) -> List[dict]:
+        return self._organization_dicts(
+            self._activity_org_ids(activity_id, include_children)
+        )
+
+    def search_by_name(self, name: str) -> List[dict]:
+        return self._organization_dicts(self.organization_ids_by_name(name.lower()))
+
+    def _buildings_in_box(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[BuildingRecord]:
+        result = []
+        for building_id in self.building_ids_by_latitude(min_lat, max_lat):
+            building = self.building(building_id)
+            if min_lon <= building.longitude <= max_lon:
+                result.append(building)
+        return result
+
+    def building_points(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[Tuple[int, float, float, int]]:
+        """(id, latitude, longitude, organization count) of buildings in a box"""
+        return [
+            (b.id, b.latitude, b.longitude, self.building_count(b.id))
+            for b in self._buildings_in_box(min_lat, max_lat, min_lon, max_lon)
+        ]
+
+    def _organizations_in_buildings(self, building_ids: Iterable[int]) -> List[int]:
+        ids = []
+        for building_id in building_ids:
+            ids.extend(self.organization_ids_by_building(building_id))
+        return sorted(ids)
+
+    def organizations_in_radius(
+        self, latitude: float, longitude: float, radius: float
+    ) -> List[dict]:
+        box = radius_bounding_box(latitude, longitude, radius)
+        building_ids = [
+            b.id
+            for b in self._buildings_in_box(*box)
+            if haversine_distance(latitude, longitude, b.latitude, b.longitude)
+            <= radius
+        ]
+        return self._organization_dicts(self._organizations_in_buildings(building_ids))
+
+    def organizations_in_rectangle(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[dict]:
+        buildings = self._buildings_in_box(min_lat, max_lat, min_lon, max_lon)
+        return self._organization_dicts(
+            self._organizations_in_buildings(b.id for b in buildings)
+        )
+
+    def organizations_in_polygon(
+        self, polygon: Sequence[Tuple[float, float]]
+    ) -> List[dict]:
+        building_ids = [
+            b.id
+            for b in self._buildings_in_box(*polygon_bounding_box(polygon))
+            if point_in_polygon(b.latitude, b.longitude, polygon)
+        ]
+        return self._organization_dicts(self._organizations_in_buildings(building_ids))
+
+    def organizations_in_radii(
+        self, circles: Sequence[Tuple[float, float, float]]
+    ) -> Tuple[List[List[int]], List[dict]]:
+        """Organization ids per circle, and every matching organization once"""
+        building_ids = match_radii(
+            lambda min_lat, max_lat: self.building_points(
+                min_lat, max_lat, -180.0, 180.0
+            ),
+            circles,
+        )
+        results = [self._organizations_in_buildings(ids) for ids in building_ids]
+        matched = sorted({id_ for ids in results for id_ in ids})
+        return results, self._organization_dicts(matched)
+
+    def search(
+        self, search: OrganizationFilter, sort: str, limit: int, offset: int
+    ) -> Tuple[List[dict], int]:
+        driver = plan_driver(search)
+        box = search.bounding_box()
+        if driver == "building":
+            candidates = list(self.organization_ids_by_building(search.building_id))
+        elif driver == "geo":
+            candidates = self._organizations_in_buildings(
+                b.id for b in self._buildings_in_box(*box)
+            )
+        elif driver == "activity":
+            candidates = self._activity_org_ids(
+                search.activity_id, search.include_children
+            )
+        else:
+            candidates = list(self.organization_ids())
+
+        allowed = None
+        if search.activity_id is not None and driver != "activity":
+            allowed = set(
+                self._activity_org_ids(search.activity_id, search.include_children)
+            )
+        needle = search.name.lower() if search.name else None
+
+        matches = []
+        for org_id in candidates:
+            org = self.organization(org_id)
+            if allowed is not None and org_id not in allowed:
+                continue
+            if search.building_id is not None and org.building_id != search.building_id:
+                continue
+            if needle is not None and needle not in self.lower_name(org_id):
+                continue
+            building = self.building(org.building_id)
+            distance = None
+            if search.has_point:
+                distance = haversine_distance(
+                    search.latitude,
+                    search.longitude,
+                    building.latitude,
+                    building.longitude,
+                )
+            if box is not None:
+                if not (
+                    box[0] <= building.latitude <= box[1]
+                    and box[2] <= building.longitude <= box[3]
+                ):
+                    continue
+                if search.radius is not None and distance > search.radius:
+                    continue
+            matches.append((org, distance))
+
+        if sort == "distance":
+            matches.sort(key=lambda m: (m[1], m[0].id))
+        elif sort == "id":
+            matches.sort(key=lambda m: m[0].id)
+        else:
+            matches.sort(key=lambda m: (m[0].name, m[0].id))
+        page = matches[offset : offset + limit]
+        return [self.organization_dict(org) for org, _ in page], len(matches)
+
+    # Buildings
+
+    def list_buildings(self, with_counts: bool) -> List[dict]:
+        result = []
+        for building_id in self.building_ids():
+            item = self.building_dict(self.building(building_id))
+            if with_counts:
+                item["organization_count"] = self.building_count(building_id)
+            result.append(item)
+        return result
+
+    def get_building(self, building_id: int) -> Optional[dict]:
+        building = self.building(building_id)
+        return self.building_dict(building) if building else None
+
+    # Activities
+
+    def list_activities(self) -> List[dict]:
+        return [self.activity_dict(self.activity(a)) for a in self.activity_ids()]
+
+    def get_activity(self, activity_id: int) -> Optional[dict]:
+        activity = self.activity(activity_id)
+        return self.activity_dict(activity) if activity else None
+
+    def activity_tree(
+        self, with_counts: bool, parent_id: Optional[int] = None
+    ) -> List[dict]:
+        result = []
+        for activity_id in self.child_activity_ids(parent_id):
+            node = self.activity_dict(self.activity(activity_id))
+            node["children"] = self.activity_tree(with_counts, activity_id)
+            if with_counts:
+                node["organization_count"] = self.activity_count(activity_id)
+            result.append(node)
+        return result
+
+
+class Snapshot(BaseSnapshot):
+    """Snapshot held in process memory, loaded straight from the database"""
+
+    def __init__(
+        self,
+        version: int,
+        buildings: Iterable[Tuple],
+        activities: Iterable[Tuple],
+        organizations: Iterable[Tuple],
+        phones: Iterable[Tuple],
+        links: Iterable[Tuple],
+    ):
+        self.version = version
+        self.buildings: Dict[int, BuildingRecord] = {
+            row[0]: BuildingRecord(*row) for row in sorted(buildings)
+        }
+        self.activities: Dict[int, ActivityRecord] = {
+            row[0]: ActivityRecord(*row) for row in sorted(activities)
+        }
+        # A load that is not one consistent read can see rows whose parent was
+        # deleted in between; they are left out rather than served half-built
+        orphans = 0
+        self.organizations: Dict[int, OrganizationRecord] = {}
+        for row in sorted(organizations):
+            if row[2] in self.buildings:
+                self.organizations[row[0]] = OrganizationRecord(*row)
+            else:
+                orphans += 1
+        for phone_id, number, organization_id in sorted(phones):
+            org = self.organizations.get(organization_id)
+            if org is None:
+                orphans += 1
+                continue
+            org.phones.append((phone_id, number))
+
+        direct: Dict[int, List[int]] = {}
+        for organization_id, activity_id in sorted(links):
+            org = self.organizations.get(organization_id)
+            if org is None or activity_id not in self.activities:
+                orphans += 1
+                continue
+            org.activity_ids.append(activity_id)
+            direct.setdefault(activity_id, []).append(organization_id)
+        if orphans:
+            logger.warning(
+                "Snapshot version %s skipped %s rows referring to missing rows",
+                version,
+                orphans,
+            )
+        self.orgs_by_activity = {a: _id_array(ids) for a, ids in direct.items()}
+
+        by_building: Dict[int, List[int]] = {}
+        for org in self.organizations.values():
+            by_building.setdefault(org.building_id, []).append(org.id)
+        self.orgs_by_building = {b: _id_array(ids) for b, ids in by_building.items()}
+
+        self.children: Dict[Optional[int], List[int]] = {}
+        for activity in self.activities.values():
+            self.children.setdefault(activity.parent_id, []).append(activity.id)
+        self.subtrees = {a: self._collect_subtree(a) for a in self.activities}
+
+        self.activity_counts = {}
+        for activity_id, subtree in self.subtrees.items():
+            members = set()
+            for member in subtree:
+                members.update(self.orgs_by_activity.get(member, ()))
+            if members:
+                self.activity_counts[activity_id] = len(members)
+        self.building_counts = {b: len(ids) for b, ids in self.orgs_by_building.items()}
+
+        # Spatial index: building ids sorted by latitude
+        by_latitude = sorted(self.buildings.values(), key=lambda b: b.latitude)
+        self.latitudes = array("d", (b.latitude for b in by_latitude))
+        self.latitude_order = array("i", (b.id for b in by_latitude))
+
+        self.lower_names = {o.id: o.name.lower() for o in self.organizations.values()}
+
+    MEMORY_PARTS = (
+        "buildings",
+        "activities",
+        "organizations",
+        "orgs_by_activity",
+        "orgs_by_building",
+        "children",
+        "subtrees",
+        "activity_counts",
+        "building_counts",
+        "latitudes",
+        "latitude_order",
+        "lower_names",
+    )
+
+    def memory_usage(self) -> dict:
+        return {
+            "version": self.version,
+            "storage": "heap",
+            "parts": {
+                name: deep_sizeof(getattr(self, name)) for name in self.MEMORY_PARTS
+            },
+        }
+
+    @classmethod
+    def load(cls, connection: Connection) -> "Snapshot":
+        """Read the directory; pass a ``consistent_read`` connection"""
+        link = models.organization_activity
+        return cls(
+            version=current_version(connection),
+            buildings=connection.execute(
+                select(
+                    models.Building.id,
+                    models.Building.address,
+                    models.Building.latitude,
+                    models.Building.longitude,
+                )
+            ).all(),
+            activities=connection.execute(
+                select(
+                    models.Activity.id,
+                    models.Activity.name,
+                    models.Activity.parent_id,
+                    models.Activity.level,
+                )
+            ).all(),
+            organizations=connection.execute(
+                select(
+                    models.Organization.id,
+                    models.Organization.name,
+                    models.Organization.building_id,
+                )
+            ).all(),
+            phones=connection.execute(
+                select(
+                    models.PhoneNumber.id,
+                    models.PhoneNumber.number,
+                    models.PhoneNumber.organization_id,
+                )
+            ).all(),
+            links=connection.execute(
+                select(link.c.organization_id, link.c.activity_id)
+            ).all(),
+        )
+
+    def _collect_subtree(self, activity_id: int) -> array:
+        ids = [activity_id]
+        for child_id in self.children.get(activity_id, ()):
+            ids.extend(self._collect_subtree(child_id))
+        return array("i", ids)
+
+    def building_ids(self) -> Iterable[int]:
+        return self.buildings.keys()
+
+    def building(self, building_id: int) -> Optional[BuildingRecord]:
+        return self.buildings.get(building_id)
+
+    def activity_ids(self) -> Iterable[int]:
+        return self.activities.keys()
+
+    def activity(self, activity_id: int) -> Optional[ActivityRecord]:
+        return self.activities.get(activity_id)
+
+    def organization_ids(self) -> Iterable[int]:
+        return self.organizations.keys()
+
+    def organization(self, organization_id: int) -> Optional[OrganizationRecord]:
+        return self.organizations.get(organization_id)
+
+    def organization_ids_by_building(self, building_id: int) -> Sequence[int]:
+        return self.orgs_by_building.get(building_id, ())
+
+    def organization_ids_by_activity(self, activity_id: int) -> Sequence[int]:
+        return self.orgs_by_activity.get(activity_id, ())
+
+    def child_activity_ids(self, parent_id: Optional[int]) -> Sequence[int]:
+        return self.children.get(parent_id, ())
+
+    def subtree_ids(self, activity_id: int) -> Sequence[int]:
+        return self.subtrees.get(activity_id, ())
+
+    def building_ids_by_latitude(self, min_lat: float, max_lat: float) -> Iterable[int]:
+        start = bisect_left(self.latitudes, min_lat)
+        end = bisect_right(self.latitudes, max_lat)
+        return self.latitude_order[start:end]
+
+    def organization_ids_by_name(self, needle: str) -> List[int]:
+        return [i for i, lower in self.lower_names.items() if needle in lower]
+
+    def lower_name(self, organization_id: int) -> str:
+        return self.lower_names[organization_id]
+
+    def activity_count(self, activity_id: int) -> int:
+        return self.activity_counts.get(activity_id, 0)
+
+    def building_count(self, building_id: int) -> int:
+        return self.building_counts.get(building_id, 0)
+
+
+_current: Optional[BaseSnapshot] = None
+
+
+def get_snapshot() -> Optional[BaseSnapshot]:
+    return _current
+
+
+def install(snapshot: Optional[BaseSnapshot]) -> None:
+    global _current
+    _current = snapshot
+
+
+class DatabaseSource:
+    """Builds snapshots from the database, stale once the version moves on"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def load(self) -> Snapshot:
+        with consistent_read(self.engine) as connection:
+            return Snapshot.load(connection)
+
+    def is_stale(self, snapshot: BaseSnapshot) -> bool:
+        with self.engine.connect() as connection:
+            return current_version(connection) != snapshot.version
+
+
+def reload_snapshot(source) -> BaseSnapshot:
+    snapshot = source.load()
+    install(snapshot)
+    logger.info("Loaded directory snapshot version %s", snapshot.version)
+    return snapshot
+
+
+class SnapshotRefresher:
+    """Reloads the snapshot when its source reports it stale or on SIGHUP"""
+
+    def __init__(self, source, interval: float):
+        self.source = source
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="snapshot-refresher", daemon=True
+        )
+
+    def start(self) -> None:
+        if threading.current_thread() is threading.main_thread() and hasattr(
+            signal, "SIGHUP"
+        ):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._wakeup.set())
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            forced = self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                snapshot = get_snapshot()
+                if forced or snapshot is None or self.source.is_stale(snapshot):
+                    reload_snapshot(self.source)
+            except Exception:
+                logger.exception("Snapshot refresh failed")
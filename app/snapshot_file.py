@@ -0,0 +1,442 @@
+"""
+Versioned binary snapshot file, memory-mapped read-only by every worker.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header    magic, format version u32, section count u32, directory version u64
+    table     (offset u64, size u64) per section, in SECTIONS order
+    sections  fixed-size records, int64/float64 arrays and a UTF-8 string heap
+
+Records reference strings by (offset, length) into the heap. One-to-many
+relations are stored CSR-style: an offsets array with one entry more than
+the owning records, pointing into a flat array of ids. Workers read records
+straight from the shared page cache; nothing is copied at open time.
+
+Export with ``python -m app.snapshot_file export <path>``.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.engine import Connection
+
+from app.snapshot import (
+    ActivityRecord,
+    BaseSnapshot,
+    BuildingRecord,
+    OrganizationRecord,
+    Snapshot,
+)
+
+MAGIC = b"ORGSNAP\0"
+FORMAT_VERSION = 1
+NO_PARENT = -1
+
+HEADER = struct.Struct("<8sIIQ")
+SECTION_ENTRY = struct.Struct("<QQ")
+BUILDING = struct.Struct("<qddQQ")  # id, latitude, longitude, address (off, len)
+ACTIVITY = struct.Struct("<qqqQQ")  # id, parent_id, level, name (off, len)
+ORGANIZATION = struct.Struct("<qqQQ")  # id, building_id, name (off, len)
+PHONE = struct.Struct("<qQQ")  # id, number (off, len)
+
+SECTIONS = (
+    "strings",
+    "buildings",
+    "building_ids",
+    "activities",
+    "activity_ids",
+    "organizations",
+    "organization_ids",
+    "phone_offsets",
+    "phones",
+    "org_activity_offsets",
+    "org_activities",
+    "building_org_offsets",
+    "building_orgs",
+    "activity_org_offsets",
+    "activity_orgs",
+    "subtree_offsets",
+    "subtrees",
+    "child_offsets",
+    "children",
+    "root_activities",
+    "activity_counts",
+    "latitudes",
+    "latitude_order",
+    "name_offsets",
+    "names",
+)
+
+
+class SnapshotFileError(ValueError):
+    pass
+
+
+class _StringHeap:
+    def __init__(self):
+        self.data = bytearray()
+
+    def add(self, value: str) -> Tuple[int, int]:
+        encoded = value.encode()
+        offset = len(self.data)
+        self.data += encoded
+        return offset, len(encoded)
+
+
+def _csr(groups: Iterable[Sequence[int]]) -> Tuple[bytes, bytes]:
+    offsets = array("Q", [0])
+    values = array("q")
+    for group in groups:
+        values.fromlist(list(group))
+        offsets.append(len(values))
+    return offsets.tobytes(), values.tobytes()
+
+
+def _pack(record: struct.Struct, rows: Iterable[Tuple]) -> bytes:
+    return b"".join(record.pack(*row) for row in rows)
+
+
+def write_snapshot(snapshot: Snapshot, path: str) -> None:
+    """Serialize an in-memory snapshot; the file is replaced atomically"""
+    heap = _StringHeap()
+    sections: Dict[str, bytes] = {}
+
+    building_ids = list(snapshot.building_ids())
+    sections["buildings"] = _pack(
+        BUILDING,
+        (
+            (b.id, b.latitude, b.longitude, *heap.add(b.address))
+            for b in map(snapshot.building, building_ids)
+        ),
+    )
+    sections["building_ids"] = array("q", building_ids).tobytes()
+
+    activity_ids = list(snapshot.activity_ids())
+    sections["activities"] = _pack(
+        ACTIVITY,
+        (
+            (
+                a.id,
+                NO_PARENT if a.parent_id is None else a.parent_id,
+                a.level,
+                *heap.add(a.name),
+            )
+            for a in map(snapshot.activity, activity_ids)
+        ),
+    )
+    sections["activity_ids"] = array("q", activity_ids).tobytes()
+
+    organization_ids = list(snapshot.organization_ids())
+    organizations = [snapshot.organization(i) for i in organization_ids]
+    sections["organizations"] = _pack(
+        ORGANIZATION,
+        ((o.id, o.building_id, *heap.add(o.name)) for o in organizations),
+    )
+    sections["organization_ids"] = array("q", organization_ids).tobytes()
+
+    phone_offsets = array("Q", [0])
+    phones = []
+    for org in organizations:
+        phones.extend((phone_id, *heap.add(number)) for phone_id, number in org.phones)
+        phone_offsets.append(len(phones))
+    sections["phone_offsets"] = phone_offsets.tobytes()
+    sections["phones"] = _pack(PHONE, phones)
+
+    sections["org_activity_offsets"], sections["org_activities"] = _csr(
+        o.activity_ids for o in organizations
+    )
+    sections["building_org_offsets"], sections["building_orgs"] = _csr(
+        snapshot.organization_ids_by_building(b) for b in building_ids
+    )
+    sections["activity_org_offsets"], sections["activity_orgs"] = _csr(
+        snapshot.organization_ids_by_activity(a) for a in activity_ids
+    )
+    sections["subtree_offsets"], sections["subtrees"] = _csr(
+        snapshot.subtree_ids(a) for a in activity_ids
+    )
+    sections["child_offsets"], sections["children"] = _csr(
+        snapshot.child_activity_ids(a) for a in activity_ids
+    )
+    sections["root_activities"] = array(
+        "q", snapshot.child_activity_ids(None)
+    ).tobytes()
+    sections["activity_counts"] = array(
+        "q", (snapshot.activity_count(a) for a in activity_ids)
+    ).tobytes()
+
+    by_latitude = sorted(building_ids, key=lambda b: (snapshot.building(b).latitude, b))
+    sections["latitudes"] = array(
+        "d", (snapshot.building(b).latitude for b in by_latitude)
+    ).tobytes()
+    sections["latitude_order"] = array("q", by_latitude).tobytes()
+
+    # Lower-cased names, newline-terminated, searched in place with mmap.find
+    names = bytearray()
+    name_offsets = array("Q", [0])
+    for organization_id in organization_ids:
+        names += snapshot.lower_name(organization_id).encode() + b"\n"
+        name_offsets.append(len(names))
+    sections["name_offsets"] = name_offsets.tobytes()
+    sections["names"] = bytes(names)
+    sections["strings"] = bytes(heap.data)
+
+    offset = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    table = []
+    for name in SECTIONS:
+        offset += -offset % 8
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS), snapshot.version))
+        for entry in table:
+            f.write(SECTION_ENTRY.pack(*entry))
+        for name, (section_offset, _) in zip(SECTIONS, table):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(sections[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_snapshot(connection: Connection, path: str) -> Snapshot:
+    snapshot = Snapshot.load(connection)
+    write_snapshot(snapshot, path)
+    return snapshot
+
+
+def _find(ids: Sequence[int], value: int) -> Optional[int]:
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        return position
+    return None
+
+
+class MappedSnapshot(BaseSnapshot):
+    """Snapshot served from a memory-mapped snapshot file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.file_stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise SnapshotFileError(f"{path} is not a snapshot file")
+        magic, format_version, section_count, version = HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != MAGIC:
+            raise SnapshotFileError(f"{path} is not a snapshot file")
+        if format_version != FORMAT_VERSION or section_count != len(SECTIONS):
+            raise SnapshotFileError(
+                f"Unsupported snapshot format {format_version} in {path}"
+            )
+        self.version = version
+
+        self._buffer = memoryview(self._mmap)
+        self._sections = {}
+        for index, name in enumerate(SECTIONS):
+            offset, size = SECTION_ENTRY.unpack_from(
+                self._mmap, HEADER.size + index * SECTION_ENTRY.size
+            )
+            self._sections[name] = (offset, size)
+
+        self._building_ids = self._array("building_ids", "q")
+        self._activity_ids = self._array("activity_ids", "q")
+        self._organization_ids = self._array("organization_ids", "q")
+        self._latitudes = self._array("latitudes", "d")
+        self._latitude_order = self._array("latitude_order", "q")
+        self._name_offsets = self._array("name_offsets", "Q")
+        self._activity_counts = self._array("activity_counts", "q")
+        self._root_activities = self._array("root_activities", "q")
+
+    def memory_usage(self) -> dict:
+        # Mapped pages are shared by all workers through the page cache
+        return {
+            "version": self.version,
+            "storage": "mmap",
+            "file_bytes": len(self._mmap),
+            "parts": {name: size for name, (_, size) in self._sections.items()},
+        }
+
+    def _array(self, name: str, fmt: str) -> memoryview:
+        offset, size = self._sections[name]
+        return self._buffer[offset : offset + size].cast(fmt)
+
+    def _group(self, offsets_name: str, values_name: str, position: int):
+        offsets = self._array(offsets_name, "Q")
+        values = self._array(values_name, "q")
+        return values[offsets[position] : offsets[position + 1]]
+
+    def _string(self, offset: int, length: int) -> str:
+        base = self._sections["strings"][0] + offset
+        return str(self._buffer[base : base + length], "utf-8")
+
+    def _record(self, section: str, record: struct.Struct, position: int) -> Tuple:
+        return record.unpack_from(
+            self._mmap, self._sections[section][0] + position * record.size
+        )
+
+    def building_ids(self) -> Iterable[int]:
+        return self._building_ids
+
+    def building(self, building_id: int) -> Optional[BuildingRecord]:
+        position = _find(self._building_ids, building_id)
+        if position is None:
+            return None
+        id, latitude, longitude, offset, length = self._record(
+            "buildings", BUILDING, position
+        )
+        return BuildingRecord(id, self._string(offset, length), latitude, longitude)
+
+    def activity_ids(self) -> Iterable[int]:
+        return self._activity_ids
+
+    def activity(self, activity_id: int) -> Optional[ActivityRecord]:
+        position = _find(self._activity_ids, activity_id)
+        if position is None:
+            return None
+        id, parent_id, level, offset, length = self._record(
+            "activities", ACTIVITY, position
+        )
+        return ActivityRecord(
+            id,
+            self._string(offset, length),
+            None if parent_id == NO_PARENT else parent_id,
+            level,
+        )
+
+    def organization_ids(self) -> Iterable[int]:
+        return self._organization_ids
+
+    def organization(self, organization_id: int) -> Optional[OrganizationRecord]:
+        position = _find(self._organization_ids, organization_id)
+        if position is None:
+            return None
+        id, building_id, offset, length = self._record(
+            "organizations", ORGANIZATION, position
+        )
+        org = OrganizationRecord(id, self._string(offset, length), building_id)
+
+        phone_offsets = self._array("phone_offsets", "Q")
+        for phone in range(phone_offsets[position], phone_offsets[position + 1]):
+            phone_id, offset, length = self._record("phones", PHONE, phone)
+            org.phones.append((phone_id, self._string(offset, length)))
+        org.activity_ids = self._group(
+            "org_activity_offsets", "org_activities", position
+        )
+        return org
+
+    def organization_ids_by_building(self, building_id: int) -> Sequence[int]:
+        position = _find(self._building_ids, building_id)
+        return (
+            ()
+            if position is None
+            else self._group("building_org_offsets", "building_orgs", position)
+        )
+
+    def organization_ids_by_activity(self, activity_id: int) -> Sequence[int]:
+        position = _find(self._activity_ids, activity_id)
+        return (
+            ()
+            if position is None
+            else self._group("activity_org_offsets", "activity_orgs", position)
+        )
+
+    def child_activity_ids(self, parent_id: Optional[int]) -> Sequence[int]:
+        if parent_id is None:
+            return self._root_activities
+        position = _find(self._activity_ids, parent_id)
+        return (
+            ()
+            if position is None
+            else self._group("child_offsets", "children", position)
+        )
+
+    def subtree_ids(self, activity_id: int) -> Sequence[int]:
+        position = _find(self._activity_ids, activity_id)
+        return (
+            ()
+            if position is None
+            else self._group("subtree_offsets", "subtrees", position)
+        )
+
+    def building_ids_by_latitude(self, min_lat: float, max_lat: float) -> Iterable[int]:
+        start = bisect_left(self._latitudes, min_lat)
+        end = bisect_right(self._latitudes, max_lat)
+        return self._latitude_order[start:end]
+
+    def organization_ids_by_name(self, needle: str) -> List[int]:
+        if not needle:
+            return list(self._organization_ids)
+        pattern = needle.encode()
+        base, size = self._sections["names"]
+        end = base + size
+        result = []
+        position = self._mmap.find(pattern, base, end)
+        while position != -1:
+            index = bisect_right(self._name_offsets, position - base) - 1
+            name_end = base + self._name_offsets[index + 1] - 1
+            if position + len(pattern) <= name_end:
+                result.append(self._organization_ids[index])
+            # Continue with the next name so each organization matches once
+            position = self._mmap.find(pattern, name_end + 1, end)
+        return result
+
+    def lower_name(self, organization_id: int) -> str:
+        position = _find(self._organization_ids, organization_id)
+        base = self._sections["names"][0]
+        start = base + self._name_offsets[position]
+        end = base + self._name_offsets[position + 1] - 1
+        return str(self._buffer[start:end], "utf-8")
+
+    def activity_count(self, activity_id: int) -> int:
+        position = _find(self._activity_ids, activity_id)
+        return 0 if position is None else self._activity_counts[position]
+
+    def building_count(self, building_id: int) -> int:
+        return len(self.organization_ids_by_building(building_id))
+
+
+class FileSource:
+    """Opens snapshot files, stale once the file at the path is replaced"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> MappedSnapshot:
+        return MappedSnapshot(self.path)
+
+    def is_stale(self, snapshot: BaseSnapshot) -> bool:
+        current = os.stat(self.path)
+        loaded = getattr(snapshot, "file_stat", None)
+        return loaded is None or (current.st_ino, current.st_mtime_ns) != (
+            loaded.st_ino,
+            loaded.st_mtime_ns,
+        )
+
+
+def main(argv):
+    if len(argv) != 3 or argv[1] != "export":
+        print("Usage: python -m app.snapshot_file export <path>")
+        return 2
+
+    from app.database import consistent_read, get_engine
+
+    with consistent_read(get_engine()) as connection:
+        snapshot = export_snapshot(connection, argv[2])
+    print(
+        f"Exported snapshot version {snapshot.version} to {argv[2]}: "
+        f"{len(snapshot.buildings)} buildings, {len(snapshot.activities)} "
+        f"activities, {len(snapshot.organizations)} organizations"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,281 @@
+"""
+Per-request timing breakdown, reported as a Server-Timing header and log fields.
+
+Phases:
+
+* ``auth`` - API key verification
+* ``db`` - time inside cursor execution, with the number of queries
+* ``orm`` - the endpoint body minus its database time: statement
+  construction, ORM hydration and handler logic
+* ``serialize`` - response model validation and JSON encoding, minus lazy
+  loads triggered while serializing
+* ``total`` - from the first byte of the request to the response start
+
+The state lives in a context variable, so the cost per request is a handful
+of ``perf_counter`` calls; nothing is recorded outside of a request.
+
+The same bookkeeping drives the slow query log and the per-route query
+budget: a request that runs more statements than its route allows is logged,
+or fails outright in strict mode so that new N+1 patterns break the tests.
+"""
+
+import asyncio
+import functools
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.slow_query")
+
+# Longest parameter repr kept in a slow query record
+MAX_LOGGED_PARAMETERS = 1000
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class RequestTimings:
+    __slots__ = (
+        "started",
+        "total",
+        "auth",
+        "db",
+        "queries",
+        "orm",
+        "serialize",
+        "depth",
+        "endpoint_done",
+        "db_at_endpoint_done",
+        "route",
+        "slow_query_seconds",
+    )
+
+    def __init__(self, slow_query_seconds: Optional[float] = None):
+        self.started = perf_counter()
+        self.total = 0.0
+        self.auth = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.orm = 0.0
+        self.serialize = 0.0
+        self.depth = 0
+        self.endpoint_done: Optional[float] = None
+        self.db_at_endpoint_done = 0.0
+        self.route: Optional[str] = None
+        self.slow_query_seconds = slow_query_seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "auth_ms": round(self.auth * 1000, 3),
+            "db_ms": round(self.db * 1000, 3),
+            "queries": self.queries,
+            "orm_ms": round(self.orm * 1000, 3),
+            "serialize_ms": round(self.serialize * 1000, 3),
+            "total_ms": round(self.total * 1000, 3),
+        }
+
+    def header(self) -> str:
+        return ", ".join(
+            [
+                f"auth;dur={self.auth * 1000:.3f}",
+                f'db;dur={self.db * 1000:.3f};desc="{self.queries} queries"',
+                f"orm;dur={self.orm * 1000:.3f}",
+                f"serialize;dur={self.serialize * 1000:.3f}",
+                f"total;dur={self.total * 1000:.3f}",
+            ]
+        )
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A request ran more SQL statements than its route's budget allows"""
+
+
+def current() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def record_auth(seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.auth += seconds
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["timing_query_started"] = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("timing_query_started", None)
+    timings = _current.get()
+    if started is None or timings is None:
+        return
+    duration = perf_counter() - started
+    timings.db += duration
+    timings.queries += 1
+    if (
+        timings.slow_query_seconds is not None
+        and duration >= timings.slow_query_seconds
+    ):
+        _log_slow_query(timings, statement, parameters, duration)
+
+
+def _log_slow_query(timings, statement, parameters, duration) -> None:
+    logged_parameters = repr(parameters)
+    if len(logged_parameters) > MAX_LOGGED_PARAMETERS:
+        logged_parameters = logged_parameters[:MAX_LOGGED_PARAMETERS] + "..."
+    slow_query_logger.warning(
+        "Slow query (%.1fms) in %s: %s",
+        duration * 1000,
+        timings.route,
+        statement,
+        extra={
+            "route": timings.route,
+            "duration_ms": round(duration * 1000, 3),
+            "statement": statement,
+            "parameters": logged_parameters,
+        },
+    )
+
+
+def query_budget(settings, route: Optional[str]) -> int:
+    return settings.query_budgets.get(route, settings.query_budget)
+
+
+def _check_query_budget(request, timings: RequestTimings) -> None:
+    settings = request.app.state.settings
+    budget = query_budget(settings, timings.route)
+    if timings.queries <= budget:
+        return
+    message = (
+        f"{request.method} {timings.route} ran {timings.queries} SQL statements, "
+        f"over its budget of {budget}"
+    )
+    if settings.query_budget_strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(
+        message,
+        extra={"route": timings.route, "queries": timings.queries, "budget": budget},
+    )
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    if not asyncio.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def timed(*args, **kwargs):
+        timings = _current.get()
+        # Sub-requests dispatched by /batch are part of the outer endpoint
+        if timings is None or timings.depth != 1:
+            return await endpoint(*args, **kwargs)
+        started = perf_counter()
+        db_before = timings.db
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            now = perf_counter()
+            timings.orm += (now - started) - (timings.db - db_before)
+            timings.endpoint_done = now
+            timings.db_at_endpoint_done = timings.db
+
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """Route that splits its handler time into endpoint and serialization"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            # Route template for logs and metrics labels
+            request.scope["route_path"] = self.path
+            timings = _current.get()
+            if timings is None:
+                return await handler(request)
+            timings.depth += 1
+            if timings.depth == 1:
+                timings.route = self.path
+            try:
+                response = await handler(request)
+            finally:
+                timings.depth -= 1
+                if timings.depth == 0 and timings.endpoint_done is not None:
+                    timings.serialize = (perf_counter() - timings.endpoint_done) - (
+                        timings.db - timings.db_at_endpoint_done
+                    )
+            if timings.depth == 0:
+                _check_query_budget(request, timings)
+            return response
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware collecting request timings
+
+    With ``header`` set, the timings are also sent as a Server-Timing header
+    and logged. Statements slower than ``slow_query_ms`` go to the slow query
+    log.
+    """
+
+    def __init__(self, app, header: bool = True, slow_query_ms: Optional[float] = None):
+        self.app = app
+        self.header = header
+        self.slow_query_seconds = (
+            slow_query_ms / 1000 if slow_query_ms is not None else None
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(self.slow_query_seconds)
+        token = _current.set(timings)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timings.total = perf_counter() - timings.started
+                if self.header:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", timings.header()
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if self.header and logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "%s %s %s %.1fms",
+                    scope["method"],
+                    scope["path"],
+                    status_code,
+                    timings.total * 1000,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "route": scope.get("route_path"),
+                        "status_code": status_code,
+                        **timings.as_dict(),
+                    },
+                )
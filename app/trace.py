@@ -0,0 +1,171 @@
+"""
+Traffic capture for load tests and release comparisons.
+
+With ``TRACE_SAMPLE_RATE`` above zero, that share of requests is appended to
+``TRACE_PATH`` as one JSON object per line:
+
+    {"ts": 1700000000.123, "method": "GET", "path": "/organizations/1",
+     "query": "", "body": null, "route": "/organizations/{organization_id}",
+     "status": 200, "duration_ms": 3.2}
+
+API keys and other headers are never recorded. Bodies longer than
+``TRACE_MAX_BODY_BYTES`` (bulk writes, batches) are replaced by their length
+and SHA-256 as ``body_bytes`` and ``body_sha256``, so large payloads and
+whatever they carry stay out of the file. Records are written by a background
+thread; the event loop only queues them. ``python -m benchmarks.replay`` fires
+a trace at a running server.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Optional
+
+QUEUE_SIZE = 10000
+
+
+class TraceWriter:
+    """Appends trace records to a JSONL file shared by all workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dropped = 0
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+
+    def _open(self) -> int:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # O_APPEND keeps whole-line writes from several workers from interleaving
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, record: dict) -> None:
+        """Queue ``record`` for the writer thread; never blocks"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-writer", daemon=True
+                )
+                self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # A stalled disk must not hold up requests; the trace is a sample
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode()
+                if self._fd is None:
+                    self._fd = self._open()
+                os.write(self._fd, line)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Wait until every queued record is on disk"""
+        self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _decode_body(body: bytes):
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode(errors="replace")
+
+
+class _BodyRecorder:
+    """Keeps a request body up to ``limit`` bytes, and its length and digest"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.length = 0
+        self.digest = hashlib.sha256()
+        self.head = bytearray()
+
+    def add(self, chunk: bytes) -> None:
+        self.length += len(chunk)
+        self.digest.update(chunk)
+        if len(self.head) <= self.limit:
+            self.head.extend(chunk[: self.limit + 1 - len(self.head)])
+
+    def fields(self) -> dict:
+        if self.length <= self.limit:
+            return {"body": _decode_body(bytes(self.head))}
+        return {
+            "body": None,
+            "body_bytes": self.length,
+            "body_sha256": self.digest.hexdigest(),
+        }
+
+
+class TraceCaptureMiddleware:
+    """ASGI middleware sampling requests into a trace file"""
+
+    def __init__(
+        self, app, writer: TraceWriter, sample_rate: float, max_body_bytes: int
+    ):
+        self.app = app
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.time()
+        body = _BodyRecorder(self.max_body_bytes)
+        status_code: Optional[int] = None
+
+        async def receive_recorded():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.add(message.get("body", b""))
+            return message
+
+        async def send_recorded(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            self.writer.write(
+                {
+                    "ts": round(started, 3),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode(),
+                    **body.fields(),
+                    "route": scope.get("route_path"),
+                    "status": status_code,
+                    "duration_ms": round((time.time() - started) * 1000, 3),
+                }
+            )
@@ -0,0 +1,181 @@
+"""
+Global directory version, bumped by every flush that changes directory data.
+
+Readers that keep derived copies of the directory (snapshots, caches) compare
+the version to find out whether they are stale. Buildings and activities
+also have versions of their own, so copies of only those tables survive
+writes to organizations.
+
+Every written building, activity and organization row is stamped with the
+directory version of its write in ``row_version``, and deletes leave a
+tombstone, so the change feed can list everything after a given version.
+"""
+
+from typing import Iterable, Set, Tuple
+
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import models
+
+DIRECTORY_MODELS = (
+    models.Building,
+    models.Activity,
+    models.Organization,
+    models.PhoneNumber,
+)
+VERSIONED_MODELS = (models.Building, models.Activity, models.Organization)
+ENTITY_NAMES = {
+    models.Building: "building",
+    models.Activity: "activity",
+    models.Organization: "organization",
+}
+CHANGED_KEY = "directory_changed"
+UNCOMMITTED_KEY = "directory_uncommitted"
+VERSION_ROW_ID = 1
+BUILDINGS_VERSION_ID = 2
+ACTIVITIES_VERSION_ID = 3
+SCOPED_VERSION_IDS = {
+    models.Building: BUILDINGS_VERSION_ID,
+    models.Activity: ACTIVITIES_VERSION_ID,
+}
+
+
+def current_version(connection: Connection, version_id: int = VERSION_ROW_ID) -> int:
+    table = models.DirectoryVersion.__table__
+    version = connection.execute(
+        select(table.c.version).where(table.c.id == version_id)
+    ).scalar()
+    return version or 0
+
+
+def bump_version(connection: Connection, version_id: int = VERSION_ROW_ID) -> int:
+    table = models.DirectoryVersion.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.id == version_id)
+        .values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=version_id, version=1))
+    return current_version(connection, version_id)
+
+
+def version_ids_for(changed_models: Iterable[type]) -> Set[int]:
+    """The directory version plus the scoped versions of ``changed_models``"""
+    version_ids = {VERSION_ROW_ID}
+    for model in changed_models:
+        if model in SCOPED_VERSION_IDS:
+            version_ids.add(SCOPED_VERSION_IDS[model])
+    return version_ids
+
+
+def bump_versions(connection: Connection, changed_models: Iterable[type]) -> int:
+    """Bump versions for a write to ``changed_models``; return the new version
+
+    Writes that bypass the session, e.g. Core inserts, call this themselves
+    and stamp their rows with the returned version.
+    """
+    version = 0
+    for version_id in sorted(version_ids_for(changed_models)):
+        bumped = bump_version(connection, version_id)
+        if version_id == VERSION_ROW_ID:
+            version = bumped
+    return version
+
+
+def has_uncommitted_changes(session: Session) -> bool:
+    """Whether the session flushed directory changes that are not committed yet"""
+    return session.info.get(UNCOMMITTED_KEY, False)
+
+
+def _is_directory_object(obj) -> bool:
+    return isinstance(obj, DIRECTORY_MODELS)
+
+
+def _stamp(organization, version: int, organization_ids: Set[int]) -> None:
+    if isinstance(organization, models.Organization):
+        organization.row_version = version
+    elif organization is not None:
+        organization_ids.add(organization)
+
+
+@event.listens_for(Session, "before_flush")
+def _detect_changes(session, flush_context, instances):
+    written = [*session.new, *session.dirty]
+    deleted = list(session.deleted)
+    changed = {type(obj) for obj in (*written, *deleted) if _is_directory_object(obj)}
+    if not changed:
+        return
+
+    # Bumping before the flush gives the rows their version. The counter row
+    # stays locked until commit, so concurrent writers commit in version order.
+    version = bump_versions(session.connection(), changed)
+    session.info[UNCOMMITTED_KEY] = True
+
+    # Phones and activity links are part of their organization's row
+    organization_ids: Set[int] = set()
+    for obj in written:
+        if isinstance(obj, VERSIONED_MODELS):
+            obj.row_version = version
+        if isinstance(obj, models.PhoneNumber):
+            _stamp(obj.organization or obj.organization_id, version, organization_ids)
+        elif isinstance(obj, models.Activity) and obj in session.dirty:
+            history = inspect(obj).attrs["organizations"].history
+            for organization in (*history.added, *history.deleted):
+                _stamp(organization, version, organization_ids)
+
+    tombstones = []
+    for obj in deleted:
+        if isinstance(obj, models.PhoneNumber):
+            organization_ids.add(obj.organization_id)
+        elif isinstance(obj, VERSIONED_MODELS):
+            tombstones.append((ENTITY_NAMES[type(obj)], obj.id))
+            if isinstance(obj, models.Activity):
+                for organization in obj.organizations:
+                    _stamp(organization, version, organization_ids)
+    session.info[CHANGED_KEY] = (version, organization_ids, tombstones)
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    pending = session.info.pop(CHANGED_KEY, None)
+    if not pending:
+        return
+    version, organization_ids, tombstones = pending
+    connection = session.connection()
+    organization_ids.discard(None)
+    if organization_ids:
+        table = models.Organization.__table__
+        connection.execute(
+            update(table)
+            .where(table.c.id.in_(organization_ids))
+            .values(row_version=version)
+        )
+    if tombstones:
+        record_tombstones(connection, tombstones, version)
+
+
+def record_tombstones(
+    connection: Connection, tombstones: Iterable[Tuple[str, int]], version: int
+) -> None:
+    """Record deleted ``(entity, id)`` pairs for the change feed"""
+    table = models.Tombstone.__table__
+    rows = [
+        {"entity": entity, "entity_id": entity_id, "version": version}
+        for entity, entity_id in tombstones
+    ]
+    for row in rows:
+        connection.execute(
+            delete(table).where(
+                table.c.entity == row["entity"], table.c.entity_id == row["entity_id"]
+            )
+        )
+    connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _clear_uncommitted(session):
+    session.info.pop(UNCOMMITTED_KEY, None)
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: ad-hoc ORM queries vs the prebuilt by-id statements.
+
+    python -m benchmarks.by_id_lookups --rows 1000 --iterations 20000
+
+Both paths load an organization with the same eager loading, so the
+difference is statement construction and cache-key generation. This runs on
+SQLite; with PostgreSQL, ``PREPARE_THRESHOLD`` only takes effect under the
+psycopg 3 driver and does nothing with psycopg2 from requirements.txt.
+"""
+
+import argparse
+import random
+import timeit
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import models, queries
+from app.database import Base
+
+
+def ad_hoc_organization(db, organization_id):
+    return (
+        db.query(models.Organization)
+        .options(*queries.ORGANIZATION_DETAIL)
+        .filter(models.Organization.id == organization_id)
+        .first()
+    )
+
+
+def ad_hoc_building(db, building_id):
+    return db.query(models.Building).filter(models.Building.id == building_id).first()
+
+
+def ad_hoc_activity(db, activity_id):
+    return db.query(models.Activity).filter(models.Activity.id == activity_id).first()
+
+
+CASES = [
+    ("organization", ad_hoc_organization, queries.get_organization),
+    ("building", ad_hoc_building, queries.get_building),
+    ("activity", ad_hoc_activity, queries.get_activity),
+]
+
+
+def seed(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.Building),
+            [
+                {"id": i, "address": f"Address {i}", "latitude": 0.0, "longitude": 0.0}
+                for i in range(1, rows + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.Activity),
+            [
+                {"id": i, "name": f"Activity {i}", "level": 1}
+                for i in range(1, rows + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.Organization),
+            [
+                {"id": i, "name": f"Organization {i}", "building_id": i}
+                for i in range(1, rows + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.PhoneNumber),
+            [
+                {"organization_id": i, "number": f"8-800-{i:07d}"}
+                for i in range(1, rows + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.organization_activity),
+            [{"organization_id": i, "activity_id": i} for i in range(1, rows + 1)],
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows)
+    keys = [random.randint(1, args.rows) for _ in range(args.iterations)]
+
+    for name, ad_hoc, prebuilt in CASES:
+        timings = {}
+        for label, lookup in (("ad hoc", ad_hoc), ("prebuilt", prebuilt)):
+            with Session(engine) as db:
+                lookup(db, keys[0])
+                # Clear the identity map so every lookup loads a fresh row
+                it = iter(keys)
+                timings[label] = timeit.timeit(
+                    lambda: (lookup(db, next(it)), db.expunge_all()),
+                    number=args.iterations,
+                )
+        ad_hoc_us = timings["ad hoc"] / args.iterations * 1e6
+        prebuilt_us = timings["prebuilt"] / args.iterations * 1e6
+        print(
+            f"{name:>12}: ad hoc {ad_hoc_us:7.1f} us, prebuilt {prebuilt_us:7.1f} us, "
+            f"saved {ad_hoc_us - prebuilt_us:6.1f} us/request "
+            f"({(1 - prebuilt_us / ad_hoc_us) * 100:.0f}%)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Synthetic directory generator for load tests and benchmarks.
+
+    python -m benchmarks.dataset --organizations 100000 --buildings 20000 \
+        --activity-width 6 --seed 1
+
+Buildings are scattered around real cities, more of them in larger ones, and
+organizations are spread over buildings and activities with a long tail:
+most have one or two phone numbers and activities, a few have many. Rows are
+written with multi-row inserts in batches, ids are assigned up front so no
+row has to be read back, all rows share one directory version and the facet
+counts are rebuilt once at the end. The configured ``DATABASE_URL`` is used unless
+``--database-url`` is given; existing rows are kept and new ids follow them.
+"""
+
+import argparse
+import math
+import random
+import time
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Connection, Engine
+
+from app import ancestry, facets, importer, models, versioning
+from app.database import Base
+
+# (name, latitude, longitude, relative weight, spread in km)
+CITIES = [
+    ("Москва", 55.7558, 37.6173, 13.0, 18.0),
+    ("Санкт-Петербург", 59.9343, 30.3351, 5.6, 14.0),
+    ("Новосибирск", 55.0084, 82.9357, 1.6, 10.0),
+    ("Екатеринбург", 56.8389, 60.6057, 1.5, 10.0),
+    ("Казань", 55.7961, 49.1064, 1.3, 9.0),
+    ("Нижний Новгород", 56.2965, 43.9361, 1.2, 9.0),
+    ("Челябинск", 55.1644, 61.4368, 1.2, 9.0),
+    ("Самара", 53.1959, 50.1002, 1.2, 9.0),
+    ("Омск", 54.9885, 73.3242, 1.1, 8.0),
+    ("Ростов-на-Дону", 47.2357, 39.7015, 1.1, 8.0),
+    ("Уфа", 54.7388, 55.9721, 1.1, 8.0),
+    ("Красноярск", 56.0153, 92.8932, 1.1, 8.0),
+    ("Воронеж", 51.6720, 39.1843, 1.0, 7.0),
+    ("Пермь", 58.0105, 56.2502, 1.0, 7.0),
+    ("Владивосток", 43.1155, 131.8855, 0.6, 6.0),
+]
+STREETS = [
+    "Ленина",
+    "Мира",
+    "Советская",
+    "Гагарина",
+    "Пушкина",
+    "Садовая",
+    "Лесная",
+    "Школьная",
+    "Набережная",
+    "Центральная",
+]
+WORDS = [
+    "Альфа",
+    "Вектор",
+    "Гранит",
+    "Дельта",
+    "Заря",
+    "Исток",
+    "Кедр",
+    "Лидер",
+    "Меридиан",
+    "Орион",
+    "Прогресс",
+    "Радуга",
+    "Север",
+    "Стандарт",
+    "Титан",
+    "Форвард",
+]
+FORMS = ["ООО", "АО", "ИП", "ПАО"]
+KM_PER_DEGREE = 111.32
+
+# Number of phones / activities per organization and how often it occurs
+PHONE_FAN_OUT = ((1, 55), (2, 30), (3, 10), (5, 4), (8, 1))
+ACTIVITY_FAN_OUT = ((1, 50), (2, 30), (3, 15), (5, 5))
+
+
+def _next_id(connection: Connection, model) -> int:
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _fan_out(rng: random.Random, table) -> int:
+    counts, weights = zip(*table)
+    return rng.choices(counts, weights)[0]
+
+
+def _batched(rows: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def building_rows(rng: random.Random, count: int, first_id: int) -> Iterator[dict]:
+    weights = [city[3] for city in CITIES]
+    for building_id in range(first_id, first_id + count):
+        name, latitude, longitude, _, spread = rng.choices(CITIES, weights)[0]
+        # Gaussian scatter in km, converted to degrees at the city's latitude
+        north = rng.gauss(0, spread / 2)
+        east = rng.gauss(0, spread / 2)
+        yield {
+            "id": building_id,
+            "address": f"г. {name}, ул. {rng.choice(STREETS)}, {rng.randint(1, 200)}",
+            "latitude": round(latitude + north / KM_PER_DEGREE, 6),
+            "longitude": round(
+                longitude + east / (KM_PER_DEGREE * math.cos(math.radians(latitude))),
+                6,
+            ),
+        }
+
+
+def activity_rows(width: int, first_id: int) -> List[dict]:
+    """A full tree with ``width`` children per node on all three levels"""
+    rows = []
+    next_id = first_id
+    parents: Sequence[Tuple[Optional[int], str]] = [(None, "")]
+    for level in (1, 2, 3):
+        children = []
+        for parent_id, prefix in parents:
+            for position in range(1, width + 1):
+                label = f"{prefix}.{position}" if prefix else str(position)
+                rows.append(
+                    {
+                        "id": next_id,
+                        "name": f"Вид деятельности {label}",
+                        "parent_id": parent_id,
+                        "level": level,
+                    }
+                )
+                children.append((next_id, label))
+                next_id += 1
+        parents = children
+    return rows
+
+
+def organization_rows(
+    rng: random.Random,
+    count: int,
+    first_id: int,
+    building_ids: Sequence[int],
+    activity_ids: Sequence[int],
+) -> Iterator[Tuple[dict, List[dict], List[dict]]]:
+    # Zipf-like popularity: a few buildings and activities get most organizations
+    building_weights = list(
+        accumulate(1 / rank**0.8 for rank in range(1, len(building_ids) + 1))
+    )
+    activity_weights = list(
+        accumulate(1 / rank for rank in range(1, len(activity_ids) + 1))
+    )
+    for organization_id in range(first_id, first_id + count):
+        organization = {
+            "id": organization_id,
+            "name": (
+                f'{rng.choice(FORMS)} "{rng.choice(WORDS)} {rng.choice(WORDS)}" '
+                f"#{organization_id}"
+            ),
+            "building_id": rng.choices(building_ids, cum_weights=building_weights)[0],
+        }
+        phones = [
+            {
+                "organization_id": organization_id,
+                "number": f"8-{rng.randint(300, 999)}-{rng.randint(100, 999)}-"
+                f"{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+            }
+            for _ in range(_fan_out(rng, PHONE_FAN_OUT))
+        ]
+        chosen = set()
+        for _ in range(_fan_out(rng, ACTIVITY_FAN_OUT)):
+            chosen.add(rng.choices(activity_ids, cum_weights=activity_weights)[0])
+        links = [
+            {"organization_id": organization_id, "activity_id": activity_id}
+            for activity_id in sorted(chosen)
+        ]
+        yield organization, phones, links
+
+
+def generate(
+    engine: Engine,
+    organizations: int,
+    buildings: Optional[int] = None,
+    activity_width: int = 5,
+    seed: int = 0,
+    batch_size: int = 10000,
+) -> Dict[str, int]:
+    """Insert a synthetic directory and return the number of rows per table"""
+    if activity_width < 1:
+        raise ValueError("activity_width must be at least 1")
+    if buildings is None:
+        buildings = max(organizations // 5, 1)
+    rng = random.Random(seed)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        first_building = _next_id(connection, models.Building)
+        first_activity = _next_id(connection, models.Activity)
+        first_organization = _next_id(connection, models.Organization)
+        version = versioning.bump_versions(
+            connection, [models.Building, models.Activity, models.Organization]
+        )
+
+        for batch in _batched(
+            building_rows(rng, buildings, first_building), batch_size
+        ):
+            connection.execute(
+                insert(models.Building).values(row_version=version), batch
+            )
+
+        activities = activity_rows(activity_width, first_activity)
+        connection.execute(
+            insert(models.Activity).values(row_version=version), activities
+        )
+
+        building_ids = list(range(first_building, first_building + buildings))
+        # Shuffle so popularity is not tied to id order or city
+        rng.shuffle(building_ids)
+        activity_ids = [row["id"] for row in activities]
+        rng.shuffle(activity_ids)
+
+        counts = {
+            "buildings": buildings,
+            "activities": len(activities),
+            "organizations": 0,
+            "phone_numbers": 0,
+            "organization_activity": 0,
+        }
+        rows = organization_rows(
+            rng, organizations, first_organization, building_ids, activity_ids
+        )
+        for batch in _batched(rows, batch_size):
+            phones = [phone for _, batch_phones, _ in batch for phone in batch_phones]
+            links = [link for _, _, batch_links in batch for link in batch_links]
+            connection.execute(
+                insert(models.Organization).values(row_version=version),
+                [row for row, _, _ in batch],
+            )
+            connection.execute(insert(models.PhoneNumber), phones)
+            connection.execute(insert(models.organization_activity), links)
+            counts["organizations"] += len(batch)
+            counts["phone_numbers"] += len(phones)
+            counts["organization_activity"] += len(links)
+
+        importer.sync_sequences(connection)
+        # Core inserts bypass the session hooks that keep these current
+        facets.rebuild_counts(connection)
+        ancestry.rebuild(connection)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--organizations", type=int, default=1000)
+    parser.add_argument(
+        "--buildings", type=int, help="Defaults to one per five organizations"
+    )
+    parser.add_argument(
+        "--activity-width",
+        type=int,
+        default=5,
+        help="Children per activity on each of the three levels",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    from app.database import get_engine
+
+    engine = get_engine(args.database_url)
+    started = time.perf_counter()
+    counts = generate(
+        engine,
+        organizations=args.organizations,
+        buildings=args.buildings,
+        activity_width=args.activity_width,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    elapsed = time.perf_counter() - started
+    for table, rows in counts.items():
+        print(f"{table:>22}: {rows}")
+    print(f"Generated in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
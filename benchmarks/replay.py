@@ -0,0 +1,187 @@
+"""
+Replay a recorded traffic trace against a running server.
+
+    python -m benchmarks.replay traces/trace.jsonl --target http://localhost:8000 \
+        --api-key KEY --concurrency 20 --rate 200
+
+The trace is the JSONL written by ``TRACE_SAMPLE_RATE`` capture (see
+``app/trace.py``); lines without ``method`` and ``path`` are skipped, and so
+are requests whose body was too large to record. With
+``--rate`` requests are started on a fixed schedule regardless of how fast
+earlier ones finish, so a slow release shows up as higher latency instead of
+lower load. ``--concurrency`` caps requests in flight.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import httpx
+
+
+def load_trace(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict) or "body_sha256" in record:
+            continue
+        if "method" in record and "path" in record:
+            yield record
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class ReplayResult:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+
+    def record(self, route: str, latency: float, ok: bool) -> None:
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+    def summary(self) -> dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            }
+        return {
+            "requests": self.total,
+            "errors": sum(self.errors.values()),
+            "elapsed_s": round(self.elapsed, 3),
+            "throughput_rps": (
+                round(self.total / self.elapsed, 1) if self.elapsed else 0.0
+            ),
+            "routes": routes,
+        }
+
+
+async def _send(client: httpx.AsyncClient, record: dict, result: ReplayResult):
+    # Group by the recorded route template so /organizations/1 and /2 share a row
+    route = f"{record['method']} {record.get('route') or record['path']}"
+    body = record.get("body")
+    kwargs = {}
+    if isinstance(body, (dict, list)):
+        kwargs["json"] = body
+    elif body is not None:
+        kwargs["content"] = body
+    url = record["path"]
+    if record.get("query"):
+        url = f"{url}?{record['query']}"
+
+    started = time.perf_counter()
+    try:
+        response = await client.request(record["method"], url, **kwargs)
+        ok = response.status_code < 500
+    except httpx.HTTPError:
+        ok = False
+    result.record(route, time.perf_counter() - started, ok)
+
+
+async def replay(
+    records: Iterable[dict],
+    client: httpx.AsyncClient,
+    concurrency: int = 10,
+    rate: Optional[float] = None,
+) -> ReplayResult:
+    """Send ``records`` through ``client``, at most ``concurrency`` at a time
+
+    With ``rate`` (requests per second) the n-th request starts no earlier
+    than ``n / rate`` seconds after the first.
+    """
+    result = ReplayResult()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def run(record):
+        try:
+            await _send(client, record, result)
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    for index, record in enumerate(records):
+        if rate:
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await slots.acquire()
+        tasks.append(asyncio.create_task(run(record)))
+    await asyncio.gather(*tasks)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{summary['requests']} requests, {summary['errors']} errors in "
+        f"{summary['elapsed_s']:.2f} s ({summary['throughput_rps']} req/s)"
+    )
+    print(f"{'route':<50} {'count':>7} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, row in summary["routes"].items():
+        print(
+            f"{route:<50} {row['count']:>7} {row['errors']:>7} "
+            f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms"
+        )
+
+
+async def _main(args) -> dict:
+    with open(args.trace) as trace:
+        records = list(load_trace(trace))
+    if args.limit:
+        records = records[: args.limit]
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.target, headers=headers, limits=limits, timeout=args.timeout
+    ) as client:
+        result = await replay(records, client, args.concurrency, args.rate)
+    return result.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("trace", help="JSONL trace recorded by the capture middleware")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--api-key", help="Sent as X-API-Key with every request")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, help="Requests per second")
+    parser.add_argument("--limit", type=int, help="Replay only the first N records")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(_main(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold-start benchmark: time from interpreter start to the first served request.
+
+Each run happens in a fresh interpreter so that import costs are included:
+
+    python -m benchmarks.startup --runs 5 --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app.main import create_app
+imported = time.perf_counter()
+application = create_app()
+created = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(application) as client:
+    ready = time.perf_counter()
+    client.get("/").raise_for_status()
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "lifespan": ready - created,
+    "first_request": served - started,
+}))
+"""
+
+
+def measure_once(env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="Fail when the median time to first request exceeds this budget",
+    )
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    env.setdefault("API_KEY", "startup-benchmark")
+
+    runs = [measure_once(env) for _ in range(args.runs)]
+    for phase in ("import", "create_app", "lifespan", "first_request"):
+        values = [run[phase] * 1000 for run in runs]
+        print(
+            f"{phase:>14}: median {statistics.median(values):8.1f} ms, "
+            f"max {max(values):8.1f} ms"
+        )
+
+    median = statistics.median(run["first_request"] for run in runs) * 1000
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"Startup budget exceeded: {median:.1f} ms > {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
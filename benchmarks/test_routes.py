@@ -0,0 +1,160 @@
+"""
+Latency of every route in ``app/main.py`` on generated directories.
+
+Two routes are left out: ``/events`` streams until the client disconnects,
+and ``/organizations/bulk`` would change the dataset the other cases measure.
+Run with ``python -m pytest benchmarks``; see ``benchmarks/conftest.py`` for
+the scale and backend options.
+"""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.conftest import PRIVILEGED_KEY  # noqa: E402
+
+MOSCOW = {"latitude": 55.7558, "longitude": 37.6173}
+MOSCOW_AREA = {
+    "min_latitude": 55.5,
+    "max_latitude": 56.0,
+    "min_longitude": 37.3,
+    "max_longitude": 37.9,
+}
+# With the default activity width of 5: ids 1-5 are roots, 31-155 are leaves
+ROOT_ACTIVITY = 1
+LEAF_ACTIVITY = 31
+
+CASES = [
+    ("root", "GET", "/", {}),
+    ("ready", "GET", "/ready", {}),
+    ("organizations_list", "GET", "/organizations/", {}),
+    (
+        "organizations_search_name",
+        "GET",
+        "/organizations/search",
+        {"params": {"name": "Альфа", "limit": 50}},
+    ),
+    (
+        "organizations_search_activity",
+        "GET",
+        "/organizations/search",
+        {"params": {"activity_id": ROOT_ACTIVITY, "limit": 50}},
+    ),
+    (
+        "organizations_search_radius",
+        "GET",
+        "/organizations/search",
+        {"params": {**MOSCOW, "radius": 2, "sort": "distance", "limit": 50}},
+    ),
+    ("organization_by_id", "GET", "/organizations/{organization_id}", {}),
+    ("organizations_by_building", "GET", "/organizations/building/1", {}),
+    (
+        "organizations_by_activity_subtree",
+        "GET",
+        f"/organizations/activity/{ROOT_ACTIVITY}",
+        {},
+    ),
+    (
+        "organizations_by_activity_leaf",
+        "GET",
+        f"/organizations/activity/{LEAF_ACTIVITY}",
+        {"params": {"include_children": False}},
+    ),
+    (
+        "organizations_by_name",
+        "GET",
+        "/organizations/search/by-name",
+        {"params": {"name": "Меридиан Титан"}},
+    ),
+    (
+        "organizations_by_location",
+        "POST",
+        "/organizations/search/by-location",
+        {"json": {**MOSCOW, "radius": 1}},
+    ),
+    (
+        "organizations_by_location_polygon",
+        "POST",
+        "/organizations/search/by-location",
+        {"json": {"polygon": [[55.74, 37.60], [55.74, 37.64], [55.77, 37.62]]}},
+    ),
+    (
+        # Already canonical, so the route answers instead of redirecting
+        "organizations_by_location_get",
+        "GET",
+        "/organizations/search/by-location",
+        {"params": {"latitude": "55.756", "longitude": "37.617", "radius": "1.0"}},
+    ),
+    (
+        "organizations_by_location_batch",
+        "POST",
+        "/organizations/search/by-location/batch",
+        {
+            "json": {
+                "queries": [
+                    {**MOSCOW, "radius": 1},
+                    {"latitude": 55.8, "longitude": 37.5, "radius": 2},
+                    {"latitude": 59.93, "longitude": 30.34, "radius": 3},
+                ]
+            }
+        },
+    ),
+    (
+        "organizations_clusters",
+        "GET",
+        "/organizations/clusters",
+        {"params": {**MOSCOW_AREA, "zoom": 10}},
+    ),
+    ("buildings_list", "GET", "/buildings/", {}),
+    ("building_by_id", "GET", "/buildings/1", {}),
+    ("activities_list", "GET", "/activities/", {}),
+    ("activities_tree", "GET", "/activities/tree", {"params": {"with_counts": True}}),
+    ("activity_by_id", "GET", f"/activities/{LEAF_ACTIVITY}", {}),
+    (
+        "debug_memory",
+        "GET",
+        "/debug/memory",
+        {"headers": {"X-API-Key": PRIVILEGED_KEY}},
+    ),
+    (
+        "batch",
+        "POST",
+        "/batch",
+        {
+            "json": {
+                "requests": [
+                    {"path": "/organizations/{organization_id}"},
+                    {"path": "/buildings/1"},
+                    {"path": f"/activities/{LEAF_ACTIVITY}"},
+                ]
+            }
+        },
+    ),
+    ("changes", "GET", "/changes", {"params": {"since": 0, "limit": 500}}),
+    ("export_buildings", "GET", "/export/buildings", {}),
+    ("metrics", "GET", "/metrics", {}),
+]
+
+
+def _fill(value, organization_id):
+    if isinstance(value, str):
+        return value.replace("{organization_id}", str(organization_id))
+    if isinstance(value, dict):
+        return {key: _fill(item, organization_id) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, organization_id) for item in value]
+    return value
+
+
+@pytest.mark.parametrize(
+    "method, path, kwargs", [case[1:] for case in CASES], ids=[c[0] for c in CASES]
+)
+def test_route(benchmark, bench_client, method, path, kwargs):
+    client, scale = bench_client
+    # An organization from the middle of the id range
+    organization_id = scale // 2
+    path = _fill(path, organization_id)
+    kwargs = _fill(kwargs, organization_id)
+
+    response = benchmark(client.request, method, path, **kwargs)
+    assert response.status_code == 200, response.text
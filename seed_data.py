@@ -3,12 +3,12 @@ Script to populate the database with test data
 """
 
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
-from app import models
+from app.database import SessionLocal, get_engine
+from app import facets, models  # noqa: F401 - facets keeps count tables current
 
 
 def seed_data():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
 
     try:
         # Create Buildings
@@ -1,3 +1,10 @@
+import os
+
+# Tests bind their own engines; skip the startup warmup of the configured one
+os.environ.setdefault("WARMUP_ENABLED", "false")
+# Any request over its query budget fails the test that made it
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -6,7 +13,6 @@ from sqlalchemy.pool import StaticPool
 from app.database import Base, get_db
 from app.main import app
 from app import models
-import os
 
 
 @pytest.fixture(scope="function")
@@ -55,6 +61,18 @@ def client(db_session):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(scope="function")
+def app_settings():
+    """Override app settings for the duration of a test"""
+    original = app.state.settings
+
+    def apply(**changes):
+        app.state.settings = original.model_copy(update=changes)
+
+    yield apply
+    app.state.settings = original
+
+
 @pytest.fixture(scope="function")
 def test_api_key():
     """Return the test API key"""
@@ -96,3 +96,28 @@ def test_activities_tree_structure_empty(client, auth_headers):
     response = client.get("/activities/tree", headers=auth_headers)
     assert response.status_code == 200
     assert response.json() == []
+
+
+def test_get_activities_tree_with_counts(
+    client, auth_headers, sample_organizations, sample_activities
+):
+    """Test that tree counts include organizations of child activities"""
+    response = client.get("/activities/tree?with_counts=true", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+
+    food = next(a for a in data if a["name"] == "Food")
+    cars = next(a for a in data if a["name"] == "Cars")
+    assert food["organization_count"] == 2  # org1 via meat/dairy, org3 directly
+    assert cars["organization_count"] == 1
+    meat = next(c for c in food["children"] if c["name"] == "Meat")
+    assert meat["organization_count"] == 1
+    passenger = next(c for c in cars["children"] if c["name"] == "Passenger")
+    assert passenger["organization_count"] == 0
+    assert passenger["children"][0]["organization_count"] == 0
+
+
+def test_get_activities_tree_without_counts(client, auth_headers, sample_activities):
+    """Test that counts are omitted unless requested"""
+    response = client.get("/activities/tree", headers=auth_headers)
+    assert all("organization_count" not in a for a in response.json())
@@ -0,0 +1,120 @@
+"""Tests for the organization to activity ancestor index"""
+
+from sqlalchemy import select
+
+from app import ancestry, models
+
+
+def ancestors(db_session, organization):
+    """Names of the activities the index files the organization under"""
+    table = models.organization_activity_ancestor
+    return set(
+        db_session.execute(
+            select(models.Activity.name)
+            .join(table, table.c.ancestor_activity_id == models.Activity.id)
+            .where(table.c.organization_id == organization.id)
+        ).scalars()
+    )
+
+
+def test_new_organizations_are_indexed(db_session, sample_organizations):
+    """Test that a new organization gets its activities and their ancestors"""
+    org1, org2, org3 = sample_organizations
+
+    assert ancestors(db_session, org1) == {"Meat", "Dairy", "Food"}
+    assert ancestors(db_session, org2) == {"Trucks", "Cars"}
+    assert ancestors(db_session, org3) == {"Food"}
+
+
+def test_index_follows_link_changes(
+    db_session, sample_organizations, sample_activities
+):
+    """Test that adding and removing links rewrites the organization's rows"""
+    org2 = sample_organizations[1]
+    org2.activities.append(sample_activities["parts"])
+    db_session.commit()
+    assert ancestors(db_session, org2) == {"Trucks", "Parts", "Passenger", "Cars"}
+
+    org2.activities.remove(sample_activities["trucks"])
+    db_session.commit()
+    assert ancestors(db_session, org2) == {"Parts", "Passenger", "Cars"}
+
+    org2.activities.clear()
+    db_session.commit()
+    assert ancestors(db_session, org2) == set()
+
+
+def test_index_follows_tree_changes(
+    db_session, sample_organizations, sample_activities
+):
+    """Test that moving an activity rewrites the organizations below it"""
+    org1, org2, org3 = sample_organizations
+    sample_activities["meat"].parent_id = sample_activities["cars"].id
+    db_session.commit()
+
+    # Dairy still files org1 under Food
+    assert ancestors(db_session, org1) == {"Meat", "Dairy", "Food", "Cars"}
+    assert ancestors(db_session, org3) == {"Food"}
+
+
+def test_deletes_remove_rows(db_session, sample_organizations, sample_activities):
+    """Test that deleted activities and organizations leave no rows behind"""
+    org1, org2, org3 = sample_organizations
+    db_session.delete(sample_activities["dairy"])
+    db_session.commit()
+    assert ancestors(db_session, org1) == {"Meat", "Food"}
+
+    db_session.delete(sample_activities["meat"])
+    db_session.commit()
+    assert ancestors(db_session, org1) == set()
+    assert ancestors(db_session, org3) == {"Food"}
+
+    organization_id = org2.id
+    db_session.delete(org2)
+    db_session.commit()
+    table = models.organization_activity_ancestor
+    assert not db_session.execute(
+        select(table).where(table.c.organization_id == organization_id)
+    ).all()
+
+
+def test_rebuild_matches_incremental(
+    db_session, sample_organizations, sample_activities
+):
+    """Test that a full rebuild reproduces the incrementally maintained rows"""
+    sample_activities["passenger"].parent_id = sample_activities["food"].id
+    sample_organizations[0].activities.append(sample_activities["parts"])
+    db_session.commit()
+    table = models.organization_activity_ancestor
+    incremental = set(db_session.execute(select(table)).all())
+
+    ancestry.rebuild(db_session.connection())
+    db_session.commit()
+
+    assert set(db_session.execute(select(table)).all()) == incremental
+
+
+def test_bulk_upsert_refreshes_index(
+    client, auth_headers, db_session, sample_organizations, sample_activities
+):
+    """Test that Core writes from the bulk endpoint keep the index current"""
+    org2 = sample_organizations[1]
+    payload = {
+        "items": [
+            {
+                "id": org2.id,
+                "name": org2.name,
+                "building_id": org2.building_id,
+                "activity_ids": [sample_activities["parts"].id],
+            }
+        ]
+    }
+    response = client.post("/organizations/bulk", headers=auth_headers, json=payload)
+    assert response.status_code == 200
+
+    assert ancestors(db_session, org2) == {"Parts", "Passenger", "Cars"}
+    response = client.get(
+        f"/organizations/activity/{sample_activities['cars'].id}",
+        headers=auth_headers,
+    )
+    assert [organization["id"] for organization in response.json()] == [org2.id]
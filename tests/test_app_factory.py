@@ -0,0 +1,46 @@
+"""Tests for the application factory and lazy engine creation"""
+
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.database import Base, get_engine
+from app.main import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_require_configuration():
+    """Test that importing the app modules neither reads settings nor connects"""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("DATABASE_URL", "API_KEY")
+    }
+    probe = (
+        "import app.main, app.database, app.models\n"
+        "assert app.database.engines() == []\n"
+        "assert app.main._app is None\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=ROOT, env=env, capture_output=True
+    )
+    assert result.returncode == 0, result.stderr.decode()
+
+
+def test_create_app_uses_given_settings(tmp_path):
+    """Test that the factory's settings drive authentication and the database"""
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'factory.db'}", api_key="factory-key"
+    )
+    Base.metadata.create_all(bind=get_engine(settings.database_url))
+    with TestClient(create_app(settings)) as client:
+        response = client.get("/buildings/", headers={"X-API-Key": "factory-key"})
+        assert response.status_code == 200
+        assert response.json() == []
+        rejected = client.get("/buildings/", headers={"X-API-Key": "other-key"})
+        assert rejected.status_code == 401
+    get_engine(settings.database_url).dispose()
@@ -0,0 +1,104 @@
+"""Tests for the batch endpoint"""
+
+import pytest
+from sqlalchemy import select
+
+from app import main, models
+
+
+def test_batch_combines_results(
+    client, auth_headers, sample_organizations, sample_activities, sample_buildings
+):
+    """Test that a batch returns one result per sub-request, in order"""
+    payload = {
+        "requests": [
+            {"path": "/activities/tree"},
+            {"path": f"/buildings/{sample_buildings[0].id}"},
+            {"path": "/organizations/search/by-name", "params": {"name": "Org 2"}},
+            {
+                "method": "POST",
+                "path": "/organizations/search/by-location",
+                "body": {"latitude": 55.751244, "longitude": 37.618423, "radius": 1},
+            },
+        ]
+    }
+    response = client.post("/batch", headers=auth_headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status_code"] for item in data] == [200, 200, 200, 200]
+    assert len(data[0]["body"]) == 2
+    assert data[1]["body"]["address"] == "Test Address 1"
+    assert [org["name"] for org in data[2]["body"]] == ["Test Org 2"]
+    assert len(data[3]["body"]) == 3
+
+
+def test_batch_reports_sub_request_errors(client, auth_headers):
+    """Test that failing sub-requests do not fail the whole batch"""
+    payload = {
+        "requests": [
+            {"path": "/buildings/9999"},
+            {"path": "/organizations/search/by-name"},
+            {"path": "/no-such-route"},
+            {"path": "/batch", "method": "POST"},
+            {"path": "/events"},
+        ]
+    }
+    response = client.post("/batch", headers=auth_headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert data[0] == {"status_code": 404, "body": {"detail": "Building not found"}}
+    assert data[1]["status_code"] == 422
+    assert data[2]["status_code"] == 404
+    assert data[3]["status_code"] == 400
+    assert data[4]["status_code"] == 400
+
+
+def test_failed_sub_request_does_not_leak_into_a_write(
+    client, auth_headers, db_session, sample_buildings, monkeypatch
+):
+    """Test that a failing sub-request's changes are not committed by the next"""
+    upsert = main.upsert_organizations
+    calls = []
+
+    def fail_first_after_flush(db, items):
+        calls.append(items)
+        if len(calls) > 1:
+            return upsert(db, items)
+        db.add(models.Building(address="Leaked", latitude=0, longitude=0))
+        db.flush()
+        raise RuntimeError("Sub-request failed mid-write")
+
+    monkeypatch.setattr(main, "upsert_organizations", fail_first_after_flush)
+    write = {
+        "method": "POST",
+        "path": "/organizations/bulk",
+        "body": {"items": [{"name": "Written", "building_id": sample_buildings[0].id}]},
+    }
+    payload = {
+        "requests": [
+            write,
+            write,
+            {"path": "/organizations/search/by-name", "params": {"name": "Written"}},
+        ]
+    }
+    response = client.post("/batch", headers=auth_headers, json=payload)
+
+    data = response.json()
+    assert [item["status_code"] for item in data] == [500, 200, 200]
+    assert [org["name"] for org in data[2]["body"]] == ["Written"]
+    db_session.rollback()
+    addresses = db_session.execute(select(models.Building.address)).scalars().all()
+    assert "Leaked" not in addresses
+
+
+def test_batch_requires_api_key(client):
+    """Test that the batch endpoint requires an API key"""
+    response = client.post("/batch", json={"requests": [{"path": "/buildings/"}]})
+    assert response.status_code == 403
+
+
+def test_batch_size_limit(client, auth_headers):
+    """Test that oversized batches are rejected"""
+    payload = {"requests": [{"path": "/buildings/"}] * 21}
+    response = client.post("/batch", headers=auth_headers, json=payload)
+    assert response.status_code == 400
@@ -45,3 +45,23 @@ def test_building_coordinates_validation(sample_buildings):
     for building in sample_buildings:
         assert -90 <= building.latitude <= 90
         assert -180 <= building.longitude <= 180
+
+
+def test_list_buildings_with_counts(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test listing buildings with organization counts"""
+    response = client.get("/buildings/?with_counts=true", headers=auth_headers)
+    assert response.status_code == 200
+    counts = {b["id"]: b["organization_count"] for b in response.json()}
+    assert counts == {
+        sample_buildings[0].id: 2,
+        sample_buildings[1].id: 1,
+        sample_buildings[2].id: 0,
+    }
+
+
+def test_list_buildings_without_counts(client, auth_headers, sample_buildings):
+    """Test that counts are omitted unless requested"""
+    response = client.get("/buildings/", headers=auth_headers)
+    assert all("organization_count" not in b for b in response.json())
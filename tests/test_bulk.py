@@ -0,0 +1,160 @@
+"""Tests for the bulk organization upsert endpoint"""
+
+from app import cache, facets, models
+from app.versioning import ACTIVITIES_VERSION_ID, BUILDINGS_VERSION_ID, current_version
+
+
+def test_bulk_creates_organizations(
+    client, auth_headers, sample_buildings, sample_activities
+):
+    """Test that items without an id are created with phones and activities"""
+    payload = {
+        "items": [
+            {
+                "name": "Bulk Org 1",
+                "building_id": sample_buildings[0].id,
+                "phone_numbers": ["1-111-111", "2-222-222"],
+                "activity_ids": [sample_activities["meat"].id],
+            },
+            {"name": "Bulk Org 2", "building_id": sample_buildings[1].id},
+        ]
+    }
+    response = client.post("/organizations/bulk", headers=auth_headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["updated"], data["failed"]) == (2, 0, 0)
+    assert [item["status"] for item in data["items"]] == ["created", "created"]
+
+    created = client.get(
+        f"/organizations/{data['items'][0]['id']}", headers=auth_headers
+    ).json()
+    assert created["name"] == "Bulk Org 1"
+    assert sorted(phone["number"] for phone in created["phone_numbers"]) == [
+        "1-111-111",
+        "2-222-222",
+    ]
+    assert [activity["name"] for activity in created["activities"]] == ["Meat"]
+
+
+def test_bulk_updates_replace_phones_and_activities(
+    client, auth_headers, sample_organizations, sample_buildings, sample_activities
+):
+    """Test that items with an id replace the organization's data"""
+    org1 = sample_organizations[0]
+    payload = {
+        "items": [
+            {
+                "id": org1.id,
+                "name": "Renamed Org",
+                "building_id": sample_buildings[2].id,
+                "phone_numbers": ["000"],
+                "activity_ids": [sample_activities["parts"].id],
+            }
+        ]
+    }
+    response = client.post("/organizations/bulk", headers=auth_headers, json=payload)
+    assert response.json()["items"][0] == {
+        "index": 0,
+        "id": org1.id,
+        "status": "updated",
+        "error": None,
+    }
+
+    updated = client.get(f"/organizations/{org1.id}", headers=auth_headers).json()
+    assert updated["name"] == "Renamed Org"
+    assert updated["building"]["id"] == sample_buildings[2].id
+    assert [phone["number"] for phone in updated["phone_numbers"]] == ["000"]
+    assert [activity["name"] for activity in updated["activities"]] == ["Parts"]
+
+
+def test_bulk_reports_item_errors(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test that invalid items fail alone and valid ones are still written"""
+    building_id = sample_buildings[0].id
+    payload = {
+        "items": [
+            {"name": "Good Org", "building_id": building_id},
+            {"building_id": building_id},
+            {"name": "No Building", "building_id": 9999},
+            {"name": "No Activity", "building_id": building_id, "activity_ids": [999]},
+            {"id": 9999, "name": "Missing", "building_id": building_id},
+            {"id": sample_organizations[1].id, "name": "A", "building_id": building_id},
+            {"id": sample_organizations[1].id, "name": "B", "building_id": building_id},
+        ]
+    }
+    response = client.post("/organizations/bulk", headers=auth_headers, json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["updated"], data["failed"]) == (1, 1, 5)
+    errors = {item["index"]: item["error"] for item in data["items"]}
+    assert errors[0] is None
+    assert "name" in errors[1]
+    assert errors[2] == "Building 9999 not found"
+    assert errors[3] == "Activities [999] not found"
+    assert errors[4] == "Organization 9999 not found"
+    assert "more than once" in errors[6]
+
+
+def test_bulk_refreshes_facet_counts(
+    client,
+    auth_headers,
+    db_session,
+    sample_organizations,
+    sample_buildings,
+    sample_activities,
+):
+    """Test that counts follow organizations moved between buildings"""
+    org2 = sample_organizations[1]
+    payload = {
+        "items": [
+            {"id": org2.id, "name": org2.name, "building_id": sample_buildings[2].id}
+        ]
+    }
+    client.post("/organizations/bulk", headers=auth_headers, json=payload)
+
+    counts = facets.building_counts(db_session)
+    assert counts.get(sample_buildings[1].id, 0) == 0
+    assert counts[sample_buildings[2].id] == 1
+    # The update dropped the organization's only activity
+    trucks = sample_activities["trucks"].id
+    assert facets.activity_counts(db_session).get(trucks, 0) == 0
+
+
+def test_bulk_keeps_building_and_activity_caches(
+    client, auth_headers, db_session, sample_buildings, sample_activities
+):
+    """Test that organization writes do not invalidate the tree or geo caches"""
+    connection = db_session.connection()
+    versions = (
+        current_version(connection, BUILDINGS_VERSION_ID),
+        current_version(connection, ACTIVITIES_VERSION_ID),
+    )
+    cache.activity_tree(db_session)
+    misses = cache.activity_children.misses
+
+    payload = {"items": [{"name": "Org", "building_id": sample_buildings[0].id}]}
+    client.post("/organizations/bulk", headers=auth_headers, json=payload)
+
+    connection = db_session.connection()
+    assert versions == (
+        current_version(connection, BUILDINGS_VERSION_ID),
+        current_version(connection, ACTIVITIES_VERSION_ID),
+    )
+    cache.activity_tree(db_session)
+    assert cache.activity_children.misses == misses
+    assert db_session.query(models.Organization).count() == 1
+
+
+def test_bulk_item_limit(client, auth_headers, app_settings):
+    """Test that oversized bulk requests are rejected"""
+    app_settings(bulk_max_items=2)
+    payload = {"items": [{"name": "Org", "building_id": 1}] * 3}
+    response = client.post("/organizations/bulk", headers=auth_headers, json=payload)
+    assert response.status_code == 400
+
+
+def test_bulk_requires_api_key(client):
+    """Test that bulk upsert requires authentication"""
+    response = client.post("/organizations/bulk", json={"items": [{}]})
+    assert response.status_code == 403
@@ -0,0 +1,123 @@
+"""Tests for the change feed"""
+
+from app import models
+
+
+def sync(client, auth_headers, since=0, limit=500):
+    """Follow next_cursor through every page; return (items, until)"""
+    response = client.get(
+        "/changes", headers=auth_headers, params={"since": since, "limit": limit}
+    )
+    items = []
+    while True:
+        assert response.status_code == 200
+        page = response.json()
+        items.extend(page["items"])
+        if page["next_cursor"] is None:
+            return items, page["until"]
+        response = client.get(
+            "/changes",
+            headers=auth_headers,
+            params={"cursor": page["next_cursor"], "limit": limit},
+        )
+
+
+def test_full_sync_lists_every_entity(client, auth_headers, sample_organizations):
+    """Test that since=0 returns the whole directory in version order"""
+    items, until = sync(client, auth_headers)
+
+    entities = [item["entity"] for item in items]
+    assert entities.count("building") == 3
+    assert entities.count("activity") == 7
+    assert entities.count("organization") == 3
+    versions = [item["version"] for item in items]
+    assert versions == sorted(versions)
+    assert max(versions) == until
+
+
+def test_pages_do_not_repeat_or_skip(client, auth_headers, sample_organizations):
+    """Test that small pages add up to the same feed as one big page"""
+    paged, _ = sync(client, auth_headers, limit=4)
+    whole, _ = sync(client, auth_headers)
+    assert paged == whole
+
+
+def test_delta_contains_only_changed_rows(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that an update after the last sync is the only change returned"""
+    _, until = sync(client, auth_headers)
+    organization = sample_organizations[0]
+    organization.name = "Renamed"
+    db_session.commit()
+
+    items, _ = sync(client, auth_headers, since=until)
+    assert [(item["entity"], item["id"]) for item in items] == [
+        ("organization", organization.id)
+    ]
+    assert items[0]["data"]["name"] == "Renamed"
+
+
+def test_phone_changes_bump_their_organization(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that adding a phone marks the organization as changed"""
+    _, until = sync(client, auth_headers)
+    organization = sample_organizations[2]
+    db_session.add(models.PhoneNumber(number="111", organization_id=organization.id))
+    db_session.commit()
+
+    items, _ = sync(client, auth_headers, since=until)
+    assert [item["id"] for item in items] == [organization.id]
+    assert [phone["number"] for phone in items[0]["data"]["phone_numbers"]] == ["111"]
+
+
+def test_deletes_leave_tombstones(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that deleted entities are reported with deleted=true"""
+    _, until = sync(client, auth_headers)
+    organization = sample_organizations[1]
+    db_session.delete(organization)
+    db_session.commit()
+
+    items, _ = sync(client, auth_headers, since=until)
+    assert items == [
+        {
+            "entity": "organization",
+            "id": organization.id,
+            "version": items[0]["version"],
+            "deleted": True,
+            "data": None,
+        }
+    ]
+
+
+def test_bulk_writes_appear_in_feed(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test that rows written by the bulk endpoint carry the new version"""
+    _, until = sync(client, auth_headers)
+    payload = {
+        "items": [
+            {"name": "Bulk Org", "building_id": sample_buildings[0].id},
+            {
+                "id": sample_organizations[0].id,
+                "name": "Bulk Renamed",
+                "building_id": sample_buildings[0].id,
+            },
+        ]
+    }
+    client.post("/organizations/bulk", headers=auth_headers, json=payload)
+
+    items, _ = sync(client, auth_headers, since=until)
+    assert sorted(item["data"]["name"] for item in items) == [
+        "Bulk Org",
+        "Bulk Renamed",
+    ]
+
+
+def test_malformed_cursor(client, auth_headers):
+    """Test that a cursor that was not issued by the feed is rejected"""
+    response = client.get("/changes", headers=auth_headers, params={"cursor": "x"})
+    assert response.status_code == 400
@@ -0,0 +1,162 @@
+"""Tests for map clusters"""
+
+import pytest
+
+from app import cache, clusters, models, snapshot as snapshots
+from app.snapshot import Snapshot
+
+RUSSIA = {
+    "min_latitude": 40,
+    "max_latitude": 70,
+    "min_longitude": 20,
+    "max_longitude": 60,
+}
+MOSCOW = {
+    "min_latitude": 55.74,
+    "max_latitude": 55.76,
+    "min_longitude": 37.61,
+    "max_longitude": 37.63,
+}
+
+
+def get_clusters(client, auth_headers, **params):
+    response = client.get(
+        "/organizations/clusters", headers=auth_headers, params={**RUSSIA, **params}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_cell_counts_and_centroid(client, auth_headers, sample_organizations):
+    """Test that a cell sums its buildings' organizations around their centroid"""
+    result = get_clusters(client, auth_headers, cell_size=1)
+
+    # Buildings without organizations (Saint Petersburg) are left out
+    (moscow,) = result["cells"]
+    assert result["cell_size"] == 1
+    assert (moscow["row"], moscow["col"]) == (55, 37)
+    assert moscow["count"] == 3
+    assert moscow["building_count"] == 2
+    assert moscow["building_id"] is None
+    # Two organizations in the first building, one in the second
+    assert moscow["latitude"] == pytest.approx((2 * 55.751244 + 55.756244) / 3)
+    assert moscow["longitude"] == pytest.approx((2 * 37.618423 + 37.625423) / 3)
+    assert (moscow["min_latitude"], moscow["max_latitude"]) == (55, 56)
+
+
+def test_small_cells_split_buildings(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test that cells smaller than the building spacing hold one building each"""
+    cells = get_clusters(client, auth_headers, zoom=14, **MOSCOW)["cells"]
+
+    assert [(cell["building_id"], cell["count"]) for cell in cells] == [
+        (sample_buildings[0].id, 2),
+        (sample_buildings[1].id, 1),
+    ]
+    assert cells[0]["latitude"] == pytest.approx(55.751244)
+
+
+def test_viewport_gets_whole_cells(client, auth_headers, sample_organizations):
+    """Test that a viewport touching part of a cell gets the whole cell"""
+    cells = get_clusters(
+        client,
+        auth_headers,
+        cell_size=1,
+        min_latitude=55.0,
+        max_latitude=55.752,
+        min_longitude=37.0,
+        max_longitude=37.62,
+    )["cells"]
+
+    assert [cell["count"] for cell in cells] == [3]
+
+
+def test_tiles_are_cached_until_a_write(
+    client, auth_headers, db_session, sample_organizations, sample_buildings
+):
+    """Test that repeated viewports reuse tiles and writes invalidate theirs"""
+    get_clusters(client, auth_headers, zoom=6)
+    grid = cache.cluster_grid.get(db_session)
+    tiles = len(grid)
+    assert tiles > 0
+
+    get_clusters(client, auth_headers, zoom=6)
+    assert cache.cluster_grid.get(db_session) is grid
+    assert len(grid) == tiles
+
+    db_session.add(
+        models.Organization(name="New Org", building_id=sample_buildings[2].id)
+    )
+    db_session.commit()
+    refreshed = cache.cluster_grid.get(db_session)
+    assert refreshed is not grid
+    # Only the St. Petersburg tile holds the building that gained one
+    assert len(refreshed) == tiles - 1
+
+    counts = [
+        cell["count"] for cell in get_clusters(client, auth_headers, zoom=6)["cells"]
+    ]
+    assert sorted(counts) == [1, 3]
+    assert len(refreshed) == tiles
+
+
+def test_inherited_tiles_skip_moved_buildings():
+    """Test that a moved building drops the tiles at both of its positions"""
+    old = {1: (55.75, 37.62, 2), 2: (59.93, 30.34, 1), 3: (43.1, 131.9, 1)}
+    new = {**old, 2: (48.7, 44.5, 1)}
+    previous = clusters.ClusterGrid(lambda *bounds: iter(()), old)
+    for latitude, longitude, _ in old.values():
+        previous.cells(0.5, latitude, latitude, longitude, longitude)
+    previous.cells(0.5, 48.7, 48.7, 44.5, 44.5)
+    assert len(previous) == 4
+
+    grid = clusters.ClusterGrid(lambda *bounds: iter(()), new)
+    grid.inherit(previous, clusters.changed_positions(old, new))
+
+    assert len(grid) == 2
+
+
+def test_snapshot_clusters_match_database(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that snapshot mode returns the same cells as the database"""
+    expected = get_clusters(client, auth_headers, zoom=5)
+
+    snapshots.install(Snapshot.load(db_session.connection()))
+    try:
+        assert get_clusters(client, auth_headers, zoom=5) == expected
+    finally:
+        snapshots.install(None)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"zoom": 5, "cell_size": 1},
+        {"zoom": 20},
+        {"cell_size": 1, "min_latitude": 60, "max_latitude": 50},
+    ],
+)
+def test_invalid_requests(client, auth_headers, params):
+    """Test that a missing or ambiguous cell size and huge grids are rejected"""
+    response = client.get(
+        "/organizations/clusters", headers=auth_headers, params={**RUSSIA, **params}
+    )
+    assert response.status_code == 400
+
+
+def test_tile_edge_point_counted_once():
+    """Test that a building on a tile boundary belongs to exactly one tile"""
+    edge = clusters.CELLS_PER_TILE * 0.5
+
+    def points(min_lat, max_lat, min_lon, max_lon):
+        if min_lat <= edge <= max_lat and min_lon <= 1 <= max_lon:
+            yield 1, edge, 1.0, 4
+
+    grid = clusters.ClusterGrid(points)
+    cells = grid.cells(0.5, 0, edge * 2, 0, 2)
+    assert [(cell["row"], cell["count"]) for cell in cells] == [
+        (clusters.CELLS_PER_TILE, 4)
+    ]
@@ -0,0 +1,79 @@
+"""Tests for the synthetic directory generator"""
+
+from sqlalchemy import create_engine, func, select
+
+from app import facets, models
+from benchmarks.dataset import CITIES, activity_rows, generate
+
+
+def count(engine, model):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_generate_row_counts(test_engine):
+    """Test that the generator reports and inserts the requested sizes"""
+    counts = generate(test_engine, organizations=300, buildings=40, seed=3)
+
+    assert counts["organizations"] == count(test_engine, models.Organization) == 300
+    assert counts["buildings"] == count(test_engine, models.Building) == 40
+    assert counts["phone_numbers"] == count(test_engine, models.PhoneNumber) >= 300
+    assert counts["organization_activity"] >= 300
+
+
+def test_generate_is_deterministic(test_engine):
+    """Test that the same seed produces the same directory"""
+    other = create_engine("sqlite://")
+    generate(test_engine, organizations=50, seed=7)
+    generate(other, organizations=50, seed=7)
+    query = select(models.Organization.name, models.Organization.building_id)
+    with test_engine.connect() as first, other.connect() as second:
+        assert first.execute(query).all() == second.execute(query).all()
+
+
+def test_activity_tree_respects_depth_limit():
+    """Test that the activity tree is full and at most three levels deep"""
+    rows = activity_rows(width=3, first_id=1)
+    by_id = {row["id"]: row for row in rows}
+
+    assert len(rows) == 3 + 9 + 27
+    assert max(row["level"] for row in rows) == 3
+    for row in rows:
+        if row["parent_id"] is not None:
+            assert by_id[row["parent_id"]]["level"] == row["level"] - 1
+
+
+def test_buildings_cluster_around_cities(test_engine):
+    """Test that every building lies near one of the listed cities"""
+    generate(test_engine, organizations=100, buildings=100, seed=1)
+    with test_engine.connect() as connection:
+        points = connection.execute(
+            select(models.Building.latitude, models.Building.longitude)
+        ).all()
+    for latitude, longitude in points:
+        assert any(
+            abs(latitude - city[1]) < 1 and abs(longitude - city[2]) < 2
+            for city in CITIES
+        )
+
+
+def test_generate_rebuilds_facet_counts(db_session, test_engine):
+    """Test that facet counts match the generated organizations"""
+    generate(test_engine, organizations=200, buildings=20, seed=5)
+
+    building_counts = facets.building_counts(db_session)
+    assert sum(building_counts.values()) == 200
+    roots = db_session.query(models.Activity).filter_by(level=1).all()
+    activity_counts = facets.activity_counts(db_session)
+    assert all(activity_counts.get(root.id, 0) <= 200 for root in roots)
+    assert max(activity_counts.values()) > 0
+
+
+def test_generate_appends_after_existing_rows(test_engine):
+    """Test that a second run keeps existing rows and continues their ids"""
+    generate(test_engine, organizations=20, buildings=5, seed=1)
+    generate(test_engine, organizations=20, buildings=5, seed=2)
+
+    assert count(test_engine, models.Organization) == 40
+    with test_engine.connect() as connection:
+        assert connection.execute(select(func.max(models.Building.id))).scalar() == 10
@@ -0,0 +1,191 @@
+"""Tests for change notifications"""
+
+import asyncio
+
+import pytest
+
+from app import events, models
+
+
+def change(entity="organization", entity_id=1, latitude=55.75, **data):
+    data.setdefault("activity_ids", [])
+    return events.change_event(
+        entity,
+        entity_id,
+        1,
+        False,
+        {"latitude": latitude, "longitude": 37.62, **data},
+    )
+
+
+MOSCOW = dict(
+    min_latitude=55.7, max_latitude=55.8, min_longitude=37.5, max_longitude=37.7
+)
+
+
+def drain(subscription):
+    changes = []
+    while not subscription.queue.empty():
+        changes.append(subscription.queue.get_nowait())
+    return changes
+
+
+def test_filter_matches_viewport_and_activities():
+    """Test that viewport and activity criteria must both match"""
+    event_filter = events.EventFilter(**MOSCOW, activity_ids=[5])
+
+    assert event_filter.matches(change(activity_ids=[5]))
+    assert not event_filter.matches(change(activity_ids=[6]))
+    assert not event_filter.matches(change(latitude=59.93, activity_ids=[5]))
+    assert not event_filter.matches(change("building"))
+    assert events.EventFilter().matches(change("activity", latitude=None))
+
+
+def test_filter_rejects_partial_viewport():
+    """Test that a viewport needs all four bounds"""
+    with pytest.raises(ValueError):
+        events.EventFilter(min_latitude=55.7, max_latitude=55.8)
+
+
+def test_bus_delivers_only_matching_changes():
+    """Test that each subscriber receives the changes in its viewport only"""
+
+    async def run():
+        moscow = events.bus.subscribe(events.EventFilter(**MOSCOW))
+        everything = events.bus.subscribe(events.EventFilter())
+        try:
+            events.bus.publish(
+                [change(entity_id=1), change(entity_id=2, latitude=59.93)]
+            )
+            await asyncio.sleep(0)
+            return drain(moscow), drain(everything)
+        finally:
+            events.bus.unsubscribe(moscow)
+            events.bus.unsubscribe(everything)
+
+    moscow, everything = asyncio.run(run())
+    assert [item["id"] for item in moscow] == [1]
+    assert [item["id"] for item in everything] == [1, 2]
+    assert not events.bus.has_subscribers
+
+
+def test_slow_subscriber_is_told_to_resync(monkeypatch):
+    """Test that a full queue ends the stream with a resync event"""
+    monkeypatch.setattr(events, "QUEUE_SIZE", 2)
+
+    async def disconnected():
+        return False
+
+    async def run():
+        stream = events.stream(events.EventFilter(), 7, 60, disconnected)
+        frames = [await stream.__anext__()]
+        events.bus.publish([change(entity_id=id_) for id_ in range(5)])
+        await asyncio.sleep(0)
+        frames.extend([frame async for frame in stream])
+        return frames
+
+    frames = asyncio.run(run())
+    assert frames[0].startswith("id: 7\nevent: ready\n")
+    assert frames[-1] == 'event: resync\ndata: {"since": 7}\n\n'
+    assert not events.bus.has_subscribers
+
+
+def test_commit_publishes_orm_changes(db_session, sample_organizations):
+    """Test that a committed write is published and a rolled back one is not"""
+    organization = sample_organizations[0]
+
+    async def run():
+        subscription = events.bus.subscribe(events.EventFilter(**MOSCOW))
+        try:
+            organization.name = "Rolled back"
+            db_session.flush()
+            db_session.rollback()
+            organization.name = "Renamed"
+            db_session.commit()
+            await asyncio.sleep(0)
+            return drain(subscription)
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    changes = asyncio.run(run())
+    assert [(item["entity"], item["id"]) for item in changes] == [
+        ("organization", organization.id)
+    ]
+    assert changes[0]["data"]["name"] == "Renamed"
+    assert changes[0]["data"]["latitude"] == pytest.approx(55.751244)
+
+
+def test_delete_is_published(db_session, sample_buildings):
+    """Test that a deleted building is published with its last coordinates"""
+    building = models.Building(address="Temporary", latitude=55.75, longitude=37.6)
+    db_session.add(building)
+    db_session.commit()
+    building_id = building.id
+
+    async def run():
+        subscription = events.bus.subscribe(events.EventFilter(**MOSCOW))
+        try:
+            db_session.delete(building)
+            db_session.commit()
+            await asyncio.sleep(0)
+            return drain(subscription)
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    (deleted,) = asyncio.run(run())
+    assert (deleted["entity"], deleted["id"], deleted["deleted"]) == (
+        "building",
+        building_id,
+        True,
+    )
+
+
+def test_bulk_upsert_publishes_changes(
+    client, auth_headers, sample_buildings, sample_activities
+):
+    """Test that organizations written by the bulk endpoint are published"""
+    food = sample_activities["food"]
+
+    async def run():
+        subscription = events.bus.subscribe(
+            events.EventFilter(activity_ids=[food.id, sample_activities["meat"].id])
+        )
+        try:
+            response = client.post(
+                "/organizations/bulk",
+                headers=auth_headers,
+                json={
+                    "items": [
+                        {
+                            "name": "Food Org",
+                            "building_id": sample_buildings[2].id,
+                            "activity_ids": [food.id],
+                        },
+                        {
+                            "name": "Car Org",
+                            "building_id": sample_buildings[2].id,
+                            "activity_ids": [sample_activities["cars"].id],
+                        },
+                    ]
+                },
+            )
+            assert response.status_code == 200
+            await asyncio.sleep(0)
+            return drain(subscription)
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    (created,) = asyncio.run(run())
+    assert created["data"]["name"] == "Food Org"
+    assert created["data"]["latitude"] == pytest.approx(59.934280)
+
+
+def test_events_endpoint_validates_filters(client, auth_headers, sample_activities):
+    """Test that bad filters are rejected before the stream starts"""
+    partial = client.get("/events", headers=auth_headers, params={"min_latitude": 55.7})
+    assert partial.status_code == 400
+
+    unknown = client.get("/events", headers=auth_headers, params={"activity_id": 999})
+    assert unknown.status_code == 404
+
+    assert client.get("/events").status_code == 403
@@ -0,0 +1,76 @@
+"""Tests for the columnar export"""
+
+import io
+
+import pytest
+
+from app import export
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_parquet_endpoint_round_trip(client, auth_headers, sample_organizations):
+    """Test that an exported table reads back in one call with the same rows"""
+    response = client.get("/export/organizations", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    assert "organizations.parquet" in response.headers["content-disposition"]
+    assert int(response.headers["x-directory-version"]) > 0
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column("name").to_pylist() == [
+        organization.name for organization in sample_organizations
+    ]
+    assert table.schema.field("building_id").type == pa.int32()
+
+
+def test_arrow_stream_endpoint(client, auth_headers, sample_organizations):
+    """Test that link tables export as Arrow IPC streams"""
+    response = client.get(
+        "/export/organization_activity",
+        headers=auth_headers,
+        params={"format": "arrow"},
+    )
+
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 4
+    assert table.column_names == ["organization_id", "activity_id"]
+
+
+def test_unknown_table_and_missing_pyarrow(client, auth_headers, monkeypatch):
+    """Test the errors for an unknown table and for a server without pyarrow"""
+    assert client.get("/export/tombstones", headers=auth_headers).status_code == 404
+
+    def missing():
+        raise ImportError("Columnar export needs pyarrow")
+
+    monkeypatch.setattr(export, "require_pyarrow", missing)
+    assert client.get("/export/buildings", headers=auth_headers).status_code == 501
+
+
+def test_rows_are_written_in_batches(test_engine, sample_buildings):
+    """Test that every batch of rows becomes its own row group"""
+    with test_engine.connect() as connection:
+        chunks = list(export.iter_table(connection, "buildings", batch_size=2))
+
+    # Header and first row group, second row group, footer
+    assert len(chunks) == 3
+    metadata = pq.read_metadata(io.BytesIO(b"".join(chunks)))
+    assert metadata.num_row_groups == 2
+    assert metadata.num_rows == 3
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_export_directory_and_load(test_engine, sample_organizations, tmp_path, format):
+    """Test that the CLI export loads back as one table per directory table"""
+    sizes = export.export_directory(test_engine, str(tmp_path), format=format)
+
+    tables = export.load(str(tmp_path))
+    assert set(sizes) == set(tables) == set(export.TABLES)
+    assert tables["buildings"].num_rows == 3
+    assert tables["activities"].num_rows == 7
+    assert tables["phone_numbers"].num_rows == 3
+    assert tables["activities"].column("parent_id").null_count == 2
+    assert not list(tmp_path.glob("*.tmp"))
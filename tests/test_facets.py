@@ -0,0 +1,70 @@
+"""Tests for incremental maintenance of facet counts"""
+
+from app import facets
+
+
+def test_counts_follow_link_changes(
+    db_session, sample_organizations, sample_activities
+):
+    """Test that adding and removing activity links updates subtree counts"""
+    org2 = sample_organizations[1]
+    org2.activities.append(sample_activities["parts"])
+    db_session.commit()
+
+    counts = facets.activity_counts(db_session)
+    assert counts[sample_activities["parts"].id] == 1
+    assert counts[sample_activities["passenger"].id] == 1
+    assert counts[sample_activities["cars"].id] == 1  # org2 is counted once
+
+    org2.activities.remove(sample_activities["trucks"])
+    org2.activities.remove(sample_activities["parts"])
+    db_session.commit()
+
+    counts = facets.activity_counts(db_session)
+    assert counts.get(sample_activities["cars"].id, 0) == 0
+    assert counts.get(sample_activities["trucks"].id, 0) == 0
+
+
+def test_counts_follow_organization_changes(
+    db_session, sample_organizations, sample_buildings, sample_activities
+):
+    """Test that moving and deleting organizations updates counts"""
+    org1, org2, org3 = sample_organizations
+    org3.building_id = sample_buildings[2].id
+    db_session.commit()
+
+    counts = facets.building_counts(db_session)
+    assert counts[sample_buildings[0].id] == 1
+    assert counts[sample_buildings[2].id] == 1
+
+    db_session.delete(org1)
+    db_session.commit()
+
+    counts = facets.building_counts(db_session)
+    assert counts.get(sample_buildings[0].id, 0) == 0
+    assert facets.activity_counts(db_session)[sample_activities["food"].id] == 1
+
+
+def test_rebuild_matches_incremental(db_session, sample_organizations):
+    """Test that a full rebuild reproduces the incrementally maintained counts"""
+    activity_counts = facets.activity_counts(db_session)
+    building_counts = facets.building_counts(db_session)
+
+    facets.rebuild_counts(db_session.connection())
+    db_session.commit()
+
+    assert facets.activity_counts(db_session) == activity_counts
+    assert facets.building_counts(db_session) == building_counts
+
+
+def test_counts_follow_tree_changes(
+    db_session, sample_organizations, sample_activities
+):
+    """Test that moving an activity to another parent updates both ancestors"""
+    meat = sample_activities["meat"]
+    meat.parent_id = sample_activities["cars"].id
+    db_session.commit()
+
+    counts = facets.activity_counts(db_session)
+    assert counts[sample_activities["cars"].id] == 2  # org2 and org1 via meat
+    assert counts[sample_activities["food"].id] == 2  # org1 via dairy, org3
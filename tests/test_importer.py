@@ -0,0 +1,226 @@
+"""Tests for the bulk import pipeline"""
+
+import io
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app import facets, models
+from app.importer import _copy_value, import_file, import_records, read_csv
+
+BUILDINGS_CSV = """id,address,latitude,longitude
+10,"г. Москва, ул. Ленина 1",55.75,37.61
+11,"г. Казань, ул. Мира 2",55.79,49.10
+12,Nowhere,123,0
+"""
+
+
+def count(engine, model):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(model)).scalar()
+
+
+def activities(engine):
+    with engine.connect() as connection:
+        return {
+            row.name: row
+            for row in connection.execute(select(models.Activity.__table__)).all()
+        }
+
+
+def test_import_buildings_from_csv(test_engine, tmp_path):
+    """Test that valid rows are imported with their ids and invalid ones rejected"""
+    path = tmp_path / "buildings.csv"
+    path.write_text(BUILDINGS_CSV, encoding="utf-8")
+    rejects = io.StringIO()
+
+    stats = import_file(test_engine, "buildings", str(path), rejects=rejects)
+
+    assert (stats.records, stats.imported, stats.rejected) == (3, 2, 1)
+    with test_engine.connect() as connection:
+        ids = connection.execute(select(models.Building.id)).scalars().all()
+    assert sorted(ids) == [10, 11]
+    rejected = json.loads(rejects.getvalue())
+    assert rejected["record"] == 2
+    assert "latitude" in rejected["error"]
+
+
+def test_activity_levels_follow_parents(test_engine):
+    """Test that levels are derived from parents and capped at three"""
+    records = [
+        {"id": 1, "name": "Еда"},
+        {"id": 2, "name": "Молочная продукция", "parent_id": 1},
+        {"id": 3, "name": "Сыры", "parent_id": 2},
+        {"id": 4, "name": "Твёрдые сыры", "parent_id": 3},
+        {"id": 5, "name": "Сироты", "parent_id": 99},
+    ]
+
+    stats = import_records(test_engine, "activities", records, batch_size=2)
+
+    assert (stats.imported, stats.rejected) == (3, 2)
+    imported = activities(test_engine)
+    assert [imported[name].level for name in ("Еда", "Молочная продукция", "Сыры")] == [
+        1,
+        2,
+        3,
+    ]
+
+
+def test_import_organizations_resolves_references(test_engine):
+    """Test that organizations with unknown buildings or activities are rejected"""
+    import_records(
+        test_engine,
+        "buildings",
+        [{"id": 1, "address": "A", "latitude": 1, "longitude": 1}],
+    )
+    import_records(test_engine, "activities", [{"id": 7, "name": "Еда"}])
+    csv_input = io.StringIO(
+        "name,building_id,phone_numbers,activity_ids\n"
+        "Org A,1,2-222-222;3-333-333,7\n"
+        "Org B,2,,\n"
+        "Org C,1,,8\n"
+        "Org D,1,,\n"
+    )
+
+    stats = import_records(test_engine, "organizations", read_csv(csv_input))
+
+    assert (stats.imported, stats.rejected) == (2, 2)
+    assert count(test_engine, models.PhoneNumber) == 2
+    with test_engine.connect() as connection:
+        assert facets.activity_counts(connection) == {7: 1}
+
+
+def test_reimport_skips_existing_rows(test_engine):
+    """Test that importing the same records twice does not duplicate them"""
+    records = [
+        {"address": f"Address {i}", "latitude": 0, "longitude": 0} for i in range(5)
+    ]
+    import_records(test_engine, "buildings", records)
+    records_with_ids = [{"id": i + 1, **record} for i, record in enumerate(records)]
+
+    stats = import_records(test_engine, "buildings", records_with_ids)
+
+    assert (stats.imported, stats.skipped) == (0, 5)
+    assert count(test_engine, models.Building) == 5
+
+
+def test_duplicate_ids_in_batch_are_rejected(test_engine):
+    """Test that repeated and colliding ids reject single records, not the batch"""
+    records = [
+        {"id": 3, "address": "Explicit"},
+        {"id": 3, "address": "Repeated"},
+        # Positional id 1 + 2 was already taken explicitly
+        {"address": "Positional"},
+        {"id": 10, "address": "Explicit"},
+        {"address": "Positional"},
+    ]
+    records = [{**record, "latitude": 0, "longitude": 0} for record in records]
+    rejects = io.StringIO()
+
+    stats = import_records(test_engine, "buildings", records, rejects=rejects)
+
+    assert (stats.imported, stats.rejected) == (3, 2)
+    rejected = [json.loads(line) for line in rejects.getvalue().splitlines()]
+    assert [reject["record"] for reject in rejected] == [1, 2]
+    assert "more than once" in rejected[0]["error"]
+    with test_engine.connect() as connection:
+        ids = connection.execute(select(models.Building.id)).scalars().all()
+    assert sorted(ids) == [3, 5, 10]
+
+
+def test_malformed_ndjson_line_is_rejected(test_engine, tmp_path):
+    """Test that a line that is not JSON is rejected and the import goes on"""
+    path = tmp_path / "buildings.ndjson"
+    path.write_text(
+        '{"id": 1, "address": "A", "latitude": 0, "longitude": 0}\n'
+        '{"id": 2, "address": "B", "latitude": \n'
+        '{"id": 3, "address": "C", "latitude": 0, "longitude": 0}\n',
+        encoding="utf-8",
+    )
+    checkpoint = str(tmp_path / "import.checkpoint")
+    rejects = io.StringIO()
+
+    stats = import_file(
+        test_engine,
+        "buildings",
+        str(path),
+        batch_size=2,
+        checkpoint_path=checkpoint,
+        rejects=rejects,
+    )
+
+    assert (stats.records, stats.imported, stats.rejected) == (3, 2, 1)
+    rejected = json.loads(rejects.getvalue())
+    assert rejected["record"] == 1
+    assert rejected["error"].startswith("Line 2:")
+    assert rejected["data"] == '{"id": 2, "address": "B", "latitude": '
+    with test_engine.connect() as connection:
+        ids = connection.execute(select(models.Building.id)).scalars().all()
+    assert sorted(ids) == [1, 3]
+
+
+def test_import_resumes_from_checkpoint(test_engine, tmp_path):
+    """Test that an interrupted import continues after the last written batch"""
+    checkpoint = str(tmp_path / "import.checkpoint")
+    records = [
+        {"address": f"Address {i}", "latitude": 0, "longitude": 0} for i in range(10)
+    ]
+
+    def interrupted():
+        for index, record in enumerate(records):
+            if index == 7:
+                raise KeyboardInterrupt
+            yield record
+
+    with pytest.raises(KeyboardInterrupt):
+        import_records(
+            test_engine,
+            "buildings",
+            interrupted(),
+            batch_size=3,
+            checkpoint_path=checkpoint,
+            source="buildings.csv",
+        )
+    assert count(test_engine, models.Building) == 6
+    with open(checkpoint) as checkpoint_file:
+        assert json.load(checkpoint_file)["records"] == 6
+
+    stats = import_records(
+        test_engine,
+        "buildings",
+        records,
+        batch_size=3,
+        checkpoint_path=checkpoint,
+        source="buildings.csv",
+    )
+
+    assert (stats.records, stats.imported) == (10, 10)
+    with test_engine.connect() as connection:
+        addresses = connection.execute(
+            select(models.Building.address).order_by(models.Building.id)
+        ).scalars()
+        assert list(addresses) == [record["address"] for record in records]
+
+
+def test_checkpoint_for_another_input_is_refused(test_engine, tmp_path):
+    """Test that a checkpoint is only reused for the import that wrote it"""
+    checkpoint = tmp_path / "import.checkpoint"
+    checkpoint.write_text(json.dumps({"source": "other.csv", "kind": "buildings"}))
+
+    with pytest.raises(ValueError):
+        import_records(
+            test_engine,
+            "buildings",
+            [],
+            checkpoint_path=str(checkpoint),
+            source="buildings.csv",
+        )
+
+
+def test_copy_values_distinguish_null_from_empty():
+    """Test COPY CSV encoding of NULL, empty strings and quotes"""
+    assert _copy_value(None) == ""
+    assert _copy_value("") == '""'
+    assert _copy_value('ООО "Рога"') == '"ООО ""Рога"""'
+    assert _copy_value(1.5) == "1.5"
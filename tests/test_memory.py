@@ -0,0 +1,202 @@
+"""Tests for memory diagnostics and response size caps"""
+
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from app import models, responses, snapshot as snapshots
+from app.config import Settings
+from app.database import Base, SessionLocal, get_engine
+from app.main import create_app
+from app.memory import deep_sizeof
+from app.snapshot import Snapshot
+
+ADMIN_HEADERS = {"X-API-Key": "admin-key"}
+
+
+@pytest.fixture
+def diagnostics(app_settings):
+    app_settings(profile_api_key="admin-key")
+
+
+def test_deep_sizeof_follows_containers():
+    """Test that nested data counts towards the total once"""
+    shared = "x" * 1000
+    assert deep_sizeof([shared, shared]) < deep_sizeof([shared, "y" * 1000])
+    assert deep_sizeof({"a": [1.5] * 100}) > deep_sizeof({"a": []})
+
+
+def test_debug_memory_requires_privileged_key(client, auth_headers):
+    """Test that the regular API key cannot read diagnostics"""
+    assert client.get("/debug/memory", headers=auth_headers).status_code == 403
+
+
+def test_debug_memory_reports_caches_and_requests(
+    client, auth_headers, sample_activities, diagnostics
+):
+    """Test that cache sizes and the in-flight request are reported"""
+    client.get("/activities/tree", headers=auth_headers)
+    report = client.get("/debug/memory", headers=ADMIN_HEADERS).json()
+
+    assert report["max_rss_bytes"] > 0
+    assert report["caches"]["activity_tree"]["entries"] >= 1
+    assert report["caches"]["activity_tree"]["bytes"] > 0
+    assert report["snapshot"] is None
+    routes = [request["route"] for request in report["in_flight"]]
+    assert "/debug/memory" in routes
+
+
+def test_debug_memory_reports_snapshot_parts(
+    client, db_session, sample_organizations, diagnostics
+):
+    """Test that each snapshot index is sized separately"""
+    snapshots.install(Snapshot.load(db_session.connection()))
+    try:
+        report = client.get("/debug/memory", headers=ADMIN_HEADERS).json()
+    finally:
+        snapshots.install(None)
+    assert report["snapshot"]["storage"] == "heap"
+    assert report["snapshot"]["parts"]["organizations"] > 0
+    assert report["snapshot"]["parts"]["latitudes"] > 0
+
+
+def test_debug_memory_tracemalloc_top(client, diagnostics):
+    """Test that top allocation sites are listed while tracemalloc runs"""
+    tracemalloc.start()
+    try:
+        report = client.get("/debug/memory?top=3", headers=ADMIN_HEADERS).json()
+    finally:
+        tracemalloc.stop()
+    assert report["tracemalloc"]["tracing"] is True
+    assert 0 < len(report["tracemalloc"]["top"]) <= 3
+
+
+@pytest.mark.parametrize("cap", [100, 10_000_000])
+def test_capped_response_matches_uncapped(
+    client, auth_headers, sample_organizations, app_settings, cap
+):
+    """Test that streamed and capped bodies carry the same JSON"""
+    expected = client.get("/organizations/", headers=auth_headers).json()
+    app_settings(max_response_bytes=cap, oversized_responses="stream")
+    response = client.get("/organizations/", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == expected
+    if cap == 100:
+        assert "content-length" not in response.headers
+
+
+def test_oversized_response_can_be_rejected(
+    client, auth_headers, sample_organizations, app_settings
+):
+    """Test that reject mode answers 413 instead of building the body"""
+    app_settings(max_response_bytes=100, oversized_responses="reject")
+    response = client.get("/organizations/", headers=auth_headers)
+    assert response.status_code == 413
+    small = client.get(
+        "/organizations/search/by-name?name=nothing", headers=auth_headers
+    )
+    assert small.status_code == 200
+    assert small.json() == []
+
+
+@pytest.fixture
+def many_organizations(db_session, sample_buildings):
+    count = responses.FETCH_SIZE * 3
+    db_session.execute(
+        insert(models.Organization),
+        [
+            {"name": f"Org {i}", "building_id": sample_buildings[0].id}
+            for i in range(count)
+        ],
+    )
+    db_session.commit()
+    return count
+
+
+def test_capped_query_stops_fetching_at_the_cap(
+    client, auth_headers, many_organizations, app_settings
+):
+    """Test that a rejected result loads one batch of rows, not all of them"""
+    loaded = []
+    listener = lambda target, context: loaded.append(target.id)  # noqa: E731
+    event.listen(models.Organization, "load", listener)
+    try:
+        app_settings(max_response_bytes=1000, oversized_responses="reject")
+        response = client.get("/organizations/", headers=auth_headers)
+    finally:
+        event.remove(models.Organization, "load", listener)
+
+    assert response.status_code == 413
+    assert len(loaded) <= responses.FETCH_SIZE
+
+
+def test_streamed_query_outlives_the_request_session(
+    client, auth_headers, many_organizations, app_settings
+):
+    """Test that rows past the first batch are streamed after the handler returns"""
+    app_settings(max_response_bytes=1000, oversized_responses="stream")
+    response = client.get("/organizations/", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert len(response.json()) == many_organizations
+
+
+@pytest.fixture
+def streaming_app(tmp_path):
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'stream.db'}",
+        api_key="stream-key",
+        warmup_enabled=False,
+        max_response_bytes=1000,
+        oversized_responses="stream",
+    )
+    engine = get_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.Building),
+            [{"id": 1, "address": "A", "latitude": 0, "longitude": 0}],
+        )
+        connection.execute(
+            insert(models.Organization),
+            [{"name": f"Org {i}", "building_id": 1} for i in range(300)],
+        )
+    # Batched fetches run by sessions that get_db opened
+    fetches = []
+
+    def listener(state):
+        if state.execution_options.get("yield_per"):
+            fetches.append(state.session)
+
+    event.listen(SessionLocal, "do_orm_execute", listener)
+    try:
+        with TestClient(create_app(settings)) as client:
+            yield client, engine, fetches
+    finally:
+        event.remove(SessionLocal, "do_orm_execute", listener)
+        engine.dispose()
+
+
+def test_stream_reads_through_the_request_session(streaming_app):
+    """Test that a streamed list uses the request's session and then closes it"""
+    client, engine, fetches = streaming_app
+    response = client.get("/organizations/", headers={"X-API-Key": "stream-key"})
+
+    assert len(response.json()) == 300
+    assert len(set(fetches)) == 1
+    assert engine.pool.checkedout() == 0
+
+
+def test_stream_leaves_the_batch_session_open(streaming_app):
+    """Test that a streamed sub-request does not close the session it shares"""
+    client, engine, fetches = streaming_app
+    payload = {"requests": [{"path": "/organizations/"}, {"path": "/buildings/"}]}
+    response = client.post("/batch", headers={"X-API-Key": "stream-key"}, json=payload)
+
+    first, second = response.json()
+    assert (first["status_code"], len(first["body"])) == (200, 300)
+    assert second["status_code"] == 200
+    assert len(set(fetches)) == 1
+    assert engine.pool.checkedout() == 0
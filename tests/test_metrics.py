@@ -0,0 +1,61 @@
+"""Tests for the Prometheus metrics endpoint"""
+
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def _samples(response):
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            key = (sample.name, tuple(sorted(sample.labels.items())))
+            samples[key] = sample.value
+    return samples
+
+
+def _value(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0.0)
+
+
+def test_metrics_endpoint_is_public(client):
+    """Test that metrics are served without an API key in text format"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_requests_are_counted_by_route_template(
+    client, auth_headers, sample_organizations
+):
+    """Test that request counts and latency use the route template as label"""
+    route = "/organizations/{organization_id}"
+    before = _value(
+        _samples(client.get("/metrics")),
+        "http_requests_total",
+        method="GET",
+        route=route,
+        status="200",
+    )
+    for organization in sample_organizations:
+        client.get(f"/organizations/{organization.id}", headers=auth_headers)
+    client.get("/organizations/999999", headers=auth_headers)
+
+    samples = _samples(client.get("/metrics"))
+    labels = {"method": "GET", "route": route}
+    assert _value(samples, "http_requests_total", status="200", **labels) == (
+        before + len(sample_organizations)
+    )
+    assert _value(samples, "http_requests_total", status="404", **labels) >= 1
+    assert _value(samples, "http_request_duration_seconds_count", **labels) >= 4
+
+
+def test_database_and_cache_metrics(client, auth_headers, sample_activities):
+    """Test that query, pool and cache metrics are exported"""
+    client.get("/activities/tree", headers=auth_headers)
+    client.get("/activities/tree", headers=auth_headers)
+
+    samples = _samples(client.get("/metrics"))
+    assert _value(samples, "db_queries_total") > 0
+    assert _value(samples, "db_query_duration_seconds_count") > 0
+    assert ("db_pool_checked_out", ()) in samples
+    assert _value(samples, "directory_cache_hits", cache="activity_tree") >= 1
+    assert 0 < _value(samples, "directory_cache_hit_ratio", cache="activity_tree")
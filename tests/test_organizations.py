@@ -1,7 +1,12 @@
 """Tests for organization endpoints"""
 
+from decimal import ROUND_CEILING
+
 import pytest
 
+from app import models
+from app.canonical import canonical_location_query, quantize
+
 
 def test_list_organizations_empty(client, auth_headers):
     """Test listing organizations when database is empty"""
@@ -177,3 +182,259 @@ def test_search_organizations_by_location_invalid_params(client, auth_headers):
         "/organizations/search/by-location", headers=auth_headers, json=search_data
     )
     assert response.status_code == 400
+
+
+# Around the first sample building only
+TRIANGLE = [[55.745, 37.610], [55.745, 37.625], [55.754, 37.618]]
+
+
+def test_search_organizations_by_location_polygon(
+    client, auth_headers, sample_organizations
+):
+    """Test that polygon search returns the organizations inside the polygon"""
+    search_data = {"latitude": 55.75, "longitude": 37.62, "polygon": TRIANGLE}
+    response = client.post(
+        "/organizations/search/by-location", headers=auth_headers, json=search_data
+    )
+    assert response.status_code == 200
+    names = sorted(item["name"] for item in response.json())
+    assert names == ["Test Org 1", "Test Org 3"]
+
+
+def test_search_organizations_by_location_invalid_polygon(client, auth_headers):
+    """Test that polygons need three vertices with valid coordinates"""
+    for polygon in ([[55.7, 37.6], [55.8, 37.7]], [[95, 37.6], [55.8, 37.7], [0, 0]]):
+        response = client.post(
+            "/organizations/search/by-location",
+            headers=auth_headers,
+            json={"latitude": 55.75, "longitude": 37.62, "polygon": polygon},
+        )
+        assert response.status_code == 422
+
+
+def test_search_organizations_by_location_polygon_needs_no_center(
+    client, auth_headers, sample_organizations
+):
+    """Test that a polygon search is answered without latitude and longitude"""
+    response = client.post(
+        "/organizations/search/by-location",
+        headers=auth_headers,
+        json={"polygon": TRIANGLE},
+    )
+    assert response.status_code == 200
+    names = sorted(item["name"] for item in response.json())
+    assert names == ["Test Org 1", "Test Org 3"]
+
+
+def test_search_organizations_by_location_rejects_mixed_areas(client, auth_headers):
+    """Test that radius, polygon and rectangle searches cannot be combined"""
+    center = {"latitude": 55.75, "longitude": 37.62}
+    rectangle = {
+        "min_latitude": 55.74,
+        "max_latitude": 55.76,
+        "min_longitude": 37.60,
+        "max_longitude": 37.64,
+    }
+    for search_data in (
+        {**center, "radius": 1, "polygon": TRIANGLE},
+        {**center, "radius": 1, **rectangle},
+        {"polygon": TRIANGLE, "min_latitude": 55.74},
+        # A radius without its center
+        {"radius": 1},
+    ):
+        response = client.post(
+            "/organizations/search/by-location",
+            headers=auth_headers,
+            json=search_data,
+        )
+        assert response.status_code == 422, search_data
+
+
+def test_search_organizations_by_radii(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test that a batch answers each radius query and lists organizations once"""
+    org1, org2, org3 = sample_organizations
+    moscow = {"latitude": 55.751244, "longitude": 37.618423}
+    response = client.post(
+        "/organizations/search/by-location/batch",
+        headers=auth_headers,
+        json={
+            "queries": [
+                {**moscow, "radius": 0.1},
+                {**moscow, "radius": 5},
+                {"latitude": 59.93428, "longitude": 30.335099, "radius": 5},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == [
+        sorted([org1.id, org3.id]),
+        sorted([org1.id, org2.id, org3.id]),
+        [],
+    ]
+    assert [item["id"] for item in data["organizations"]] == sorted(
+        [org1.id, org2.id, org3.id]
+    )
+
+
+def test_search_organizations_by_radii_limit(client, auth_headers, app_settings):
+    """Test that batches over the configured size are rejected"""
+    app_settings(location_batch_max_queries=1)
+    query = {"latitude": 55.75, "longitude": 37.62, "radius": 1}
+    response = client.post(
+        "/organizations/search/by-location/batch",
+        headers=auth_headers,
+        json={"queries": [query, query]},
+    )
+    assert response.status_code == 400
+
+
+def test_location_get_redirects_to_canonical_url(client, auth_headers):
+    """Test that nearby coordinates are redirected to one quantized URL"""
+    locations = []
+    for latitude, longitude in ((55.75124, 37.61842), (55.7511, 37.6184)):
+        response = client.get(
+            "/organizations/search/by-location",
+            headers=auth_headers,
+            params={"radius": 1.23, "longitude": longitude, "latitude": latitude},
+            follow_redirects=False,
+        )
+        assert response.status_code == 308
+        locations.append(response.headers["location"])
+
+    assert (
+        locations
+        == [
+            "/organizations/search/by-location?latitude=55.751&longitude=37.618&radius=1.3"
+        ]
+        * 2
+    )
+
+
+def test_location_get_matches_post_and_is_cacheable(
+    client, auth_headers, sample_organizations
+):
+    """Test that the GET route answers like POST with HTTP cache headers"""
+    params = {
+        "min_latitude": 55.74,
+        "max_latitude": 55.76,
+        "min_longitude": 37.6,
+        "max_longitude": 37.64,
+    }
+    response = client.get(
+        "/organizations/search/by-location", headers=auth_headers, params=params
+    )
+    posted = client.post(
+        "/organizations/search/by-location",
+        headers=auth_headers,
+        json={"latitude": 55.75, "longitude": 37.62, **params},
+    )
+
+    assert response.status_code == 200
+    assert sorted(item["id"] for item in response.json()) == sorted(
+        item["id"] for item in posted.json()
+    )
+    assert response.headers["cache-control"] == "public, max-age=60"
+    assert response.headers["vary"] == "X-API-Key"
+    assert response.headers["etag"].startswith('W/"')
+
+
+def test_location_get_revalidates_with_etag(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that an unchanged directory answers 304 and a write changes the ETag"""
+    url = (
+        "/organizations/search/by-location?latitude=55.751&longitude=37.618&radius=5.0"
+    )
+    etag = client.get(url, headers=auth_headers).headers["etag"]
+
+    revalidated = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+
+    sample_organizations[0].name = "Renamed"
+    db_session.commit()
+    changed = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_location_get_keeps_points_inside_the_requested_circle(
+    client, auth_headers, app_settings, sample_organizations
+):
+    """Test that moving the center to the grid does not drop points near the edge"""
+    app_settings(location_radius_precision=3)
+    # About 29 m from the first building; the rounded center is about 92 m away
+    params = {"latitude": 55.7515, "longitude": 37.6185, "radius": 0.03}
+
+    redirect = client.get(
+        "/organizations/search/by-location",
+        headers=auth_headers,
+        params=params,
+        follow_redirects=False,
+    )
+    response = client.get(redirect.headers["location"], headers=auth_headers)
+
+    assert "latitude=55.752&longitude=37.619" in redirect.headers["location"]
+    assert sorted(item["name"] for item in response.json()) == [
+        "Test Org 1",
+        "Test Org 3",
+    ]
+    again = client.get(
+        redirect.headers["location"], headers=auth_headers, follow_redirects=False
+    )
+    assert again.status_code == 200
+
+
+def test_location_search_accepts_zero_bounds(client, auth_headers, db_session):
+    """Test that 0.0 bounds on the equator or prime meridian are accepted"""
+    building = models.Building(address="Null Island", latitude=0.5, longitude=0.5)
+    db_session.add(building)
+    db_session.flush()
+    db_session.add(models.Organization(name="Buoy", building_id=building.id))
+    db_session.commit()
+    bounds = {
+        "min_latitude": 0.0,
+        "max_latitude": 1.0,
+        "min_longitude": 0.0,
+        "max_longitude": 1.0,
+    }
+
+    posted = client.post(
+        "/organizations/search/by-location",
+        headers=auth_headers,
+        json={"latitude": 0.5, "longitude": 0.5, **bounds},
+    )
+    fetched = client.get(
+        "/organizations/search/by-location", headers=auth_headers, params=bounds
+    )
+
+    assert posted.status_code == 200
+    assert [item["name"] for item in posted.json()] == ["Buoy"]
+    assert fetched.json() == posted.json()
+
+
+def test_location_get_requires_radius_or_rectangle(client, auth_headers):
+    """Test that incomplete GET searches are rejected"""
+    for params in ({"latitude": 55.75, "longitude": 37.62}, {"radius": 1}):
+        response = client.get(
+            "/organizations/search/by-location", headers=auth_headers, params=params
+        )
+        assert response.status_code == 400
+
+
+def test_quantization_never_shrinks_the_area():
+    """Test that bounds round outwards, radii up and zero has one spelling"""
+    query = canonical_location_query(
+        None, None, None, -0.00001, 55.7501, 37.6009, 37.6, 3, 1
+    )
+    assert query == {
+        "min_latitude": "-0.001",
+        "max_latitude": "55.751",
+        "min_longitude": "37.600",
+        "max_longitude": "37.600",
+    }
+    assert quantize(-0.0001, 3) == "0.000"
+    assert quantize(0.01, 1, ROUND_CEILING) == "0.1"
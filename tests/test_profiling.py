@@ -0,0 +1,88 @@
+"""Tests for on-demand request profiling"""
+
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import profiling
+from app.config import Settings
+from app.database import Base, get_engine
+from app.main import create_app
+
+FOLDED_LINE = re.compile(r"^\S.* \d+$")
+
+
+@pytest.fixture
+def profiling_client(tmp_path):
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'profile.db'}",
+        api_key="regular-key",
+        profile_api_key="profile-key",
+        profile_dir=str(tmp_path / "profiles"),
+        profile_interval_ms=0.1,
+    )
+    engine = get_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine)
+    with TestClient(create_app(settings)) as client:
+        yield client, settings
+    engine.dispose()
+
+
+def test_inline_profile_is_folded_stacks(profiling_client):
+    """Test that X-Profile: inline returns the profile in folded format"""
+    client, _ = profiling_client
+    response = client.get(
+        "/buildings/",
+        headers={"X-API-Key": "profile-key", "X-Profile": "inline"},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-profile-status"] == "200"
+    lines = response.text.splitlines()
+    assert lines
+    assert all(FOLDED_LINE.match(line) for line in lines)
+
+
+def test_stored_profile_is_named_in_header(profiling_client):
+    """Test that other X-Profile values store the profile next to the response"""
+    client, settings = profiling_client
+    response = client.get(
+        "/buildings/", headers={"X-API-Key": "profile-key", "X-Profile": "1"}
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+    profile_id = response.headers["x-profile-id"]
+    assert os.path.exists(os.path.join(settings.profile_dir, f"{profile_id}.folded"))
+
+
+def test_profiling_requires_privileged_key(profiling_client):
+    """Test that a regular key cannot request a profile"""
+    client, _ = profiling_client
+    response = client.get(
+        "/buildings/", headers={"X-API-Key": "regular-key", "X-Profile": "inline"}
+    )
+    assert response.status_code == 403
+
+
+def test_requests_without_header_are_not_profiled(profiling_client):
+    """Test that the privileged key alone does not trigger profiling"""
+    client, settings = profiling_client
+    response = client.get("/buildings/", headers={"X-API-Key": "profile-key"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert not os.path.exists(settings.profile_dir)
+
+
+def test_inline_profile_reports_concurrent_requests(profiling_client, monkeypatch):
+    """Test that other requests in flight while sampling are reported"""
+    client, _ = profiling_client
+    headers = {"X-API-Key": "profile-key", "X-Profile": "inline"}
+
+    alone = client.get("/buildings/", headers=headers)
+    assert alone.headers["x-profile-concurrent-requests"] == "0"
+
+    # The profiled request plus two others
+    monkeypatch.setattr(profiling, "in_flight_count", lambda: 3)
+    shared = client.get("/buildings/", headers=headers)
+    assert shared.headers["x-profile-concurrent-requests"] == "2"
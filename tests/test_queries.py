@@ -0,0 +1,41 @@
+"""Tests for the prebuilt by-id statements"""
+
+from sqlalchemy import event
+
+from app import queries
+
+
+def _cache_hits(engine, lookup):
+    hits = []
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        hits.append(context.cache_hit == context.dialect.CACHE_HIT)
+
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    try:
+        lookup()
+    finally:
+        event.remove(engine, "after_cursor_execute", after_cursor_execute)
+    return hits
+
+
+def test_lookups_return_rows(db_session, sample_organizations):
+    """Test that the prebuilt statements find rows by id and miss cleanly"""
+    organization = sample_organizations[0]
+    assert queries.get_organization(db_session, organization.id) is organization
+    assert queries.get_building(db_session, organization.building_id).id == (
+        organization.building_id
+    )
+    assert queries.get_activity(db_session, 999) is None
+
+
+def test_repeated_lookup_hits_compiled_cache(
+    test_engine, db_session, sample_organizations
+):
+    """Test that a second lookup with another id reuses the compiled statement"""
+    queries.get_building(db_session, sample_organizations[0].building_id)
+    hits = _cache_hits(
+        test_engine,
+        lambda: queries.get_building(db_session, sample_organizations[1].building_id),
+    )
+    assert hits and all(hits)
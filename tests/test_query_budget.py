@@ -0,0 +1,105 @@
+"""Tests for the slow query log and per-route query budgets"""
+
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.config import Settings
+from app.database import Base, get_engine
+from app.main import create_app
+from app.timing import QueryBudgetExceeded
+
+
+@pytest.fixture
+def many_organizations(db_session, sample_buildings, sample_activities):
+    """Enough organizations that per-row lazy loading would blow the budget"""
+    for i in range(15):
+        organization = models.Organization(
+            name=f"Org {i}", building_id=sample_buildings[i % 3].id
+        )
+        organization.activities.append(sample_activities["meat"])
+        organization.phone_numbers.append(models.PhoneNumber(number=f"000-{i}"))
+        db_session.add(organization)
+    db_session.commit()
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/organizations/",
+        "/organizations/building/1",
+        "/organizations/activity/1",
+        "/organizations/search/by-name?name=Org",
+        "/organizations/search?name=Org",
+    ],
+)
+def test_list_endpoints_stay_within_budget(
+    client, auth_headers, many_organizations, url
+):
+    """Test that organization lists load relations without N+1 queries"""
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert "Org 12" in response.text
+
+
+def test_strict_budget_fails_the_request(
+    client, auth_headers, sample_organizations, app_settings
+):
+    """Test that strict mode raises when a route exceeds its budget"""
+    app_settings(query_budget=1, query_budget_strict=True)
+    with pytest.raises(QueryBudgetExceeded, match="/organizations/{organization_id}"):
+        client.get(f"/organizations/{sample_organizations[0].id}", headers=auth_headers)
+
+
+def test_budget_overrun_is_logged(
+    client, auth_headers, sample_organizations, app_settings, caplog
+):
+    """Test that outside strict mode an overrun is only logged"""
+    app_settings(query_budget=1, query_budget_strict=False)
+    with caplog.at_level(logging.WARNING, logger="app.timing"):
+        response = client.get(
+            f"/organizations/{sample_organizations[0].id}", headers=auth_headers
+        )
+    assert response.status_code == 200
+    record = next(r for r in caplog.records if r.name == "app.timing")
+    assert record.route == "/organizations/{organization_id}"
+    assert record.budget == 1
+    assert record.queries > 1
+
+
+def test_route_budget_override(
+    client, auth_headers, sample_organizations, app_settings
+):
+    """Test that a per-route budget replaces the default one"""
+    app_settings(
+        query_budget=1,
+        query_budget_strict=True,
+        query_budgets={"/organizations/{organization_id}": 10},
+    )
+    response = client.get(
+        f"/organizations/{sample_organizations[0].id}", headers=auth_headers
+    )
+    assert response.status_code == 200
+
+
+def test_slow_queries_are_logged_with_route(tmp_path, caplog):
+    """Test that statements over the threshold are logged with their context"""
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'slow.db'}",
+        api_key="slow-key",
+        slow_query_ms=0,
+    )
+    engine = get_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine)
+    with caplog.at_level(logging.WARNING, logger="app.slow_query"):
+        with TestClient(create_app(settings)) as client:
+            client.get("/buildings/7", headers={"X-API-Key": "slow-key"})
+    engine.dispose()
+
+    record = next(r for r in caplog.records if r.name == "app.slow_query")
+    assert record.route == "/buildings/{building_id}"
+    assert "FROM buildings" in record.statement
+    assert "7" in record.parameters
+    assert record.duration_ms >= 0
@@ -0,0 +1,221 @@
+"""Query plan regression tests.
+
+Every statement issued by a hot-path endpoint is EXPLAINed against a seeded
+database; the test fails if any of them reads a directory table with a full
+sequential scan. Set QUERY_PLAN_DATABASE_URL to run against PostgreSQL.
+"""
+
+import os
+import random
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import ancestry, models
+from app.database import Base, get_db
+from app.main import app
+
+BUILDINGS = 2000
+ORGANIZATIONS = 10000
+ROOT_ACTIVITIES = 10
+CHILDREN_PER_ACTIVITY = 4
+
+HOT_TABLES = {
+    "buildings",
+    "activities",
+    "organizations",
+    "phone_numbers",
+    "organization_activity",
+    "organization_activity_ancestor",
+}
+
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def _seed(engine):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.Building),
+            [
+                {
+                    "id": i,
+                    "address": f"Address {i}",
+                    "latitude": rng.uniform(41, 69),
+                    "longitude": rng.uniform(20, 140),
+                }
+                for i in range(1, BUILDINGS + 1)
+            ],
+        )
+
+        activities = []
+        parents = [None]
+        for level in (1, 2, 3):
+            fan_out = ROOT_ACTIVITIES if level == 1 else CHILDREN_PER_ACTIVITY
+            next_parents = []
+            for parent_id in parents:
+                for _ in range(fan_out):
+                    activity_id = len(activities) + 1
+                    activities.append(
+                        {
+                            "id": activity_id,
+                            "name": f"Activity {activity_id}",
+                            "parent_id": parent_id,
+                            "level": level,
+                        }
+                    )
+                    next_parents.append(activity_id)
+            parents = next_parents
+        conn.execute(insert(models.Activity), activities)
+
+        conn.execute(
+            insert(models.Organization),
+            [
+                {
+                    "id": i,
+                    "name": f"Organization {i}",
+                    "building_id": rng.randint(1, BUILDINGS),
+                }
+                for i in range(1, ORGANIZATIONS + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.PhoneNumber),
+            [
+                {"number": f"8-800-{i:07d}", "organization_id": i}
+                for i in range(1, ORGANIZATIONS + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.organization_activity),
+            [
+                {"organization_id": i, "activity_id": a}
+                for i in range(1, ORGANIZATIONS + 1)
+                for a in rng.sample(range(1, len(activities) + 1), 2)
+            ],
+        )
+        ancestry.rebuild(conn)
+        conn.execute(text("ANALYZE"))
+
+
+@pytest.fixture(scope="module")
+def plan_engine():
+    url = os.environ.get("QUERY_PLAN_DATABASE_URL")
+    if url:
+        engine = create_engine(url)
+    else:
+        engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    _seed(engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def plan_client(plan_engine):
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=plan_engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+
+
+def _capture_statements(engine, client, method, url, headers):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.request(method, url, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200, response.text
+    return statements
+
+
+def _sequential_scans(engine, statement, parameters):
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            lines = [row[-1] for row in cursor.fetchall()]
+            pattern = SQLITE_SCAN
+        else:
+            # Only report sequential scans the planner cannot avoid
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            lines = [row[0] for row in cursor.fetchall()]
+            pattern = POSTGRES_SCAN
+        cursor.close()
+    finally:
+        raw.rollback()
+        raw.close()
+    scans = []
+    for line in lines:
+        match = pattern.search(line.strip())
+        if match and match.group(1) in HOT_TABLES:
+            scans.append(line.strip())
+    return scans
+
+
+HOT_PATHS = [
+    ("GET", "/organizations/17"),
+    ("GET", "/organizations/building/17"),
+    ("GET", "/organizations/activity/3?include_children=true"),
+    ("GET", "/organizations/activity/3?include_children=false"),
+    ("GET", "/organizations/search?activity_id=3&sort=id"),
+    ("GET", "/organizations/search?building_id=17&name=Org"),
+    ("GET", "/buildings/17"),
+    ("GET", "/activities/17"),
+]
+
+
+@pytest.mark.parametrize("method,url", HOT_PATHS)
+def test_hot_path_has_no_sequential_scan(
+    plan_engine, plan_client, auth_headers, method, url
+):
+    """Test that hot-path endpoints only read tables through indexes"""
+    statements = _capture_statements(
+        plan_engine, plan_client, method, url, auth_headers
+    )
+    assert statements
+
+    offenders = {}
+    for statement, parameters in statements:
+        scans = _sequential_scans(plan_engine, statement, parameters)
+        if scans:
+            offenders[statement] = scans
+    assert not offenders, offenders
+
+
+@pytest.mark.parametrize(
+    "url", ["/organizations/", "/organizations/search/by-name?name=Organization"]
+)
+def test_full_lists_fit_their_query_budget(plan_client, auth_headers, url):
+    """Test that listing every organization stays within the list budget"""
+    response = plan_client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == ORGANIZATIONS
@@ -0,0 +1,171 @@
+"""Tests for the combined organization search endpoint"""
+
+import random
+
+import pytest
+
+from app.geo import GeoIndex, haversine_distance, point_in_polygon
+from app.search import OrganizationFilter, plan_driver
+
+
+def test_search_without_filters(client, auth_headers, sample_organizations):
+    """Test that an unfiltered search pages through all organizations"""
+    response = client.get("/organizations/search", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert [org["name"] for org in data["items"]] == [
+        "Test Org 1",
+        "Test Org 2",
+        "Test Org 3",
+    ]
+
+
+def test_search_by_activity_subtree(
+    client, auth_headers, sample_organizations, sample_activities
+):
+    """Test that activity search includes child activities without duplicates"""
+    food_id = sample_activities["food"].id
+    response = client.get(
+        f"/organizations/search?activity_id={food_id}", headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert {org["name"] for org in data["items"]} == {"Test Org 1", "Test Org 3"}
+
+
+def test_search_activity_and_name(
+    client, auth_headers, sample_organizations, sample_activities
+):
+    """Test that filters are intersected"""
+    food_id = sample_activities["food"].id
+    response = client.get(
+        f"/organizations/search?activity_id={food_id}&name=org%203",
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["items"][0]["name"] == "Test Org 3"
+
+
+def test_search_radius_sorted_by_distance(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test radius search ordered by distance from the point"""
+    response = client.get(
+        "/organizations/search",
+        params={
+            "latitude": 55.756244,
+            "longitude": 37.625423,
+            "radius": 5,
+            "sort": "distance",
+        },
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert data["items"][0]["building_id"] == sample_buildings[1].id
+
+
+def test_search_rectangle_and_building(
+    client, auth_headers, sample_organizations, sample_buildings
+):
+    """Test rectangle search combined with a building filter"""
+    response = client.get(
+        "/organizations/search",
+        params={
+            "min_latitude": 55.74,
+            "max_latitude": 55.76,
+            "min_longitude": 37.60,
+            "max_longitude": 37.64,
+            "building_id": sample_buildings[0].id,
+        },
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert all(org["building_id"] == sample_buildings[0].id for org in data["items"])
+
+
+def test_search_pagination(client, auth_headers, sample_organizations):
+    """Test limit/offset paging keeps the total"""
+    response = client.get(
+        "/organizations/search?sort=id&limit=2&offset=2", headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert len(data["items"]) == 1
+
+    response = client.get(
+        "/organizations/search?limit=2&offset=10", headers=auth_headers
+    )
+    assert response.json()["total"] == 3
+    assert response.json()["items"] == []
+
+
+def test_search_invalid_combinations(client, auth_headers):
+    """Test that incomplete geo parameters are rejected"""
+    response = client.get("/organizations/search?radius=5", headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.get(
+        "/organizations/search?min_latitude=1&max_latitude=2", headers=auth_headers
+    )
+    assert response.status_code == 400
+
+    response = client.get("/organizations/search?sort=distance", headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_plan_driver_prefers_most_selective_predicate():
+    """Test that the planner drives from the most selective predicate"""
+    assert plan_driver(OrganizationFilter()) is None
+    assert plan_driver(OrganizationFilter(name="x", activity_id=1)) == "activity"
+    assert plan_driver(OrganizationFilter(activity_id=1, building_id=2)) == "building"
+    small_box = OrganizationFilter(
+        activity_id=1, latitude=55.75, longitude=37.61, radius=1
+    )
+    assert plan_driver(small_box) == "geo"
+    whole_world = OrganizationFilter(
+        activity_id=1,
+        min_latitude=-90,
+        max_latitude=90,
+        min_longitude=-180,
+        max_longitude=180,
+    )
+    assert plan_driver(whole_world) == "activity"
+
+
+def test_batched_radii_match_single_queries():
+    """Test that one sweep over many circles finds what separate lookups find"""
+    rng = random.Random(7)
+    points = [(i, rng.uniform(55, 56), rng.uniform(37, 38.5)) for i in range(1, 2001)]
+    index = GeoIndex(points)
+    circles = [
+        (rng.uniform(55, 56), rng.uniform(37, 38.5), rng.uniform(0.5, 20))
+        for _ in range(30)
+    ]
+
+    batched = index.in_radii(circles)
+    for circle, ids in zip(circles, batched):
+        assert sorted(ids) == sorted(index.in_radius(*circle))
+        assert all(
+            haversine_distance(circle[0], circle[1], lat, lon) <= circle[2]
+            for id_, lat, lon in points
+            if id_ in ids
+        )
+
+
+def test_point_in_polygon():
+    """Test ray casting on a concave polygon"""
+    # A "U": the notch between the arms is outside
+    shape = [(0, 0), (0, 3), (3, 3), (3, 2), (1, 2), (1, 1), (3, 1), (3, 0)]
+    assert point_in_polygon(0.5, 1.5, shape)
+    assert point_in_polygon(2, 0.5, shape)
+    assert not point_in_polygon(2, 1.5, shape)
+    assert not point_in_polygon(4, 1, shape)
@@ -0,0 +1,241 @@
+"""Tests for serving reads from an in-memory snapshot"""
+
+import pytest
+from sqlalchemy import create_engine, delete, insert, select
+
+from app import models, snapshot as snapshots
+from app.database import Base
+from app.snapshot import DatabaseSource, Snapshot, SnapshotRefresher
+
+
+@pytest.fixture
+def snapshot_mode(db_session, sample_organizations):
+    """Install a snapshot of the sample data for the duration of a test"""
+    snapshot = Snapshot.load(db_session.connection())
+    snapshots.install(snapshot)
+    yield snapshot
+    snapshots.install(None)
+
+
+def _normalized(data, ordered=False):
+    """Sort unordered result lists by id so both sources compare equal"""
+    if isinstance(data, list):
+        items = [_normalized(item) for item in data]
+        if not ordered and all(isinstance(item, dict) for item in items):
+            items.sort(key=lambda item: item["id"])
+        return items
+    if isinstance(data, dict):
+        return {k: _normalized(v, ordered=(k == "items")) for k, v in data.items()}
+    return data
+
+
+def _read_urls(buildings, activities):
+    return [
+        "/organizations/",
+        "/organizations/1",
+        "/organizations/9999",
+        f"/organizations/building/{buildings[0].id}",
+        "/organizations/building/9999",
+        f"/organizations/activity/{activities['food'].id}",
+        f"/organizations/activity/{activities['food'].id}?include_children=false",
+        "/organizations/activity/9999",
+        "/organizations/search/by-name?name=org%202",
+        "/organizations/search?activity_id=1&latitude=55.75&longitude=37.62"
+        "&radius=5&sort=distance",
+        "/organizations/search?name=Test&limit=2&offset=1",
+        "/buildings/",
+        "/buildings/?with_counts=true",
+        f"/buildings/{buildings[1].id}",
+        "/activities/",
+        "/activities/tree",
+        "/activities/tree?with_counts=true",
+        f"/activities/{activities['parts'].id}",
+        "/activities/9999",
+    ]
+
+
+def test_snapshot_matches_database(
+    client,
+    auth_headers,
+    db_session,
+    sample_organizations,
+    sample_buildings,
+    sample_activities,
+):
+    """Test that every read endpoint answers the same from the snapshot"""
+    urls = _read_urls(sample_buildings, sample_activities)
+    expected = [client.get(url, headers=auth_headers) for url in urls]
+
+    snapshots.install(Snapshot.load(db_session.connection()))
+    try:
+        actual = [client.get(url, headers=auth_headers) for url in urls]
+    finally:
+        snapshots.install(None)
+
+    for url, want, got in zip(urls, expected, actual):
+        assert got.status_code == want.status_code, url
+        assert _normalized(got.json()) == _normalized(want.json()), url
+
+
+@pytest.mark.parametrize(
+    "search_data",
+    [
+        {"latitude": 55.751244, "longitude": 37.618423, "radius": 1.0},
+        {
+            "latitude": 55.751244,
+            "longitude": 37.618423,
+            "min_latitude": 55.74,
+            "max_latitude": 55.76,
+            "min_longitude": 37.60,
+            "max_longitude": 37.64,
+        },
+        {
+            "latitude": 55.751244,
+            "longitude": 37.618423,
+            "polygon": [[55.745, 37.61], [55.745, 37.63], [55.76, 37.62]],
+        },
+        {"latitude": 55.751244, "longitude": 37.618423},
+    ],
+)
+def test_snapshot_location_search_matches_database(
+    client, auth_headers, db_session, sample_organizations, search_data
+):
+    """Test that location search answers the same from the snapshot"""
+    url = "/organizations/search/by-location"
+    expected = client.post(url, headers=auth_headers, json=search_data)
+
+    snapshots.install(Snapshot.load(db_session.connection()))
+    try:
+        actual = client.post(url, headers=auth_headers, json=search_data)
+    finally:
+        snapshots.install(None)
+
+    assert actual.status_code == expected.status_code
+    assert _normalized(actual.json()) == _normalized(expected.json())
+
+
+def test_snapshot_radius_batch_matches_database(
+    client, auth_headers, db_session, sample_organizations
+):
+    """Test that batched radius search answers the same from the snapshot"""
+    url = "/organizations/search/by-location/batch"
+    payload = {
+        "queries": [
+            {"latitude": 55.751244, "longitude": 37.618423, "radius": radius}
+            for radius in (0.1, 1, 1000)
+        ]
+    }
+    expected = client.post(url, headers=auth_headers, json=payload)
+
+    snapshots.install(Snapshot.load(db_session.connection()))
+    try:
+        actual = client.post(url, headers=auth_headers, json=payload)
+    finally:
+        snapshots.install(None)
+
+    assert actual.status_code == expected.status_code == 200
+    assert actual.json() == expected.json()
+
+
+def test_snapshot_mode_issues_no_queries(
+    client, auth_headers, test_engine, snapshot_mode
+):
+    """Test that reads in snapshot mode never touch the database"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", count)
+    try:
+        assert client.get("/organizations/", headers=auth_headers).status_code == 200
+        assert client.get("/activities/tree", headers=auth_headers).status_code == 200
+    finally:
+        event.remove(test_engine, "before_cursor_execute", count)
+    assert statements == []
+
+
+def test_snapshot_is_immutable_until_swapped(
+    client, auth_headers, db_session, snapshot_mode
+):
+    """Test that writes become visible only after a new snapshot is installed"""
+    db_session.add(models.Building(address="New", latitude=1.0, longitude=2.0))
+    db_session.commit()
+
+    assert len(client.get("/buildings/", headers=auth_headers).json()) == 3
+
+    snapshots.install(Snapshot.load(db_session.connection()))
+    assert len(client.get("/buildings/", headers=auth_headers).json()) == 4
+
+
+def test_refresher_reloads_on_version_change(test_engine, db_session, snapshot_mode):
+    """Test that the refresher swaps in a new snapshot after a write"""
+    refresher = SnapshotRefresher(DatabaseSource(test_engine), interval=0.01)
+    db_session.add(models.Building(address="New", latitude=1.0, longitude=2.0))
+    db_session.commit()
+
+    refresher.start()
+    try:
+        for _ in range(200):
+            if snapshots.get_snapshot() is not snapshot_mode:
+                break
+            refresher._stopped.wait(0.01)
+    finally:
+        refresher.stop()
+
+    current = snapshots.get_snapshot()
+    assert current is not snapshot_mode
+    assert current.version > snapshot_mode.version
+    assert len(current.buildings) == 4
+
+
+def test_orphan_rows_are_skipped():
+    """Test that rows referring to missing parents are left out of a snapshot"""
+    snapshot = Snapshot(
+        version=1,
+        buildings=[(1, "Address", 55.0, 37.0)],
+        activities=[(1, "Food", None, 1)],
+        organizations=[(1, "Kept", 1), (2, "No building", 9)],
+        phones=[(1, "123", 1), (2, "456", 7)],
+        links=[(1, 1), (1, 5), (7, 1)],
+    )
+
+    assert list(snapshot.organizations) == [1]
+    organization = snapshot.get_organization(1)
+    assert [phone["number"] for phone in organization["phone_numbers"]] == ["123"]
+    assert [activity["id"] for activity in organization["activities"]] == [1]
+
+
+def test_database_source_reads_one_snapshot(tmp_path, monkeypatch):
+    """Test that a load does not see writes committed while it runs"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'directory.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # Lets the writer below commit while the load holds its read snapshot
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+        connection.execute(
+            insert(models.Building),
+            [{"id": 1, "address": "Address", "latitude": 55.0, "longitude": 37.0}],
+        )
+        connection.execute(
+            insert(models.Organization), [{"id": 1, "name": "Org", "building_id": 1}]
+        )
+
+    load = Snapshot.load.__func__
+
+    def load_with_concurrent_delete(cls, connection):
+        # The first read pins the snapshot; then another connection deletes
+        connection.execute(select(models.Building.id)).all()
+        with engine.begin() as writer:
+            writer.execute(delete(models.Organization.__table__))
+            writer.execute(delete(models.Building.__table__))
+        return load(cls, connection)
+
+    monkeypatch.setattr(Snapshot, "load", classmethod(load_with_concurrent_delete))
+    snapshot = DatabaseSource(engine).load()
+
+    assert list(snapshot.buildings) == [1]
+    assert list(snapshot.organizations) == [1]
+    engine.dispose()
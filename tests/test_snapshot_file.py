@@ -0,0 +1,97 @@
+"""Tests for the memory-mapped snapshot file"""
+
+import os
+
+import pytest
+
+from app import models, snapshot as snapshots
+from app.search import OrganizationFilter
+from app.snapshot_file import (
+    FileSource,
+    MappedSnapshot,
+    SnapshotFileError,
+    export_snapshot,
+)
+
+
+@pytest.fixture
+def snapshot_pair(db_session, sample_organizations, tmp_path):
+    """An in-memory snapshot and the mapped file exported from the same data"""
+    path = str(tmp_path / "directory.snap")
+    in_memory = export_snapshot(db_session.connection(), path)
+    return in_memory, MappedSnapshot(path)
+
+
+def test_mapped_snapshot_matches_in_memory(snapshot_pair, sample_activities):
+    """Test that every read answers the same from the file and from memory"""
+    in_memory, mapped = snapshot_pair
+    assert mapped.version == in_memory.version
+
+    food = sample_activities["food"].id
+    calls = [
+        lambda s: s.list_organizations(),
+        lambda s: s.get_organization(1),
+        lambda s: s.get_organization(9999),
+        lambda s: s.organizations_by_building(1),
+        lambda s: s.organizations_by_activity(food, True),
+        lambda s: s.organizations_by_activity(food, False),
+        lambda s: s.search_by_name("ORG 2"),
+        lambda s: s.search_by_name(""),
+        lambda s: s.organizations_in_radius(55.75, 37.62, 5),
+        lambda s: s.organizations_in_rectangle(55.74, 55.76, 37.60, 37.64),
+        lambda s: s.search(OrganizationFilter(activity_id=food), "name", 10, 0),
+        lambda s: s.list_buildings(True),
+        lambda s: s.get_building(9999),
+        lambda s: s.list_activities(),
+        lambda s: s.activity_tree(True),
+        lambda s: s.get_activity(food),
+    ]
+    for call in calls:
+        assert call(mapped) == call(in_memory)
+
+
+def test_mapped_name_search_does_not_span_names(snapshot_pair):
+    """Test that a match must lie inside a single organization name"""
+    _, mapped = snapshot_pair
+    assert mapped.organization_ids_by_name("org 1\ntest") == []
+    assert mapped.organization_ids_by_name("test org") == [1, 2, 3]
+
+
+def test_mapped_snapshot_serves_requests(client, auth_headers, snapshot_pair):
+    """Test that the API answers from an installed mapped snapshot"""
+    _, mapped = snapshot_pair
+    snapshots.install(mapped)
+    try:
+        response = client.get("/organizations/1", headers=auth_headers)
+    finally:
+        snapshots.install(None)
+    assert response.status_code == 200
+    assert response.json()["name"] == "Test Org 1"
+    assert len(response.json()["phone_numbers"]) == 2
+
+
+def test_invalid_file_is_rejected(tmp_path):
+    """Test that files with a foreign header are refused"""
+    path = tmp_path / "bogus.snap"
+    path.write_bytes(b"not a snapshot file at all")
+    with pytest.raises(SnapshotFileError):
+        MappedSnapshot(str(path))
+
+
+def test_file_source_detects_replaced_file(db_session, sample_buildings, tmp_path):
+    """Test that re-exporting the file marks loaded snapshots stale"""
+    path = str(tmp_path / "directory.snap")
+    export_snapshot(db_session.connection(), path)
+    source = FileSource(path)
+    snapshot = source.load()
+    assert not source.is_stale(snapshot)
+
+    db_session.add(models.Building(address="New", latitude=1.0, longitude=2.0))
+    db_session.commit()
+    export_snapshot(db_session.connection(), path)
+
+    assert source.is_stale(snapshot)
+    reloaded = source.load()
+    assert len(list(reloaded.building_ids())) == 4
+    assert reloaded.version > snapshot.version
+    assert not os.path.exists(f"{path}.tmp")
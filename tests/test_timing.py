@@ -0,0 +1,74 @@
+"""Tests for per-request Server-Timing instrumentation"""
+
+import logging
+import re
+
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.main import create_app
+
+
+def _phases(response):
+    phases = {}
+    for entry in response.headers["server-timing"].split(","):
+        name, *params = entry.strip().split(";")
+        phases[name] = dict(param.split("=", 1) for param in params)
+    return phases
+
+
+def test_server_timing_header_has_all_phases(
+    client, auth_headers, sample_organizations
+):
+    """Test that a request reports auth, db, orm, serialize and total phases"""
+    organization_id = sample_organizations[0].id
+    response = client.get(f"/organizations/{organization_id}", headers=auth_headers)
+    assert response.status_code == 200
+
+    phases = _phases(response)
+    assert set(phases) == {"auth", "db", "orm", "serialize", "total"}
+    for values in phases.values():
+        assert float(values["dur"]) >= 0
+    queries = int(re.match(r'"(\d+) queries"', phases["db"]["desc"]).group(1))
+    assert queries >= 1
+    assert float(phases["total"]["dur"]) >= float(phases["db"]["dur"])
+
+
+def test_timing_is_logged_with_fields(
+    client, auth_headers, sample_organizations, caplog
+):
+    """Test that each request emits a structured timing record"""
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        client.get("/organizations/building/1", headers=auth_headers)
+
+    record = next(r for r in caplog.records if r.name == "app.timing")
+    assert record.route == "/organizations/building/{building_id}"
+    assert record.status_code == 200
+    assert record.queries >= 1
+    for field in ("auth_ms", "db_ms", "orm_ms", "serialize_ms", "total_ms"):
+        assert getattr(record, field) >= 0
+
+
+def test_batch_sub_requests_count_towards_parent(
+    client, auth_headers, sample_organizations
+):
+    """Test that queries run by batch sub-requests are attributed to the batch"""
+    payload = {
+        "requests": [
+            {"method": "GET", "path": "/buildings/1"},
+            {"method": "GET", "path": "/activities/1"},
+        ]
+    }
+    response = client.post("/batch", json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["server-timing"].count("total;") == 1
+    assert _phases(response)["db"]["desc"] != '"0 queries"'
+
+
+def test_server_timing_can_be_disabled():
+    """Test that the middleware is not installed when turned off"""
+    settings = Settings(
+        database_url="sqlite:///:memory:", api_key="key", server_timing=False
+    )
+    with TestClient(create_app(settings)) as client:
+        assert "server-timing" not in client.get("/").headers
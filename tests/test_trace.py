@@ -0,0 +1,159 @@
+"""Tests for traffic capture and replay"""
+
+import asyncio
+import hashlib
+import json
+import threading
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import Settings
+from app.database import Base, get_engine
+from app import trace
+from app.main import create_app
+from benchmarks.replay import load_trace, percentile, replay
+
+
+@pytest.fixture
+def tracing_client(tmp_path):
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'trace.db'}",
+        api_key="trace-key",
+        trace_sample_rate=1.0,
+        trace_path=str(tmp_path / "traces" / "requests.jsonl"),
+        trace_max_body_bytes=64,
+    )
+    engine = get_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine)
+    with TestClient(create_app(settings)) as client:
+        yield client, settings
+    engine.dispose()
+
+
+def read_trace(client, path):
+    client.app.state.trace_writer.flush()
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file]
+
+
+def test_capture_records_requests(tracing_client):
+    """Test that sampled requests are appended to the trace with their route"""
+    client, settings = tracing_client
+    client.get("/buildings/", params={"limit": 5}, headers={"X-API-Key": "trace-key"})
+    client.get("/buildings/42", headers={"X-API-Key": "trace-key"})
+
+    records = read_trace(client, settings.trace_path)
+    assert [(r["method"], r["path"], r["status"]) for r in records] == [
+        ("GET", "/buildings/", 200),
+        ("GET", "/buildings/42", 404),
+    ]
+    assert records[0]["query"] == "limit=5"
+    assert records[1]["route"] == "/buildings/{building_id}"
+    assert all(r["duration_ms"] >= 0 for r in records)
+
+
+def test_capture_never_records_api_keys(tracing_client):
+    """Test that headers, and so API keys, stay out of the trace"""
+    client, settings = tracing_client
+    client.post("/batch", json={"requests": []}, headers={"X-API-Key": "trace-key"})
+
+    records = read_trace(client, settings.trace_path)
+    with open(settings.trace_path) as trace_file:
+        assert "trace-key" not in trace_file.read()
+    assert records[0]["body"] == {"requests": []}
+
+
+def test_capture_replaces_large_bodies_with_a_digest(tracing_client):
+    """Test that bodies over the limit are kept only as length and SHA-256"""
+    client, settings = tracing_client
+    payload = {"requests": [{"path": "/buildings/", "params": {"q": "x" * 100}}]}
+    response = client.post("/batch", json=payload, headers={"X-API-Key": "trace-key"})
+    sent = response.request.content
+
+    record = read_trace(client, settings.trace_path)[0]
+    assert record["body"] is None
+    assert record["body_bytes"] == len(sent)
+    assert record["body_sha256"] == hashlib.sha256(sent).hexdigest()
+    with open(settings.trace_path) as trace_file:
+        assert "xxxx" not in trace_file.read()
+
+
+def test_capture_writes_outside_the_request(tracing_client, monkeypatch):
+    """Test that trace lines are written by the writer thread"""
+    client, settings = tracing_client
+    writers = []
+    write = trace.os.write
+
+    def recording_write(fd, data):
+        writers.append(threading.current_thread().name)
+        return write(fd, data)
+
+    monkeypatch.setattr(trace.os, "write", recording_write)
+    client.get("/buildings/", headers={"X-API-Key": "trace-key"})
+    client.app.state.trace_writer.flush()
+
+    assert writers == ["trace-writer"]
+
+
+def test_capture_disabled_by_default(tmp_path):
+    """Test that no trace is written unless a sample rate is set"""
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'trace.db'}",
+        api_key="trace-key",
+        trace_path=str(tmp_path / "requests.jsonl"),
+    )
+    with TestClient(create_app(settings)) as client:
+        client.get("/")
+    assert not (tmp_path / "requests.jsonl").exists()
+
+
+def test_load_trace_skips_foreign_lines():
+    """Test that lines that are not trace records are ignored"""
+    lines = [
+        '{"method": "GET", "path": "/"}',
+        "",
+        "not json",
+        '{"request_id": "x", "title": "backlog entry"}',
+        '{"method": "POST", "path": "/batch", "body": null, "body_sha256": "ab"}',
+    ]
+    assert list(load_trace(lines)) == [{"method": "GET", "path": "/"}]
+
+
+def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles on a small sample"""
+    values = [float(v) for v in range(1, 11)]
+    assert percentile(values, 0.5) == 5.0
+    assert percentile(values, 0.95) == 10.0
+    assert percentile([3.0], 0.99) == 3.0
+
+
+def test_replay_groups_by_route():
+    """Test that replay reports counts and errors per recorded route"""
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, str(request.url.path), request.url.query))
+        status = 500 if request.url.path == "/fail" else 200
+        return httpx.Response(status, json={})
+
+    records = [
+        {"method": "GET", "path": "/buildings/1", "route": "/buildings/{id}"},
+        {"method": "GET", "path": "/buildings/2", "route": "/buildings/{id}"},
+        {"method": "GET", "path": "/fail", "query": "a=1"},
+        {"method": "POST", "path": "/batch", "body": {"requests": []}},
+    ]
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), base_url="http://test"
+        ) as client:
+            return await replay(records, client, concurrency=2, rate=1000)
+
+    summary = asyncio.run(run()).summary()
+    assert summary["requests"] == 4
+    assert summary["errors"] == 1
+    assert summary["routes"]["GET /buildings/{id}"]["count"] == 2
+    assert summary["routes"]["GET /fail"]["errors"] == 1
+    assert ("GET", "/fail", b"a=1") in seen
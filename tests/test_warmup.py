@@ -0,0 +1,121 @@
+"""Tests for startup warmup, readiness and directory caches"""
+
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import cache, models, warmup
+from app.config import Settings
+from app.database import Base, get_engine
+from app.main import create_app
+from app.warmup import warm_pool
+
+
+def _wait_until_ready(client, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.02)
+    return response
+
+
+def test_ready_after_warmup(tmp_path):
+    """Test that /ready reports ready once connections and caches are warm"""
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'warm.db'}",
+        api_key="warm-key",
+        warmup_enabled=True,
+        warmup_connections=3,
+    )
+    engine = get_engine(settings.database_url)
+    Base.metadata.create_all(bind=engine)
+    cache.clear_all()
+    with TestClient(create_app(settings)) as client:
+        response = _wait_until_ready(client)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready"}
+    assert cache.geo_index.stats()["entries"] == 1
+    assert cache.activity_children.stats()["entries"] == 1
+    cache.clear_all()
+    engine.dispose()
+
+
+def test_not_ready_while_database_unavailable(tmp_path):
+    """Test that a failing warmup keeps the worker out of rotation"""
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'missing' / 'warm.db'}",
+        api_key="warm-key",
+        warmup_enabled=True,
+        warmup_retry_interval=0.01,
+    )
+    with TestClient(create_app(settings)) as client:
+        time.sleep(0.1)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert client.get("/").status_code == 200
+
+
+def test_ready_without_warmup(client):
+    """Test that a worker with warmup disabled is ready immediately"""
+    assert client.get("/ready").status_code == 200
+
+
+def test_warm_pool_keeps_connections_open(tmp_path):
+    """Test that warmed connections are returned to the pool, not closed"""
+    engine = get_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    assert warm_pool(engine, 3) == 3
+    assert engine.pool.checkedin() == 3
+    engine.dispose()
+
+
+def test_cached_activity_tree_sees_committed_changes(
+    client, auth_headers, db_session, sample_activities
+):
+    """Test that the cached tree is rebuilt after the directory version changes"""
+    first = client.get("/activities/tree", headers=auth_headers).json()
+    assert client.get("/activities/tree", headers=auth_headers).json() == first
+
+    db_session.add(
+        models.Activity(name="Bakery", parent_id=sample_activities["food"].id, level=2)
+    )
+    db_session.commit()
+
+    tree = client.get("/activities/tree", headers=auth_headers).json()
+    food = next(node for node in tree if node["name"] == "Food")
+    assert "Bakery" in [child["name"] for child in food["children"]]
+
+
+def test_rolled_back_changes_are_not_cached(db_session, sample_activities):
+    """Test that data read inside an uncommitted write is not kept"""
+    db_session.add(models.Activity(name="Draft", level=1))
+    db_session.flush()
+    assert any(node["name"] == "Draft" for node in cache.activity_tree(db_session))
+    db_session.rollback()
+    assert all(node["name"] != "Draft" for node in cache.activity_tree(db_session))
+
+
+def test_warmup_runs_the_endpoint_statement(
+    client, auth_headers, db_session, test_engine, sample_activities
+):
+    """Test that the warmed by-activity statement is the one the endpoint runs"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        warmup._organizations_by_activity(db_session)
+        warmed = statements[0]
+        statements.clear()
+        client.get(
+            f"/organizations/activity/{sample_activities['food'].id}",
+            headers=auth_headers,
+        )
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+
+    assert warmed in statements